@@ -0,0 +1,101 @@
+# Partial-arc resume for interrupted circles
+#
+# move_circle runs from the arm's position through pose1 and pose2, percent of a full
+# turn. When the arm is stopped part way round, arc_progress() tells from the TCP
+# position how much of that circle was already sealed, and remaining_arc() gives the
+# move_circle that seals only the rest: same circle, same direction, with the start,
+# pose1 and pose2 all turned forward by the part already done and the percent reduced
+# to match. Sealing the whole circle again would put twice the material on the pin.
+#
+# Angles run from the start point towards pose1, the direction the controller takes
+# (right-handed about start -> pose1 -> pose2, as in xarm_sim.circle_path).
+#
+# A full circle ends where it started, so an arm stopped there may not have begun it or
+# may have just finished it. line_progress() tells the second case apart when the next
+# approach is a straight line and the arm has already left along it, otherwise the time
+# it had been on the circle does (arc_length() and motion_time.trapezoid_time()).
+#
+#   done = arc_progress(position, leg.approach, leg.pose1, leg.pose2)   # percent, None if off the circle
+#   start, pose1, pose2, percent = remaining_arc(leg.approach, leg.pose1, leg.pose2, leg.percent, done)
+#   left = line_progress(position, arc_end(leg.approach, leg.pose1, leg.pose2, leg.percent), next_leg.approach)
+
+import math
+
+MIN_ARC = 1.0 # Percent of a turn below which an arc counts as not started, or as finished
+MIN_LINE = 1.0 # mm along the next approach that show the circle before it was finished
+
+
+def _sub(a, b):
+    return [a[i] - b[i] for i in range(3)]
+
+
+def _cross(a, b):
+    return [a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0]]
+
+
+def _dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+def circle_frame(start, pose1, pose2): # (center, radius, u, w, axis): start at angle 0, pose1 reached first going from u towards w
+    a, b = _sub(pose1, start), _sub(pose2, start)
+    normal = _cross(a, b)
+    nn = _dot(normal, normal)
+    if nn < 1e-12:
+        raise ValueError('circle through {}, {}, {}: the points are on one line'.format(start[:3], pose1[:3], pose2[:3]))
+    aa, bb = _dot(a, a), _dot(b, b)
+    offset = _cross([aa * b[i] - bb * a[i] for i in range(3)], normal)
+    center = [start[i] + offset[i] / (2 * nn) for i in range(3)]
+    radius = math.sqrt(_dot(_sub(start, center), _sub(start, center)))
+    axis = [v / math.sqrt(nn) for v in normal]
+    u = [v / radius for v in _sub(start, center)]
+    return center, radius, u, _cross(axis, u), axis
+
+
+def _angle(point, frame): # Angle of point round the circle, 0 to 2 pi
+    center, _, u, w, _ = frame
+    d = _sub(point, center)
+    return math.atan2(_dot(d, w), _dot(d, u)) % (2 * math.pi)
+
+
+def _point(frame, angle, orientation):
+    center, radius, u, w, _ = frame
+    return [center[i] + radius * (math.cos(angle) * u[i] + math.sin(angle) * w[i]) for i in range(3)] + list(orientation)
+
+
+def arc_progress(position, start, pose1, pose2, tolerance=2.0): # Percent of a turn done from start, None if position is not on the circle
+    frame = circle_frame(start, pose1, pose2)
+    center, radius, _, _, axis = frame
+    d = _sub(position, center)
+    height = _dot(d, axis)
+    across = math.sqrt(max(_dot(d, d) - height * height, 0.0))
+    if math.hypot(across - radius, height) > tolerance: # Stopped on the approach, or somewhere else entirely
+        return None
+    return _angle(position, frame) / (2 * math.pi) * 100
+
+
+def remaining_arc(start, pose1, pose2, percent, done): # (start, pose1, pose2, percent) of the arc left after done percent
+    frame = circle_frame(start, pose1, pose2)
+    turn = 2 * math.pi * done / 100
+    return (_point(frame, turn, start[3:6]), _point(frame, _angle(pose1, frame) + turn, pose1[3:6]),
+            _point(frame, _angle(pose2, frame) + turn, pose2[3:6]), percent - done)
+
+
+def arc_length(start, pose1, pose2, percent): # Length of a move_circle of percent, in mm
+    return 2 * math.pi * circle_frame(start, pose1, pose2)[1] * percent / 100
+
+
+def arc_end(start, pose1, pose2, percent): # Where a move_circle of percent ends
+    return _point(circle_frame(start, pose1, pose2), 2 * math.pi * percent / 100, start[3:6])
+
+
+def line_progress(position, start, end, tolerance=2.0): # mm travelled from start towards end, None if position is not on that line
+    line = _sub(end, start)
+    length = math.sqrt(_dot(line, line))
+    if length < 1e-9:
+        return None
+    d = _sub(position, start)
+    along = _dot(d, line) / length
+    if not -tolerance <= along <= length + tolerance or math.sqrt(max(_dot(d, d) - along * along, 0.0)) > tolerance:
+        return None
+    return along
@@ -0,0 +1,227 @@
+# asyncio control loop for the sealing cell
+#
+# AsyncCinchSeal runs every SDK call on a small thread pool and hands back awaitables,
+# so one event loop thread can drive motion, LED signalling, sensor monitoring and
+# telemetry at the same time instead of serializing them behind time.sleep() and
+# wait=True. Input edges come from the same GpioEventBus as everywhere else; its sampler
+# thread hands each edge to the event loop, so waiting on an input costs no thread and
+# no polling.
+#
+#   python async_cinchseal.py [recipe.json]
+#
+#   seal = await AsyncCinchSeal.connect(ip, recipe_path)
+#   await seal.wait_for(0, 1)                     # start button
+#   blinker = seal.blink(8, 0.5, 0.5)             # runs until cancelled
+#   await seal.move_to(pose); await seal.circle(pose1, pose2)
+#   await seal.wait_motion()
+#   blinker.cancel()
+
+import os
+import sys
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from cgpio import GpioEventBus, read_inputs
+from motion import MotionPipeline
+from recipe import load_plan
+
+ip = "192.168.1.213" # Change this to the IP address of the robot
+
+
+class AsyncCinchSeal:
+    def __init__(self, arm, recipe_path, workers=4):
+        self.arm = arm
+        self.recipe_path = recipe_path
+        self.plan = load_plan(recipe_path)
+        self.motion = MotionPipeline(arm) # Its throttle/flush block, they run on the pool like any other call
+        self.gpio = GpioEventBus(arm)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='xarm') # Motion waits hold one worker, IO gets the rest
+        self._loop = None
+        self._edge_waiters = {} # io -> futures resolved with the edge on the next published edge of that input
+        self._outputs = {} # io -> last value written, so repeated writes are skipped
+
+    @classmethod
+    async def connect(cls, ip, recipe_path, workers=4):
+        def create():
+            from xarm.wrapper import XArmAPI
+            arm = XArmAPI(ip)
+            arm.motion_enable(enable=True)
+            arm.set_mode(0)
+            arm.set_state(state=0)
+            return arm
+        arm = await asyncio.get_running_loop().run_in_executor(None, create)
+        return await cls(arm, recipe_path, workers).start()
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self.gpio.subscribe(self._on_edge)
+        self.gpio.start()
+        await self.call(self.gpio.snapshot) # First sample in, value() never blocks the loop from here on
+        return self
+
+    def close(self):
+        self.gpio.stop()
+        self._executor.shutdown(wait=False)
+
+    async def call(self, fn, *args, **kwargs): # Run any blocking SDK call on the pool
+        return await self._loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    # Inputs
+
+    def _on_edge(self, io, edge, timestamp): # Sampler thread
+        self._loop.call_soon_threadsafe(self._wake, io, edge)
+
+    def _wake(self, io, edge): # Event loop thread
+        for future in self._edge_waiters.pop(io, ()):
+            if not future.done():
+                future.set_result(edge)
+
+    async def next_edge(self, io): # The next published edge of io, FALLING or RISING
+        future = self._loop.create_future()
+        self._edge_waiters.setdefault(io, []).append(future)
+        return await future
+
+    def value(self, io): # Debounced input state, no round trip
+        return self.gpio.value(io)
+
+    async def read_inputs(self): # One fresh get_cgpio_state() round trip, when the debounced state is not enough
+        return await self.call(read_inputs, self.arm)
+
+    async def wait_for(self, io, value, timeout=None): # True once io reads value, False on timeout
+        async def wait():
+            while self.gpio.value(io) != value: # Checked and registered in one step, an edge in between still wakes us
+                await self.next_edge(io)
+        try:
+            await asyncio.wait_for(wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def wait_for_edge(self, io, edge, timeout=None):
+        async def wait():
+            while await self.next_edge(io) != edge:
+                pass
+        try:
+            await asyncio.wait_for(wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    # Outputs
+
+    async def set_output(self, io, value):
+        if self._outputs.get(io) == value:
+            return 0
+        code = await self.call(self.arm.set_cgpio_digital, io, value, delay_sec=0)
+        if code == 0:
+            self._outputs[io] = value
+        return code
+
+    def blink(self, io, *pattern): # Task that cycles io through on/off durations until cancelled, e.g. blink(8, 0.5, 0.1, 0.5, 0.1)
+        async def run():
+            try:
+                while True:
+                    for i, duration in enumerate(pattern):
+                        await self.set_output(io, 1 - i % 2)
+                        await asyncio.sleep(duration)
+            finally:
+                self._outputs.pop(io, None) # Whoever drives io next writes it for sure
+        return asyncio.ensure_future(run())
+
+    # Motion
+
+    async def move_to(self, pose, speed=None, mvacc=None, radius=None): # Queued, await wait_motion() to know it finished
+        return await self.call(self.motion.approach, pose, speed=speed, mvacc=mvacc, radius=radius)
+
+    async def circle(self, pose1, pose2, percent=100, speed=None, mvacc=None):
+        return await self.call(self.motion.circle, pose1, pose2, percent=percent, speed=speed, mvacc=mvacc)
+
+    async def move_joints(self, angles, speed=None, mvacc=None):
+        return await self.call(self.motion.approach_joints, angles, speed=speed, mvacc=mvacc, radius=0) # Counted by the pipeline on the pool thread
+
+    async def wait_motion(self, timeout=None): # Every queued move finished and the arm at rest, False if they were dropped or on timeout
+        return await self.call(self.motion.flush, timeout)
+
+    async def settle(self): # wait_motion() for the sealing sequence, where a dropped move is an error
+        if not await self.wait_motion():
+            raise RuntimeError('controller dropped the queued moves: state={}, error={}'.format(self.arm.state, self.arm.error_code))
+
+    # Telemetry
+
+    async def telemetry(self, sink, interval=1.0): # Report-fed state every interval seconds, no round trips
+        while True:
+            sink({'state': self.arm.state, 'cmd_num': self.arm.cmd_num, 'position': self.arm.position,
+                  'error_code': self.arm.error_code, 'inputs': self.gpio.snapshot().mask})
+            await asyncio.sleep(interval)
+
+    # The sealing sequence
+
+    def load_recipe(self): # Reload the recipe so a changeover only needs a new file, cached plans load without recompiling
+        self.plan = load_plan(self.recipe_path)
+        self.motion.configure(self.plan.motion)
+
+    async def initialize(self): # Turn off the LED and move to the starting position
+        self.load_recipe()
+        await self.set_output(self.plan.gates['led'], 0)
+        await self.move_to(self.plan.home, speed=self.plan.motion['speed'])
+        await self.settle()
+
+    async def check_potting(self): # Sensor off: stop after the queued moves and blink until it is back
+        sensor, led = self.plan.gates['sensor'], self.plan.gates['led']
+        if self.value(sensor) == 1:
+            return
+        await self.settle()
+        blinker = self.blink(led, 0.5, 0.5)
+        try:
+            await self.wait_for(sensor, 1)
+        finally:
+            blinker.cancel()
+        await self.set_output(led, 1)
+
+    async def back_to_zero(self): # Blink until reset is pressed, then the reset move
+        reset, led = self.plan.gates['reset'], self.plan.gates['led']
+        await self.settle()
+        blinker = self.blink(led, 0.5, 0.1, 0.5, 0.1)
+        try:
+            await self.wait_for(reset, 1)
+        finally:
+            blinker.cancel()
+        await self.set_output(led, 0)
+        await self.move_joints(self.plan.reset_angles, speed=self.plan.motion['reset_speed'], mvacc=self.plan.motion['reset_acc'])
+        await self.settle()
+
+    async def run_cycle(self): # One part: start press, seal every point, reset
+        gates = self.plan.gates
+        await self.wait_for(gates['start'], 1)
+        self.load_recipe() # Pick up a changed recipe file between parts
+        await self.set_output(gates['led'], 1)
+        for leg in self.plan.legs:
+            await self.check_potting()
+            if self.value(gates['reset']) == 1: # Reset pressed mid-sequence
+                break
+            await self.move_to(leg.approach, speed=leg.speed, mvacc=leg.mvacc)
+            await self.circle(leg.pose1, leg.pose2, percent=leg.percent, speed=leg.circle_speed, mvacc=leg.circle_acc)
+        await self.back_to_zero()
+
+    async def run(self, cycles=1, telemetry=None, telemetry_interval=1.0):
+        reporter = asyncio.ensure_future(self.telemetry(telemetry, telemetry_interval)) if telemetry else None
+        try:
+            await self.initialize()
+            for _ in range(cycles):
+                await self.run_cycle()
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+
+
+async def main(recipe_path):
+    seal = await AsyncCinchSeal.connect(ip, recipe_path)
+    try:
+        await seal.run(telemetry=print, telemetry_interval=5.0)
+    finally:
+        seal.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "recipes", "cinchseal_16pin.json")))
@@ -0,0 +1,315 @@
+# Cycle-time benchmark for the three ways of running the 16-pin job
+#
+# Runs cinchseal_new.main(), old_scripts/cinchseal.CinchSeal.run() and
+# old_scripts/reference_script.RobotMain.run() against xarm_sim.SimArm, with the same
+# operator script for each: start is pressed as the run begins, the potting sensor is on
+# (or drops out for a while in the 'dropout' scenario) and reset is pressed once the 16th
+# circle is done. Each run reports:
+#   cycle_time   simulated seconds from run start until the job is back at rest
+#   sleep_time   simulated seconds the code spent in time.sleep()
+#   rpcs         controller round trips by method
+#   sensor_wait  time the arm stood still while the potting sensor was off
+#   idle_time    time the arm stood still for any reason
+#
+#   python benchmark.py -o results.json
+#   python benchmark.py --baseline results.json --threshold 0.05   # exit 1 on a >5% cycle time regression
+#   python benchmark.py --input-latency 50     # edge-to-stop latency of the input monitor instead
+#   python benchmark.py --input-latency 50 --input-source poll   # with the bus polling, as when reports are off
+#
+# The implementations import xarm and call time.* directly, so each run gets a fake xarm
+# package in sys.modules that hands out the simulated arm, and the SimClock swapped in for
+# the time module of every module involved.
+
+import os
+import sys
+import json
+import types
+import random
+import argparse
+import tempfile
+import importlib
+import threading
+import contextlib
+
+import cgpio
+import runlog
+import xarm_sim
+import input_monitor
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+RECIPE = os.path.join(ROOT, 'recipes', 'cinchseal_16pin.json')
+
+START, SENSOR, RESET = 0, 1, 2
+HOME, HOME_ANGLES = xarm_sim.CELL_HOME, xarm_sim.CELL_HOME_ANGLES
+CIRCLES = 16
+
+SCENARIOS = {
+    'nominal': None,
+    'dropout': (5, 3.0), # The sensor goes off after the 5th circle and comes back 3 s later
+}
+
+
+def _install_xarm(arm): # Fake xarm package: XArmAPI() hands out the simulated arm
+    package = types.ModuleType('xarm')
+    package.__path__ = []
+    wrapper = types.ModuleType('xarm.wrapper')
+    wrapper.XArmAPI = lambda *args, **kwargs: arm
+    version = types.ModuleType('xarm.version')
+    version.__version__ = 'sim'
+    package.wrapper, package.version = wrapper, version
+    saved = {name: sys.modules.get(name) for name in ('xarm', 'xarm.wrapper', 'xarm.version')}
+    sys.modules.update({'xarm': package, 'xarm.wrapper': wrapper, 'xarm.version': version})
+    return saved
+
+
+def _restore(saved):
+    for name, module in saved.items():
+        if module is None:
+            sys.modules.pop(name, None)
+        else:
+            sys.modules[name] = module
+
+
+def _fresh_import(name, clock, shared=('cgpio', 'motion', 'station', 'input_monitor')): # Import name again with clock as its time module
+    for module_name in shared:
+        importlib.import_module(module_name).time = clock
+    sys.modules.pop(name, None)
+    module = importlib.import_module(name)
+    module.time = clock
+    return module
+
+
+def _run_cinchseal_new(arm, clock):
+    argv, journal = sys.argv, tempfile.mkstemp(suffix='.journal')
+    os.close(journal[0])
+    sys.argv = [argv[0], RECIPE]
+    os.environ['CINCHSEAL_JOURNAL'] = journal[1] # Journal every seal point as on the line, starting empty so nothing is resumed
+    try:
+        module = _fresh_import('cinchseal_new', clock)
+    finally:
+        sys.argv = argv
+        del os.environ['CINCHSEAL_JOURNAL']
+    arm.press(START, hold=0.5, moves=1) # After the home move: a recipe seen for the first time is compiled and checked before it
+    try:
+        module.main()
+    finally:
+        module.gpio.stop()
+        module.station.journal.close()
+        os.remove(journal[1])
+
+
+def _run_cinchseal(arm, clock):
+    module = _fresh_import('cinchseal', clock)
+    seal = module.CinchSeal(module.ip)
+    arm.press(START, hold=0.5, after=0)
+    seal.run()
+
+
+def _run_reference(arm, clock):
+    module = _fresh_import('reference_script', clock)
+    robot = module.RobotMain(arm)
+    def finished(): # run() loops forever, end it once the return move is done
+        if arm.completed['joint'] and arm.state == 2:
+            robot.alive = False
+        else:
+            arm.schedule(finished, after=0.1)
+    arm.schedule(finished, after=0.1)
+    arm.press(START, hold=0.5, after=0)
+    robot.run()
+
+
+IMPLEMENTATIONS = {
+    'cinchseal_new': _run_cinchseal_new,
+    'cinchseal': _run_cinchseal,
+    'reference_script': _run_reference,
+}
+
+
+def _script_operator(arm, scenario):
+    arm.press(RESET, hold=1.5, circles=CIRCLES) # Held long enough for the blink loops to see it
+    if SCENARIOS[scenario] is not None:
+        after_circles, duration = SCENARIOS[scenario]
+        def drop():
+            arm.set_input(SENSOR, 0)
+            arm.schedule(lambda: arm.set_input(SENSOR, 1), after=duration)
+        arm.schedule(drop, circles=after_circles)
+
+
+def _watch(arm, clock, done, stats, interval=0.02): # Integrate idle and sensor-wait time while the run is going
+    last = clock.monotonic()
+    while not done.wait(clock.real(interval)):
+        now = clock.monotonic()
+        if arm.state in (2, 4): # At rest, or held in the stop state by an input monitor
+            stats['idle_time'] += now - last
+            if not arm.input(SENSOR):
+                stats['sensor_wait'] += now - last
+        last = now
+
+
+def run_one(name, scenario='nominal', time_scale=20, latency=0.002, jitter=0.001, limit=900, seed=0):
+    clock = xarm_sim.SimClock(time_scale)
+    arm = xarm_sim.SimArm('sim', latency=latency, jitter=jitter, clock=clock, position=HOME, angles=HOME_ANGLES,
+                          inputs=1 << SENSOR, seed=seed)
+    _script_operator(arm, scenario)
+    saved = _install_xarm(arm)
+    stats = {'idle_time': 0.0, 'sensor_wait': 0.0}
+    errors = []
+    done = threading.Event()
+    def target():
+        try:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                IMPLEMENTATIONS[name](arm, clock)
+        except Exception as e:
+            errors.append(repr(e))
+        done.set()
+    watcher = threading.Thread(target=_watch, args=(arm, clock, done, stats), daemon=True)
+    runner = threading.Thread(target=target, daemon=True)
+    start = clock.monotonic()
+    watcher.start()
+    runner.start()
+    finished = done.wait(clock.real(limit))
+    cycle_time = clock.monotonic() - start
+    done.set()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        arm.disconnect() # Scripts that returned early still hold callbacks that print
+    _restore(saved)
+    return {
+        'cycle_time': round(cycle_time, 3),
+        'sleep_time': round(clock.slept, 3),
+        'sleep_calls': clock.sleeps,
+        'sensor_wait': round(stats['sensor_wait'], 3),
+        'idle_time': round(stats['idle_time'], 3),
+        'rpc_total': sum(arm.rpc_counts.values()),
+        'rpcs': dict(sorted(arm.rpc_counts.items())),
+        'completed': dict(arm.completed),
+        'finished': finished and not errors,
+        'error': errors[0] if errors else ('timed out after {}s'.format(limit) if not finished else None),
+    }
+
+
+def run_latency(trials=50, time_scale=1, latency=0.002, jitter=0.001, poll_interval=0.01, source='report', report_interval=0.1, seed=0):
+    # Edge-to-stop latency of input_monitor.InputMonitor fed by a GpioEventBus, as in Station:
+    # the arm is on a long move when reset (even trials) or the potting sensor (odd trials)
+    # flips at a random moment, the latency runs from the flip to the stop command done, in
+    # simulated seconds. time_scale 1 keeps thread wake-ups from being stretched by the clock.
+    clock = xarm_sim.SimClock(time_scale)
+    arm = xarm_sim.SimArm('sim', latency=latency, jitter=jitter, clock=clock, position=HOME, angles=HOME_ANGLES,
+                          inputs=1 << SENSOR, report_interval=report_interval, seed=seed)
+    saved_time, input_monitor.time, cgpio.time = input_monitor.time, clock, clock
+    gpio = cgpio.GpioEventBus(arm, poll_interval=poll_interval, source=source).start()
+    monitor = input_monitor.InputMonitor(arm, {RESET: 1, SENSOR: 0}, gpio=gpio).start()
+    rng = random.Random(seed)
+    samples, moving = [], 0
+    try:
+        for trial in range(trials):
+            io, value = (RESET, 1) if trial % 2 == 0 else (SENSOR, 0)
+            arm.set_state(0)
+            pose = list(HOME)
+            pose[0] += 300 if trial % 2 == 0 else 0 # Back and forth, 300 mm at 50 mm/s
+            arm.set_position(*pose, speed=50, mvacc=2000, is_radian=False, wait=False)
+            monitor.watch()
+            edge = {}
+            def flip(io=io, value=value, edge=edge):
+                edge['at'], edge['moving'] = clock.monotonic(), arm.state == 1
+                arm.set_input(io, value)
+            arm.schedule(flip, after=rng.uniform(0.05, 0.5))
+            while monitor.tripped is None:
+                clock.wait(0.001)
+            samples.append(monitor.tripped.stopped - edge['at'])
+            moving += edge['moving']
+            gpio.wait_for(io, value) # Seen through the debounce, then back, so the next trial starts on fresh samples
+            arm.set_input(io, 1 - value)
+            gpio.wait_for(io, 1 - value)
+    finally:
+        monitor.stop()
+        gpio.stop()
+        input_monitor.time = cgpio.time = saved_time
+        arm.disconnect()
+    samples.sort()
+    ms = lambda seconds: round(seconds * 1000, 2)
+    return {
+        'trials': trials,
+        'moving': moving, # Trials where the arm was still moving at the flip
+        'source': gpio.mode, # Where the samples came from: the report stream, or the bus's poll
+        'interval_ms': ms(report_interval if gpio.mode == 'report' else poll_interval),
+        'min_ms': ms(samples[0]),
+        'median_ms': ms(samples[len(samples) // 2]),
+        'p95_ms': ms(samples[min(int(len(samples) * 0.95), len(samples) - 1)]),
+        'max_ms': ms(samples[-1]),
+    }
+
+
+def run_all(names, scenarios, **kwargs):
+    results = {}
+    for name in names:
+        for scenario in scenarios:
+            results['{}/{}'.format(name, scenario)] = run_one(name, scenario, **kwargs)
+    return results
+
+
+def regressions(results, baseline, threshold): # Runs whose cycle time grew by more than threshold (a fraction)
+    found = []
+    for key, result in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        if not result['finished']:
+            found.append('{}: did not finish ({})'.format(key, result['error']))
+        elif result['cycle_time'] > before['cycle_time'] * (1 + threshold):
+            found.append('{}: cycle time {:.2f}s, baseline {:.2f}s (+{:.1%})'.format(
+                key, result['cycle_time'], before['cycle_time'], result['cycle_time'] / before['cycle_time'] - 1))
+    return found
+
+
+def print_table(results):
+    print('{:<28} {:>9} {:>9} {:>9} {:>9} {:>7}'.format('run', 'cycle s', 'sleep s', 'sensor s', 'idle s', 'rpcs'))
+    for key, r in results.items():
+        print('{:<28} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f} {:>7}{}'.format(
+            key, r['cycle_time'], r['sleep_time'], r['sensor_wait'], r['idle_time'], r['rpc_total'],
+            '' if r['finished'] else '  FAILED: {}'.format(r['error'])))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cycle-time benchmark against the simulated arm')
+    parser.add_argument('--impl', action='append', choices=sorted(IMPLEMENTATIONS), help='implementation to run, repeatable (default: all)')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='operator scenario, repeatable (default: all)')
+    parser.add_argument('--time-scale', type=float, default=20, help='simulated seconds per wall clock second')
+    parser.add_argument('--latency', type=float, default=0.002, help='controller round trip, in seconds')
+    parser.add_argument('--jitter', type=float, default=0.001, help='extra random round trip, in seconds')
+    parser.add_argument('-o', '--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.05, help='allowed cycle time growth over the baseline, as a fraction')
+    parser.add_argument('--input-latency', type=int, metavar='TRIALS', help='measure the input monitor edge-to-stop latency instead of cycle times')
+    parser.add_argument('--input-source', choices=('report', 'poll'), default='report', help='with --input-latency, feed the bus from the report stream or its own poll')
+    parser.add_argument('--report-interval', type=float, default=0.1, help='with --input-latency, seconds between simulated reports')
+    parser.add_argument('--max-latency', type=float, default=0.15, help='with --input-latency, exit 1 when the worst stop takes longer, in seconds')
+    args = parser.parse_args(argv)
+
+    runlog.configure(stream=None) # Run logs are formatted and dropped, stdout is for the results
+    if args.input_latency:
+        result = run_latency(args.input_latency, latency=args.latency, jitter=args.jitter, source=args.input_source, report_interval=args.report_interval)
+        print('edge to stop over {trials} trials ({moving} mid-move, {source} every {interval_ms} ms): min {min_ms} ms, median {median_ms} ms, '
+              'p95 {p95_ms} ms, max {max_ms} ms'.format(**result))
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump({'latency': args.latency, 'jitter': args.jitter, 'input_latency': result}, f, indent=2)
+        return 1 if result['max_ms'] > args.max_latency * 1000 else 0
+    sys.path.insert(0, os.path.join(ROOT, 'old_scripts'))
+    results = run_all(args.impl or list(IMPLEMENTATIONS), args.scenario or list(SCENARIOS),
+                      time_scale=args.time_scale, latency=args.latency, jitter=args.jitter)
+    print_table(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'time_scale': args.time_scale, 'latency': args.latency, 'jitter': args.jitter, 'results': results}, f, indent=2)
+    failed = [key for key, r in results.items() if not r['finished']]
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f)['results'], args.threshold)
+        for line in found:
+            print('REGRESSION ' + line)
+        return 1 if found or failed else 0
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
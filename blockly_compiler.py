@@ -0,0 +1,394 @@
+# Blockly to Python compiler for the xArm
+#
+# Reads a uFactory Studio Blockly project (the XML Studio exports, or Blockly's JSON
+# serialization) and writes a small Python program made of a step table and a table of
+# procedures, run by the shared executor in blockly_runtime.py. Compared with the
+# unrolled code Studio generates (see old_scripts/reference_script.py) there is no
+# "if not self._check_code(...)" after every call, constant expressions such as
+# float(360) / 360 * 100 are folded, and code that can never run (blocks after a
+# break, branches on constant conditions, procedures nothing calls) is dropped.
+#
+# Usage: python blockly_compiler.py project.xml -o program.py [--ip 192.168.1.213]
+
+import re
+import sys
+import json
+import argparse
+import itertools
+from collections import namedtuple
+
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+from blockly_runtime import OPS
+
+Block = namedtuple('Block', ['type', 'id', 'fields', 'values', 'statements', 'next', 'disabled', 'mutation'])
+
+COMPARE_OPS = {'EQ': '==', 'NEQ': '!=', 'LT': '<', 'LTE': '<=', 'GT': '>', 'GTE': '>='}
+ARITH_OPS = {'ADD': '+', 'MINUS': '-', 'MULTIPLY': '*', 'DIVIDE': '/', 'POWER': '**'}
+SPEED_PARAMS = {'set_speed': 'tcp_speed', 'set_acceleration': 'tcp_acc', 'set_angle_speed': 'angle_speed', 'set_angle_acceleration': 'angle_acc'}
+
+
+class BlocklyError(ValueError):
+    pass
+
+
+def _xml_block(node, ns):
+    fields, values, statements, nxt, mutation = [], [], [], None, {}
+    for child in node:
+        tag = child.tag[len(ns):]
+        if tag == 'field':
+            fields.append((child.attrib.get('name'), child.text))
+        elif tag in ('value', 'statement'):
+            inner = child.find(ns + 'block')
+            if inner is None:
+                inner = child.find(ns + 'shadow')
+            (values if tag == 'value' else statements).append((child.attrib.get('name'), None if inner is None else _xml_block(inner, ns)))
+        elif tag == 'next':
+            inner = child.find(ns + 'block')
+            nxt = None if inner is None else _xml_block(inner, ns)
+        elif tag == 'mutation':
+            mutation = dict(child.attrib, args=[arg.attrib.get('name') for arg in child.findall(ns + 'arg')])
+    return Block(node.attrib['type'], node.attrib.get('id'), fields, values, statements, nxt,
+                 node.attrib.get('disabled') in ('true', 'TRUE'), mutation)
+
+
+def parse_xml(text):
+    root = ET.fromstring(text)
+    match = re.match('({.+})', root.tag)
+    ns = match.group(1) if match else ''
+    return [_xml_block(node, ns) for node in root.findall(ns + 'block')]
+
+
+def _is_statement_input(name): # Blockly JSON does not say which inputs are statements, these are the Studio names
+    return name in ('STACK', 'ELSE', 'DO') or re.match('^DO[0-9]+$', name) is not None
+
+
+def _json_block(data):
+    values, statements = [], []
+    for name, slot in data.get('inputs', {}).items():
+        inner = slot.get('block') or slot.get('shadow')
+        (statements if _is_statement_input(name) else values).append((name, None if inner is None else _json_block(inner)))
+    nxt = data.get('next', {}).get('block')
+    extra = data.get('extraState') or {}
+    mutation = {'name': extra.get('name'), 'args': [p.get('name') for p in extra.get('params', [])]} if isinstance(extra, dict) else {}
+    fields = [(name, value if isinstance(value, str) else json.dumps(value)) for name, value in data.get('fields', {}).items()]
+    return Block(data['type'], data.get('id'), fields, values, statements, None if nxt is None else _json_block(nxt),
+                 data.get('enabled') is False or data.get('disabled') is True, mutation)
+
+
+def parse_json(text):
+    data = json.loads(text)
+    return [_json_block(block) for block in data.get('blocks', {}).get('blocks', [])]
+
+
+def parse_project(text):
+    return parse_json(text) if text.lstrip().startswith('{') else parse_xml(text)
+
+
+def _number(text):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def _field(block, name=None, index=0):
+    for field_name, text in block.fields:
+        if name is None or field_name == name:
+            if index == 0:
+                return text
+            index -= 1
+    raise BlocklyError('block {} ({}) has no field {}'.format(block.type, block.id, name or index))
+
+
+def _fold(expr): # Replace an expression with its value when every operand is a constant
+    kind = expr[0]
+    if kind == 'not' and expr[1][0] == 'const':
+        return ('const', not expr[1][1])
+    if kind in ('and', 'or') and expr[1][0] == 'const':
+        if bool(expr[1][1]) == (kind == 'or'):
+            return expr[1]
+        return expr[2]
+    if kind in ('cmp', 'arith') and expr[2][0] == 'const' and expr[3][0] == 'const':
+        try:
+            return ('const', OPS[expr[1]](expr[2][1], expr[3][1]))
+        except ArithmeticError:
+            return expr # Leave it to fail at run time, like the Studio code would
+    return expr
+
+
+class BlocklyCompiler:
+    def __init__(self, loop_interval=0.01):
+        self.loop_interval = loop_interval # Same loop pacing as Studio's generated code, in seconds
+        self.dropped = 0 # Blocks removed as unreachable
+        self._loop_ids = itertools.count(1)
+
+    def compile(self, blocks):
+        definitions, main = {}, []
+        for block in blocks:
+            if block.disabled:
+                continue
+            if block.type == 'procedures_defnoreturn':
+                if block.mutation.get('args'):
+                    raise BlocklyError('procedure {!r} takes arguments, which this compiler does not support'.format(_field(block)))
+                definitions[_field(block) or '1'] = block
+            else:
+                self._chain(block, main, None)
+        procedures = {}
+        pending = self._calls(main)
+        while pending: # Only compile procedures something actually calls
+            name = pending.pop()
+            if name in procedures:
+                continue
+            if name not in definitions:
+                raise BlocklyError('call to undefined procedure {!r}'.format(name))
+            steps = []
+            body = dict(definitions[name].statements).get('STACK')
+            if body is not None:
+                self._chain(body, steps, None)
+            procedures[name] = self._finish(steps)
+            pending.extend(self._calls(steps))
+        self.dropped += len(set(definitions) - set(procedures))
+        return self._finish(main), procedures
+
+    @staticmethod
+    def _calls(steps):
+        return [step[1] for step in steps if step[0] == 'call']
+
+    @staticmethod
+    def _finish(steps):
+        return tuple(tuple(step) for step in steps)
+
+    def _chain(self, block, out, loop): # Compile a statement chain, returns True when nothing after it can run
+        while block is not None:
+            if not block.disabled:
+                handler = getattr(self, '_stmt_' + block.type, None)
+                if handler is None:
+                    raise BlocklyError('block {} ({}) is not supported'.format(block.type, block.id))
+                if handler(block, out, loop):
+                    rest = block.next
+                    while rest is not None: # Everything after a break or an endless loop is dead code
+                        self.dropped += 1
+                        rest = rest.next
+                    return True
+            block = block.next
+        return False
+
+    def _expr(self, block):
+        if block is None:
+            raise BlocklyError('missing input value')
+        kind = block.type
+        if kind == 'math_number':
+            return ('const', _number(_field(block)))
+        if kind == 'logic_boolean':
+            return ('const', _field(block) == 'TRUE')
+        if kind in ('gpio_get_controller_digital', 'gpio_get_controller_digital_di'):
+            return ('cgpio', int(_field(block)))
+        if kind == 'variables_get':
+            return ('var', _field(block))
+        values = [self._expr(value) for name, value in block.values]
+        if kind == 'logic_negate':
+            return _fold(('not', values[0]))
+        if kind == 'logic_operation':
+            return _fold((_field(block).lower(), values[0], values[1]))
+        if kind == 'logic_compare':
+            return _fold(('cmp', COMPARE_OPS[_field(block)], values[0], values[1]))
+        if kind == 'math_arithmetic':
+            return _fold(('arith', ARITH_OPS[_field(block)], values[0], values[1]))
+        raise BlocklyError('value block {} ({}) is not supported'.format(kind, block.id))
+
+    def _value(self, block, name=None, index=0):
+        slots = [value for value_name, value in block.values if name is None or value_name == name]
+        if len(slots) <= index:
+            raise BlocklyError('block {} ({}) has no input {}'.format(block.type, block.id, name or index))
+        return self._expr(slots[index])
+
+    def _pose(self, block, index):
+        inner = block.values[index][1]
+        return tuple(float(text) for name, text in inner.fields)
+
+    def _loop(self, out, cond, body, before_back_edge=()): # while cond: body
+        if cond[0] == 'const' and not cond[1]:
+            self.dropped += 1
+            return False
+        head = len(out)
+        if cond[0] != 'const':
+            out.append(['jump_if_not', cond, None])
+        loop = []
+        if body is not None:
+            self._chain(body, out, loop)
+        out.extend(before_back_edge)
+        out.append(('loop', head, self.loop_interval, next(self._loop_ids)))
+        end = len(out)
+        if cond[0] != 'const':
+            out[head][2] = end
+        for index in loop:
+            out[index][1] = end
+        return cond[0] == 'const' and not loop # An endless loop with no break never falls through
+
+    def _stmt_procedures_callnoreturn(self, block, out, loop):
+        out.append(('call', block.mutation.get('name') or '1'))
+
+    def _stmt_loop_run_forever(self, block, out, loop):
+        return self._loop(out, ('const', True), dict(block.statements).get('DO', block.statements[0][1] if block.statements else None))
+
+    def _stmt_controls_whileUntil(self, block, out, loop):
+        cond = self._value(block, 'BOOL')
+        if _field(block, 'MODE') == 'UNTIL':
+            cond = _fold(('not', cond))
+        return self._loop(out, cond, dict(block.statements).get('DO'))
+
+    def _stmt_controls_repeat_ext(self, block, out, loop):
+        counter = '__repeat_{}'.format(block.id)
+        out.append(('set_var', counter, ('const', 0)))
+        cond = _fold(('cmp', '<', ('var', counter), self._value(block, 'TIMES')))
+        return self._loop(out, cond, dict(block.statements).get('DO'), [('change_var', counter, ('const', 1))])
+
+    def _stmt_loop_break(self, block, out, loop):
+        if loop is None:
+            raise BlocklyError('break ({}) outside of a loop'.format(block.id))
+        loop.append(len(out))
+        out.append(['jump', None])
+        return True
+
+    def _stmt_controls_if(self, block, out, loop):
+        branches = dict(block.statements)
+        exits, test = [], None
+        for name, value in block.values:
+            cond = self._expr(value)
+            body = branches.get('DO' + name[2:])
+            if cond[0] == 'const':
+                if not cond[1]:
+                    self.dropped += 1
+                    continue
+                ends = body is not None and self._chain(body, out, loop) # Always true, later branches can never run
+                break
+            test = len(out)
+            out.append(['jump_if_not', cond, None])
+            if body is not None:
+                self._chain(body, out, loop)
+            exits.append(len(out))
+            out.append(['jump', None])
+            out[test][2] = len(out)
+        else:
+            ends = False
+            if 'ELSE' in branches:
+                ends = self._chain(branches['ELSE'], out, loop)
+            elif exits and exits[-1] == len(out) - 1: # Nothing follows the last branch, its exit jump is not needed
+                exits.pop()
+                out.pop()
+                out[test][2] = len(out)
+        for index in exits:
+            out[index][1] = len(out)
+        return ends and not exits
+
+    def _stmt_move_arc_to(self, block, out, loop):
+        fields = block.values[0][1].fields
+        out.append(('move_line', tuple(float(text) for name, text in fields[:-2]), float(fields[-2][1]), fields[-1][1] == 'TRUE'))
+
+    def _stmt_move_cartesian(self, block, out, loop):
+        fields = block.fields
+        out.append(('move_line', tuple(float(text) for name, text in fields[:-2]), float(fields[-2][1]), fields[-1][1] == 'TRUE'))
+
+    def _stmt_move_joints(self, block, out, loop):
+        values = [float(text) for name, text in block.fields[:-1]]
+        radius = values.pop() if any(name == 'r' for name, text in block.fields) else None
+        out.append(('move_joints', tuple(values), radius, block.fields[-1][1] == 'TRUE'))
+
+    def _stmt_move_circle(self, block, out, loop):
+        percent = _fold(('arith', '*', _fold(('arith', '/', self._value(block, index=2), ('const', 360.0))), ('const', 100))) # Degrees to percent of a full circle
+        wait = self._value(block, index=3)
+        if wait[0] != 'const':
+            raise BlocklyError('move_circle ({}) needs a constant wait flag'.format(block.id))
+        out.append(('move_circle', self._pose(block, 0), self._pose(block, 1), percent, wait[1] in (True, 'TRUE')))
+
+    def _stmt_gpio_set_controller_digital(self, block, out, loop):
+        fields = [text for name, text in block.fields]
+        delay = _number(fields[3]) if len(fields) > 3 else 0
+        out.append(('set_cgpio', int(fields[0]), 0 if fields[1] == 'LOW' else 1, delay))
+
+    _stmt_gpio_set_controller_digital_do = _stmt_gpio_set_controller_digital
+
+    def _stmt_set_speed(self, block, out, loop):
+        value = ('const', _number(block.fields[0][1])) if block.fields else self._value(block)
+        out.append(('set_param', SPEED_PARAMS[block.type], value))
+
+    _stmt_set_acceleration = _stmt_set_angle_speed = _stmt_set_angle_acceleration = _stmt_set_speed
+
+    def _stmt_wait(self, block, out, loop):
+        out.append(('wait', self._value(block)))
+
+    def _stmt_sleep(self, block, out, loop):
+        out.append(('pause', self._value(block)))
+
+    def _stmt_variables_set(self, block, out, loop):
+        out.append(('set_var', _field(block), self._value(block)))
+
+    def _stmt_math_change(self, block, out, loop):
+        out.append(('change_var', _field(block), self._value(block)))
+
+    def _stmt_tool_comment(self, block, out, loop):
+        if block.statements:
+            return self._chain(block.statements[0][1], out, loop)
+
+    _stmt_tool_app_comment = _stmt_tool_comment
+
+    def _stmt_tool_remark(self, block, out, loop):
+        pass
+
+
+def _format_table(steps, indent):
+    pad = ' ' * indent
+    return '(\n{}\n{})'.format('\n'.join('{}    {!r},'.format(pad, step) for step in steps), pad)
+
+
+def generate(main, procedures, source='', ip='192.168.1.213'):
+    lines = [
+        '# Generated by blockly_compiler.py from {}. Edit the Blockly project and recompile, not this file.'.format(source),
+        '',
+        'from blockly_runtime import run_program',
+        '',
+        'MAIN = {}'.format(_format_table(main, 0)),
+        '',
+        'PROCEDURES = {',
+    ]
+    for name in sorted(procedures):
+        lines.append('    {!r}: {},'.format(name, _format_table(procedures[name], 4)))
+    lines += [
+        '}',
+        '',
+        "if __name__ == '__main__':",
+        '    run_program(MAIN, PROCEDURES, ip={!r})'.format(ip),
+        '',
+    ]
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile a Blockly project into a step table for blockly_runtime')
+    parser.add_argument('project', help='Blockly project, Studio XML or Blockly JSON')
+    parser.add_argument('-o', '--output', help='Python file to write, default is stdout')
+    parser.add_argument('--ip', default='192.168.1.213', help='Robot IP written into the program')
+    args = parser.parse_args()
+    with open(args.project, encoding='utf-8') as f:
+        blocks = parse_project(f.read())
+    compiler = BlocklyCompiler()
+    try:
+        steps, procedures = compiler.compile(blocks)
+    except BlocklyError as e:
+        sys.exit('{}: {}'.format(args.project, e))
+    code = generate(steps, procedures, source=args.project, ip=args.ip)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(code)
+        print('{}: {} steps in {} procedures, {} unreachable blocks dropped'.format(
+            args.output, len(steps) + sum(len(p) for p in procedures.values()), len(procedures), compiler.dropped))
+    else:
+        sys.stdout.write(code)
+
+
+if __name__ == '__main__':
+    main()
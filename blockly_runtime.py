@@ -0,0 +1,166 @@
+# Shared executor for programs built by blockly_compiler.py
+#
+# A compiled program is a table of steps, one tuple per step, and a table of
+# procedures with the same layout. The executor resolves every opcode to a handler once
+# at load time and then walks the table with a program counter, so a generated file is
+# nothing but constants and starts as fast as it can be imported.
+#
+# Steps:
+#   ('move_line', pose, radius, wait)        set_position at the current TCP speed/acc
+#   ('move_joints', angles, radius, wait)    set_servo_angle at the current joint speed/acc
+#   ('move_circle', pose1, pose2, percent, wait)
+#   ('set_cgpio', io, value, delay_sec)
+#   ('set_param', name, expr)                tcp_speed, tcp_acc, angle_speed or angle_acc
+#   ('set_var', name, expr) / ('change_var', name, expr)
+#   ('pause', expr)                          controller-side pause (set_pause_time)
+#   ('wait', expr)                           host-side wait, interruptible
+#   ('call', name)
+#   ('jump', target) / ('jump_if_not', expr, target)
+#   ('loop', target, min_interval, loop_id)  back edge of a loop, paces it like the Studio code
+#
+# Expressions are nested tuples: ('const', v), ('var', name), ('cgpio', io),
+# ('not', e), ('and', a, b), ('or', a, b), ('cmp', op, a, b), ('arith', op, a, b).
+
+import time
+import operator
+import threading
+
+OPS = {
+    '==': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+    '+': operator.add, '-': operator.sub, '*': operator.mul, '/': operator.truediv, '**': operator.pow,
+}
+
+
+class StepExecutor:
+    def __init__(self, arm, main, procedures, tcp_speed=100, tcp_acc=2000, angle_speed=20, angle_acc=500):
+        self._arm = arm
+        self.alive = True
+        self._params = {'tcp_speed': tcp_speed, 'tcp_acc': tcp_acc, 'angle_speed': angle_speed, 'angle_acc': angle_acc}
+        self._vars = {}
+        self._loop_marks = {} # loop_id -> time its back edge was last taken, for loop pacing
+        self._main = self._load(main)
+        self._procedures = {name: self._load(steps) for name, steps in procedures.items()}
+        self._stop_event = threading.Event()
+
+    def _load(self, steps): # Resolve opcodes to bound handlers once, not on every step
+        return [(getattr(self, '_op_' + step[0]), step[1:]) for step in steps]
+
+    @property
+    def is_alive(self):
+        return self.alive and self._arm.connected and self._arm.error_code == 0 and self._arm.state < 4
+
+    def stop(self):
+        self.alive = False
+        self._stop_event.set()
+
+    def run(self):
+        try:
+            self._execute(self._main)
+        except Exception as e:
+            print('MainException: {}'.format(e))
+        self.alive = False
+
+    def _execute(self, table):
+        pc = 0
+        end = len(table)
+        while pc < end:
+            handler, args = table[pc]
+            pc = handler(pc, *args)
+            if pc is None or not self.is_alive:
+                return False
+        return True
+
+    def _check_code(self, code, label):
+        if code != 0:
+            self.alive = False
+            print('{}, code={}, connected={}, state={}, error={}'.format(label, code, self._arm.connected, self._arm.state, self._arm.error_code))
+            return None
+        return True
+
+    def _eval(self, expr):
+        kind = expr[0]
+        if kind == 'const':
+            return expr[1]
+        if kind == 'var':
+            return self._vars.get(expr[1], 0)
+        if kind == 'cgpio':
+            return self._arm.get_cgpio_digital(expr[1])[1]
+        if kind == 'not':
+            return not self._eval(expr[1])
+        if kind == 'and':
+            return self._eval(expr[1]) and self._eval(expr[2])
+        if kind == 'or':
+            return self._eval(expr[1]) or self._eval(expr[2])
+        return OPS[expr[1]](self._eval(expr[2]), self._eval(expr[3])) # 'cmp' and 'arith'
+
+    def _op_move_line(self, pc, pose, radius, wait):
+        code = self._arm.set_position(*pose, speed=self._params['tcp_speed'], mvacc=self._params['tcp_acc'], radius=radius, wait=wait)
+        return self._check_code(code, 'set_position') and pc + 1
+
+    def _op_move_joints(self, pc, angles, radius, wait):
+        code = self._arm.set_servo_angle(angle=list(angles), speed=self._params['angle_speed'], mvacc=self._params['angle_acc'], wait=wait, radius=radius)
+        return self._check_code(code, 'set_servo_angle') and pc + 1
+
+    def _op_move_circle(self, pc, pose1, pose2, percent, wait):
+        code = self._arm.move_circle(list(pose1), list(pose2), self._eval(percent), speed=self._params['tcp_speed'], mvacc=self._params['tcp_acc'], wait=wait)
+        return self._check_code(code, 'move_circle') and pc + 1
+
+    def _op_set_cgpio(self, pc, io, value, delay_sec):
+        code = self._arm.set_cgpio_digital(io, value, delay_sec=delay_sec)
+        return self._check_code(code, 'set_cgpio_digital') and pc + 1
+
+    def _op_set_param(self, pc, name, expr):
+        self._params[name] = self._eval(expr)
+        return pc + 1
+
+    def _op_set_var(self, pc, name, expr):
+        self._vars[name] = self._eval(expr)
+        return pc + 1
+
+    def _op_change_var(self, pc, name, expr):
+        self._vars[name] = self._vars.get(name, 0) + self._eval(expr)
+        return pc + 1
+
+    def _op_pause(self, pc, expr):
+        code = self._arm.set_pause_time(self._eval(expr))
+        return self._check_code(code, 'set_pause_time') and pc + 1
+
+    def _op_wait(self, pc, expr):
+        slices, rest = divmod(max(self._eval(expr), 0), 0.1) # Liveness checked every 0.1 s, the remainder waited out last
+        for i in range(int(slices)):
+            if self._stop_event.wait(0.1) or not self.is_alive:
+                return None
+        if rest > 0 and (self._stop_event.wait(rest) or not self.is_alive):
+            return None
+        return pc + 1
+
+    def _op_call(self, pc, name):
+        return pc + 1 if self._execute(self._procedures[name]) else None
+
+    def _op_jump(self, pc, target):
+        return target
+
+    def _op_jump_if_not(self, pc, expr, target):
+        return pc + 1 if self._eval(expr) else target
+
+    def _op_loop(self, pc, target, min_interval, loop_id):
+        if min_interval:
+            now = time.monotonic()
+            last = self._loop_marks.get(loop_id)
+            if last is not None and now - last < min_interval: # Never spin on the controller faster than the Studio loops do
+                self._stop_event.wait(min_interval - (now - last))
+            self._loop_marks[loop_id] = time.monotonic()
+        return target
+
+
+def run_program(main, procedures, ip, **kwargs):
+    from xarm.wrapper import XArmAPI
+    arm = XArmAPI(ip, baud_checkset=False)
+    arm.clean_warn()
+    arm.clean_error()
+    arm.motion_enable(True)
+    arm.set_mode(0)
+    arm.set_state(0)
+    executor = StepExecutor(arm, main, procedures, **kwargs)
+    executor.run()
+    return executor
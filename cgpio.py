@@ -0,0 +1,211 @@
+# Controller GPIO event bus for the xArm control box
+#
+# One sampler per arm publishes debounced rising/falling edges for all 16 controller
+# digital inputs. It listens to the SDK report stream (arm.cgpio_states is refreshed by
+# every rich report, no extra round trip) and falls back to a single fast get_cgpio_state()
+# poller when no reports arrive. Callers block on an edge instead of sleeping 100ms
+# between get_cgpio_digital() calls. Listeners that must not wait for the debounce (the
+# input monitor) get every raw sample from the same source with subscribe_samples().
+#
+# read_inputs() is the one-shot version: a single get_cgpio_state() round trip decoded
+# into an immutable CgpioSnapshot that every check in a cycle can read from.
+
+import time
+import threading
+from collections import namedtuple
+
+NUM_INPUTS = 16
+
+FALLING = 0
+RISING = 1
+
+
+def decode_inputs(values): # Same decode as RobotMain._listen_gpio_thread, packed into one int (bit i = input i)
+    functions = values[10]
+    mask = 0
+    for i in range(NUM_INPUTS):
+        if i < len(functions) and functions[i] not in (0, 255):
+            mask |= 1 << i # Inputs with a configured function read as 1, like the SDK
+        else:
+            mask |= values[3] & (1 << i)
+    return mask
+
+
+class CgpioSnapshot(namedtuple('CgpioSnapshot', ['code', 'mask', 'timestamp'])):
+    __slots__ = ()
+
+    @classmethod
+    def from_state(cls, code, values):
+        return cls(code, decode_inputs(values) if code == 0 else 0, time.monotonic())
+
+    @property
+    def ok(self):
+        return self.code == 0
+
+    @property
+    def digitals(self): # Same list shape as get_cgpio_digital() with no ionum
+        return [self.mask >> i & 1 for i in range(NUM_INPUTS)]
+
+    def digital(self, io):
+        return self.mask >> io & 1
+
+    def changed(self, other): # Bitmask of inputs that differ from another snapshot
+        return self.mask ^ other.mask
+
+
+def read_inputs(arm): # One controller round trip for every digital input
+    code, values = arm.get_cgpio_state()
+    return CgpioSnapshot.from_state(code, values)
+
+
+class GpioEventBus:
+    def __init__(self, arm, debounce=0.02, poll_interval=0.01, source='auto', report_timeout=0.5):
+        self._arm = arm
+        self._debounce = debounce # An input must stay at a new level this long before the edge is published, in seconds
+        self._poll_interval = poll_interval # Only used by the fallback poller, in seconds
+        self._report_timeout = report_timeout # No report for this long switches to the poller, in seconds
+        self._source = source # 'auto', 'report' or 'poll'
+        self._cond = threading.Condition()
+        self._report_event = threading.Event()
+        self._mask = None # Debounced input state, None until the first sample
+        self._pending_since = [None] * NUM_INPUTS
+        self._edge_counts = [0] * (2 * NUM_INPUTS) # Index io * 2 + edge, bumped on every published edge
+        self._subscribers = []
+        self._sample_subscribers = []
+        self._thread = None
+        self.alive = False
+
+    @property
+    def mode(self): # 'report' or 'poll', whichever source is feeding the bus right now
+        return self._source
+
+    def start(self):
+        if self._source in ('auto', 'report') and hasattr(self._arm, 'register_report_callback') and hasattr(self._arm, 'cgpio_states'):
+            self._source = 'report'
+            self._arm.register_report_callback(self._report_callback, report_cartesian=False, report_joints=False)
+        else:
+            self._source = 'poll'
+        self.alive = True
+        self._thread = threading.Thread(target=self._sample_thread, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.alive = False
+        self._report_event.set()
+        if self._source == 'report' and hasattr(self._arm, 'release_report_callback'):
+            self._arm.release_report_callback(self._report_callback)
+        with self._cond:
+            self._cond.notify_all()
+
+    def subscribe(self, callback): # callback(io, edge, timestamp) runs on the sampler thread, keep it short
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def subscribe_samples(self, callback): # callback(mask, timestamp) for every raw sample, not debounced, on the sampler thread
+        self._sample_subscribers.append(callback)
+
+    def unsubscribe_samples(self, callback):
+        if callback in self._sample_subscribers:
+            self._sample_subscribers.remove(callback)
+
+    def snapshot(self): # Debounced state of every input, blocks until the first sample is in
+        with self._cond:
+            while self._mask is None and self.alive:
+                self._cond.wait()
+            return CgpioSnapshot(0, self._mask or 0, time.monotonic())
+
+    def value(self, io):
+        return self.snapshot().digital(io)
+
+    def wait_for(self, io, value, timeout=None): # Block until the input reads value, returns False on timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self.alive and (self._mask is None or (self._mask >> io & 1) != value):
+                if not self._wait(deadline):
+                    return False
+            return self.alive
+
+    def wait_for_edge(self, io, edge=RISING, timeout=None): # Block until the next edge of this kind, returns False on timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        index = io * 2 + edge
+        with self._cond:
+            count = self._edge_counts[index]
+            while self.alive and self._edge_counts[index] == count:
+                if not self._wait(deadline):
+                    return False
+            return self.alive
+
+    def _wait(self, deadline):
+        if deadline is None:
+            self._cond.wait()
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        self._cond.wait(remaining)
+        return True
+
+    def _report_callback(self, data):
+        self._report_event.set()
+
+    def _sample_thread(self):
+        while self.alive:
+            if self._source == 'report':
+                if not self._report_event.wait(self._settle_timeout()):
+                    if not any(since is not None for since in self._pending_since):
+                        self._source = 'poll' # The report stream went quiet, keep going with one poller
+                        continue
+                self._report_event.clear()
+                values = self._arm.cgpio_states
+                if values:
+                    self._feed(values)
+            else:
+                t1 = time.monotonic()
+                code, values = self._arm.get_cgpio_state()
+                if code == 0:
+                    self._feed(values)
+                interval = time.monotonic() - t1
+                if interval < self._poll_interval:
+                    time.sleep(self._poll_interval - interval)
+
+    def _settle_timeout(self): # Wake up in time to publish a pending edge even if no new report comes
+        now = time.monotonic()
+        timeout = self._report_timeout
+        for since in self._pending_since:
+            if since is not None:
+                timeout = min(timeout, max(since + self._debounce - now, 0))
+        return timeout
+
+    def _feed(self, values):
+        raw = decode_inputs(values)
+        now = time.monotonic()
+        for callback in list(self._sample_subscribers):
+            callback(raw, now)
+        edges = []
+        with self._cond:
+            if self._mask is None:
+                self._mask = raw
+                self._cond.notify_all()
+                return
+            changed = raw ^ self._mask
+            for io in range(NUM_INPUTS):
+                if not changed >> io & 1:
+                    self._pending_since[io] = None
+                    continue
+                if self._pending_since[io] is None:
+                    self._pending_since[io] = now
+                if now - self._pending_since[io] >= self._debounce:
+                    self._pending_since[io] = None
+                    self._mask ^= 1 << io
+                    edge = self._mask >> io & 1
+                    self._edge_counts[io * 2 + edge] += 1
+                    edges.append((io, edge))
+            if edges:
+                self._cond.notify_all()
+        for io, edge in edges:
+            for callback in list(self._subscribers):
+                callback(io, edge, now)
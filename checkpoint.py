@@ -0,0 +1,135 @@
+# Crash-safe progress journal for the sealing cycle
+#
+# Every part is journalled to a small append-only file of JSON lines: a begin record
+# naming the recipe, one done record per seal point once the controller has finished
+# its circle, and an end record when the part is complete. After a reset, an error or a
+# process restart, pending() finds the part that never ended and the seal points it
+# already got, so the operator can be offered to resume at the first unsealed pin
+# instead of re-sealing the whole part.
+#
+# Each record is flushed to the OS as it is written, a process crash loses nothing.
+# fsync is batched: it runs every sync_every records or sync_interval seconds, and
+# always on begin and end, so a power loss can only forget the last few seal points,
+# which are then sealed again, never skipped. A torn last line is ignored on read.
+#
+# A seal point stopped part way round its circle gets a partial record with the percent
+# of a turn already sealed, so resuming can seal only the rest of the arc.
+#
+#   journal = Checkpoint('cinchseal.journal')
+#   done = journal.pending(plan.digest)          # None, or the seal points already done
+#   journal.begin(plan.digest)
+#   journal.done('Pin1'); ...
+#   journal.end()
+
+import os
+import json
+import time
+
+
+class Checkpoint:
+    def __init__(self, path, sync_every=4, sync_interval=2.0, max_bytes=64 * 1024):
+        self.path = path
+        self.sync_every = sync_every # Records between fsyncs
+        self.sync_interval = sync_interval # Longest time a record waits for its fsync, in seconds
+        self.max_bytes = max_bytes # The file is emptied at the end of a part once it grows past this
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self.key = None # Recipe of the part in progress
+        self.sealed = [] # Seal points done on the part in progress, in order
+
+    def _records(self):
+        try:
+            with open(self.path, 'r') as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        for line in lines:
+            try:
+                yield json.loads(line)
+            except ValueError: # Torn write from a crash, only ever the last line
+                continue
+
+    def pending(self, key=None): # Seal points already done on an unfinished part, None when there is nothing to resume
+        state, sealed = None, []
+        for record in self._records():
+            event = record.get('event')
+            if event == 'begin':
+                state, sealed = record.get('key'), []
+            elif event == 'done' and state is not None:
+                sealed.append(record.get('leg'))
+            elif event == 'end':
+                state, sealed = None, []
+        if state is None or (key is not None and state != key): # Nothing open, or it was a different recipe
+            return None
+        return sealed
+
+    def arcs(self, key=None): # {seal point: percent of a turn sealed} for circles cut short on the unfinished part
+        state, arcs = None, {}
+        for record in self._records():
+            event = record.get('event')
+            if event == 'begin':
+                state, arcs = record.get('key'), {}
+            elif event == 'partial' and state is not None:
+                arcs[record.get('leg')] = record.get('done')
+            elif event == 'done':
+                arcs.pop(record.get('leg'), None)
+            elif event == 'end':
+                state, arcs = None, {}
+        if state is None or (key is not None and state != key):
+            return {}
+        return arcs
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, 'a')
+        return self._file
+
+    def _append(self, record, sync=False):
+        f = self._open()
+        record['time'] = round(time.time(), 3)
+        f.write(json.dumps(record) + '\n')
+        f.flush() # In the OS from here on, a process crash cannot lose it
+        self._unsynced += 1
+        if sync or self._unsynced >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def begin(self, key, sealed=(), arcs=None): # Start a part, or carry on with one whose sealed points (and arcs) are already done
+        self.key, self.sealed = key, list(sealed)
+        self._append({'event': 'begin', 'key': key})
+        for leg in self.sealed: # Repeated after the new begin so the file always stands on its own
+            self._append({'event': 'done', 'leg': leg})
+        for leg, done in (arcs or {}).items():
+            self._append({'event': 'partial', 'leg': leg, 'done': done})
+        self.sync()
+
+    def done(self, leg):
+        self.sealed.append(leg)
+        self._append({'event': 'done', 'leg': leg})
+
+    def partial(self, leg, done): # leg stopped done percent of a turn into its circle
+        self._append({'event': 'partial', 'leg': leg, 'done': round(done, 3)}, sync=True)
+
+    def end(self): # Part complete, nothing to resume
+        self._append({'event': 'end'}, sync=True)
+        self.key, self.sealed = None, []
+        if os.path.getsize(self.path) > self.max_bytes:
+            self._file.truncate(0)
+            self.sync()
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+
+def ask_resume(sealed, total, first, prompt=input): # Operator prompt, True to skip the seal points already done
+    answer = prompt('Last part stopped after {} of {} seal points, resume at {}? [Y/n] '.format(len(sealed), total, first))
+    return answer.strip().lower() not in ('n', 'no')
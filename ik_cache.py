@@ -0,0 +1,105 @@
+# Persistent inverse-kinematics cache
+#
+# Approach moves do not need a straight-line path, so they can run as joint moves
+# (set_servo_angle), which is usually quicker over long hops. That needs the joint
+# angles of every approach pose: they are asked from the controller once with
+# get_inverse_kinematics and kept in a JSON file next to the compiled plan.
+#
+# The file is named after the recipe's content hash and the arm it was solved on (model,
+# axis count, serial number or IP, TCP offset), so a changed recipe, another arm or a new
+# tool each start a cache of their own. Answers from the simulator are never read from or
+# written to disk: they only hold for the SimArm that handed them out.
+#
+#   ik = IkCache.for_plan(arm, plan, recipe_path, ip=ip)
+#   angles = ik.solve_all([leg.approach for leg in plan.legs])   # one round trip per new pose, saved
+#   motion.approach_joints(angles[i])
+
+import os
+import json
+import hashlib
+
+from recipe import default_cache_dir
+
+JOINT1_LIMIT = 360 # Joint 1 turns +-360 degrees, IK answers within +-180
+
+
+def pose_key(pose): # Poses equal to 0.01 mm / 0.01 deg share an entry
+    return ','.join('{:.2f}'.format(v) for v in pose[:6])
+
+
+def unwrap_joint1(angles, previous): # Same pose with joint 1 a whole turn either way, whichever is closest to previous
+    angles = list(angles)
+    if previous is not None:
+        for turn in (-360, 360):
+            candidate = angles[0] + turn
+            if abs(candidate) <= JOINT1_LIMIT and abs(candidate - previous[0]) < abs(angles[0] - previous[0]):
+                angles[0] = candidate
+    return angles
+
+
+def arm_config(arm, ip=None): # What the answers depend on besides the pose, as the cache records it
+    tcp = getattr(arm, 'tcp_offset', None) # Report-fed on the SDK like the rest, no round trip
+    return {'type': getattr(arm, 'device_type', None), 'axis': getattr(arm, 'axis', None),
+            'arm': getattr(arm, 'sn', None) or ip, 'tcp': [round(v, 3) for v in tcp] if tcp else None}
+
+
+class IkCache:
+    def __init__(self, arm, cache_dir, digest, ip=None):
+        self.arm = arm
+        self.digest = digest # Recipe or pose list the entries belong to
+        self.config = arm_config(arm, ip) # Arm and tool the entries were solved for
+        key = hashlib.sha256(json.dumps(self.config, sort_keys=True).encode()).hexdigest()[:16]
+        self.path = os.path.join(cache_dir, '{}.{}.ik.json'.format(digest, key))
+        self.persist = not getattr(arm, 'simulated', False) # A simulator only knows the poses it solved itself
+        self.angles = {} # pose_key -> joint angles, in degrees
+        self.solved = 0 # Round trips made since loading
+        self._dirty = False
+        if not self.persist:
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get('arm') == self.config:
+                self.angles = data.get('angles', {})
+        except (OSError, ValueError):
+            pass
+
+    @classmethod
+    def for_plan(cls, arm, plan, recipe_path, cache_dir=None, ip=None): # One cache per recipe content and arm
+        return cls(arm, cache_dir or default_cache_dir(recipe_path), plan.digest, ip)
+
+    @classmethod
+    def for_poses(cls, arm, poses, cache_dir, ip=None): # One cache per list of poses and arm, for scripts without a recipe
+        return cls(arm, cache_dir, hashlib.sha256(json.dumps([list(pose) for pose in poses]).encode()).hexdigest(), ip)
+
+    def solve(self, pose, previous=None): # Joint angles for pose, None if the controller has no solution
+        key = pose_key(pose)
+        angles = self.angles.get(key)
+        if angles is None:
+            code, angles = self.arm.get_inverse_kinematics(list(pose), input_is_radian=False, return_is_radian=False)
+            if code != 0:
+                return None
+            angles = [round(a, 4) for a in angles]
+            self.angles[key] = angles
+            self.solved += 1
+            self._dirty = True
+        return unwrap_joint1(angles, previous)
+
+    def solve_all(self, poses, previous=None): # Angles for every pose, each unwrapped against the one before, saved once
+        result = []
+        for pose in poses:
+            angles = self.solve(pose, previous)
+            result.append(angles)
+            previous = angles if angles is not None else previous
+        self.save()
+        return result
+
+    def save(self):
+        if not self._dirty or not self.persist:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump({'arm': self.config, 'angles': self.angles}, f)
+        os.replace(tmp_path, self.path) # Readers never see a half-written cache
+        self._dirty = False
@@ -0,0 +1,97 @@
+# Non-blocking signal lamp on a controller digital output
+#
+# An Indicator owns one output and plays a Pattern on its own timer thread, so the
+# control thread says what the lamp should show and moves on instead of toggling the
+# output between time.sleep() calls. A pattern is a tuple of (value, seconds) steps
+# played in a loop; a single step with no duration holds that value.
+#
+# Writes are coalesced: the output is only written when the value actually changes, so
+# showing STEADY before every pin costs nothing once the lamp is on, and switching to a
+# pattern that starts with the current value does not write at all. Every write to the
+# output has to go through the indicator for that to hold.
+
+import time
+import threading
+from collections import namedtuple
+
+Pattern = namedtuple('Pattern', ['name', 'steps'])
+
+OFF = Pattern('off', ((0, None),))
+STEADY = Pattern('steady', ((1, None),))
+SLOW_BLINK = Pattern('slow_blink', ((1, 0.5), (0, 0.5))) # Potting sensor alert, same timing as check_potting()
+FAST_BLINK = Pattern('fast_blink', ((1, 0.1), (0, 0.1)))
+DOUBLE_BLINK = Pattern('double_blink', ((1, 0.15), (0, 0.15), (1, 0.15), (0, 0.55)))
+RESET_BLINK = Pattern('reset_blink', ((1, 0.5), (0, 0.1))) # Waiting for the reset button, same timing as back_to_zero()
+
+
+class Indicator:
+    def __init__(self, arm, io=8, on_error=None):
+        self._arm = arm
+        self.io = io
+        self._on_error = on_error # Called with the code of a failed write, the write is retried on the next step
+        self._cond = threading.Condition()
+        self._pattern = OFF
+        self._changed = True # A new pattern is waiting to be picked up by the thread
+        self._written = None # Last value the output is known to hold, None until the first write
+        self.writes = 0
+        self._thread = None
+        self.alive = False
+
+    @property
+    def pattern(self):
+        return self._pattern
+
+    def start(self):
+        self.alive = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def show(self, pattern): # Returns at once; showing the pattern that is already running keeps its phase
+        with self._cond:
+            if pattern != self._pattern:
+                self._pattern = pattern
+                self._changed = True
+                self._cond.notify()
+
+    def stop(self, value=None): # Stop the timer thread, then leave the output at value if one is given
+        with self._cond:
+            self.alive = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        if value is not None:
+            self._write(value)
+
+    def _write(self, value):
+        if value == self._written:
+            return
+        code = self._arm.set_cgpio_digital(self.io, value, delay_sec=0)
+        if code == 0:
+            self._written = value
+            self.writes += 1
+        else:
+            self._written = None # State unknown, write again next time
+            if self._on_error is not None:
+                self._on_error(code)
+
+    def _run(self):
+        step, deadline = 0, None
+        while True:
+            with self._cond:
+                while self.alive and not self._changed:
+                    timeout = None if deadline is None else deadline - time.monotonic()
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self._cond.wait(timeout)
+                if not self.alive:
+                    return
+                if self._changed:
+                    self._changed = False
+                    step, deadline = 0, time.monotonic()
+                else:
+                    step += 1
+                steps = self._pattern.steps
+            value, duration = steps[step % len(steps)]
+            self._write(value) # Outside the lock, show() never waits on a round trip
+            deadline = None if duration is None else deadline + duration # From the schedule, not from now, so the blink does not drift
@@ -0,0 +1,120 @@
+# Input monitor that stops the arm on the reset and safety inputs
+#
+# The sealing loop only looks at its inputs between seal points, so a reset press or a
+# potting sensor fault used to wait for the running approach and circle to finish. An
+# InputMonitor checks those inputs on every sample (no debounce: a stop on a bounce is the
+# safe side) and, the moment one reads its trip value, puts the controller in the stop
+# state (set_state(4)). The controller decelerates the arm and drops its queued commands.
+#
+# Given the cell's GpioEventBus, the monitor takes the bus's raw samples: the report
+# stream's cgpio_states, or the bus's own poll once the reports go quiet, so a watched
+# seal sequence costs no extra round trips. The latency from the input edge to the stop
+# command is then bounded by the report interval plus one round trip. Without a bus it
+# polls get_cgpio_state() on its own thread, bounded by poll_interval plus two round
+# trips. Either way the stop does not wait for the control thread, which sees
+# monitor.tripped afterwards, does its own bookkeeping (MotionPipeline.cancel()) and
+# brings the arm back with set_state(0). Outside watch() and release() samples are
+# ignored (and nothing is polled), so a reset press that is expected (the end of a part)
+# trips nothing.
+#
+#   monitor = InputMonitor(arm, {2: 1, 1: 0}, gpio=gpio).start()   # reset pressed, sensor off
+#   monitor.watch()
+#   ... queue motion, check monitor.tripped ...
+#   monitor.release()
+
+import time
+import threading
+from collections import namedtuple
+
+from cgpio import decode_inputs
+
+Trip = namedtuple('Trip', ['io', 'value', 'seen', 'stopped', 'code']) # seen: sample that read the input, stopped: stop command done
+
+
+class InputMonitor:
+    def __init__(self, arm, trips, poll_interval=0.01, on_trip=None, gpio=None):
+        self._arm = arm
+        self.trips = dict(trips) # io -> value that stops the arm
+        self.poll_interval = poll_interval # Between input samples while watching, in seconds, without a bus
+        self._gpio = gpio # GpioEventBus whose samples are checked, None to poll on our own thread
+        self._on_trip = on_trip # Called as on_trip(trip) on the monitor thread once the arm is stopping, keep it short
+        self._cond = threading.Condition()
+        self._watching = False
+        self.tripped = None # Trip that stopped the arm since the last watch(), None if none did
+        self.samples = 0
+        self._thread = None
+        self.alive = False
+
+    def start(self):
+        self.alive = True
+        if self._gpio is not None:
+            self._gpio.subscribe_samples(self._sample)
+            return self
+        self._thread = threading.Thread(target=self._run, name='input_monitor', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self.alive = False
+            self._cond.notify()
+        if self._gpio is not None:
+            self._gpio.unsubscribe_samples(self._sample)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def watch(self): # Stop the arm on any trip input from now on
+        with self._cond:
+            self.tripped = None
+            self._watching = True
+            self._cond.notify()
+
+    def release(self): # Inputs may change without stopping anything, tripped is kept for the caller
+        with self._cond:
+            self._watching = False
+
+    def _trip(self, io, value, seen):
+        code = self._arm.set_state(4) # Controlled stop: the arm decelerates and the controller drops its queue
+        trip = Trip(io, value, seen, time.monotonic(), code)
+        with self._cond:
+            self.tripped = trip
+            self._watching = False
+        if self._on_trip is not None:
+            self._on_trip(trip)
+
+    def _tripping(self, mask): # (io, value) of the first trip input mask shows, None if none
+        return next(((io, value) for io, value in self.trips.items() if (mask >> io & 1) == value), None)
+
+    def _sample(self, mask, seen): # Raw sample from the bus, on its sampler thread
+        with self._cond:
+            if not self._watching:
+                return
+            self.samples += 1
+        trip = self._tripping(mask)
+        if trip is not None:
+            self._trip(trip[0], trip[1], seen)
+
+    def _run(self):
+        deadline = None
+        while True:
+            with self._cond:
+                while self.alive and not self._watching:
+                    self._cond.wait()
+                    deadline = None
+                if not self.alive:
+                    return
+            seen = time.monotonic()
+            code, values = self._arm.get_cgpio_state()
+            self.samples += 1
+            if code == 0 and self._watching:
+                trip = self._tripping(decode_inputs(values))
+                if trip is not None:
+                    self._trip(trip[0], trip[1], seen)
+                    continue
+            deadline = (deadline or seen) + self.poll_interval # Drift-free, a slow round trip does not push later samples back
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                deadline = None
@@ -0,0 +1,142 @@
+# Pipelined motion for the xArm
+#
+# Approaches and circles are sent with wait=False so the controller's command buffer
+# always holds the next move and the arm blends from one leg into the next instead of
+# stopping after each one. The pipeline only drains to a full stop when the caller asks
+# for it, i.e. when a sensor gate says the arm must not go on.
+#
+# Because nothing is waited on, the caller does not see a leg finish. mark() tags the
+# last command sent, and on_done(tag) is called from the caller's own thread (inside
+# throttle() and flush()) once the controller reports that command finished.
+
+import time
+from collections import deque
+
+
+class MotionPipeline:
+    def __init__(self, arm, speed=200, mvacc=2000, circle_speed=50, circle_acc=100, blend_radius=0, lookahead=3,
+                 joint_speed=60, joint_acc=500):
+        self.arm = arm
+        self.speed = speed # Approach speed, in mm/s
+        self.mvacc = mvacc # Approach acceleration, in mm/s^2
+        self.circle_speed = circle_speed # Circle speed, in mm/s
+        self.circle_acc = circle_acc # Circle acceleration, in mm/s^2
+        self.joint_speed = joint_speed # Joint-space approach speed, in deg/s
+        self.joint_acc = joint_acc # Joint-space approach acceleration, in deg/s^2
+        self.blend_radius = blend_radius # Corner blend for approaches in mm, None or <0 stops exactly on every approach
+        self.lookahead = lookahead # Commands kept queued in the controller ahead of the one running
+        self.queued = 0 # Commands sent since the last flush
+        self._unreported = 0 # Commands sent since the last report, cmd_num does not count them yet
+        self.sent = 0 # Commands sent since the pipeline was created
+        self.finished = 0 # Of those, how many the controller has certainly finished
+        self.finished_at = None # time.monotonic() of the report that last moved finished on
+        self._sent_at_report = 0
+        self._marks = deque() # (command number, tag) waiting for their command to finish
+        self.on_done = None # Called as on_done(tag) once a marked command has finished
+        if hasattr(arm, 'register_report_callback'):
+            arm.register_report_callback(self._report_callback, report_cartesian=False, report_joints=False)
+
+    def configure(self, settings): # Speeds, accelerations and blend radius from a recipe's motion section
+        self.speed, self.mvacc = settings['speed'], settings['mvacc']
+        self.circle_speed, self.circle_acc = settings['circle_speed'], settings['circle_acc']
+        self.joint_speed, self.joint_acc = settings['joint_speed'], settings['joint_acc']
+        self.blend_radius = settings['blend_radius']
+
+    def approach(self, pose, speed=None, mvacc=None, radius=None): # Queue a linear move, blended into whatever comes next
+        self.throttle()
+        code = self.arm.set_position(*pose, radius=self.blend_radius if radius is None else radius,
+                                     speed=self.speed if speed is None else speed,
+                                     mvacc=self.mvacc if mvacc is None else mvacc, is_radian=False, wait=False)
+        self.queued += 1
+        self._unreported += 1
+        self.sent += 1
+        return code
+
+    def approach_joints(self, angles, speed=None, mvacc=None, radius=None): # Queue a joint move to angles solved for the approach pose
+        self.throttle()
+        code = self.arm.set_servo_angle(angle=angles, radius=self.blend_radius if radius is None else radius,
+                                        speed=self.joint_speed if speed is None else speed,
+                                        mvacc=self.joint_acc if mvacc is None else mvacc, is_radian=False, wait=False)
+        self.queued += 1
+        self._unreported += 1
+        self.sent += 1
+        return code
+
+    def circle(self, pose1, pose2, percent=100, speed=None, mvacc=None): # Queue a circle starting from the end of the previous leg
+        self.throttle()
+        code = self.arm.move_circle(pose1=pose1, pose2=pose2, percent=percent,
+                                    speed=self.circle_speed if speed is None else speed,
+                                    mvacc=self.circle_acc if mvacc is None else mvacc, is_radian=False, wait=False)
+        self.queued += 1
+        self._unreported += 1
+        self.sent += 1
+        return code
+
+    def mark(self, tag): # Tag the last command sent, on_done(tag) follows once it has finished
+        self._marks.append((self.sent, tag))
+
+    def _report_callback(self, data):
+        cmdnum = data.get('cmdnum') if data else None
+        if cmdnum is not None and data.get('state', 0) < 4: # Everything sent before the previous report has reached the controller by now
+            # A stopped or errored controller has dropped its queue, an empty queue then means nothing
+            if self._sent_at_report - cmdnum > self.finished:
+                self.finished = self._sent_at_report - cmdnum
+                self.finished_at = time.monotonic()
+        self._sent_at_report = self.sent
+        self._unreported = 0
+
+    def retire(self): # on_done for every marked command the controller has reported finished
+        while self._marks and self._marks[0][0] <= self.finished:
+            _, tag = self._marks.popleft()
+            if self.on_done is not None:
+                self.on_done(tag)
+
+    def throttle(self, interval=0.01): # Keep at most lookahead commands waiting so sensor gates stay close to the motion
+        self.retire()
+        while self.queued and self.arm.connected and self.arm.cmd_num + self._unreported > self.lookahead:
+            time.sleep(interval)
+            self.retire()
+
+    def gate(self, ok, wait): # Only stop when the gate is closed: drain the queue, then block in wait() until it opens
+        if ok():
+            return True
+        if not self.flush(): # The queue was dropped, not drained: the caller has to find out why before waiting
+            return False
+        return wait()
+
+    def cancel(self): # The controller dropped its queue (stopped by an input monitor, an error): forget what never ran
+        self.retire() # Commands reported finished before the stop still count
+        self._marks.clear()
+        self.finished = self._sent_at_report = self.sent
+        self._unreported = 0
+        self.queued = 0
+
+    def flush(self, timeout=None, interval=0.05): # Block until every queued command has finished and the arm is at rest
+        # False on timeout, or when the controller stopped, errored or went away with commands still queued
+        if not self.queued:
+            self.retire()
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        code, state = self.arm.get_state()
+        idle, needed = 0, 2 if code == 0 and state == 1 else 10 # Same settle counts as the SDK's wait_move()
+        while idle < needed and self.arm.connected:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            code, state = self.arm.get_state()
+            if code != 0 or state >= 4: # Stopped or errored, nothing left to wait for
+                self.retire() # Commands reported finished before the stop still count
+                self._marks.clear() # The controller dropped its queue, the rest never finish
+                self.queued = 0
+                return False
+            if state in (0, 1, 3):
+                idle, needed = 0, 2
+            else:
+                idle += 1
+            time.sleep(interval)
+        if idle < needed: # Disconnected, the queue went with the connection
+            self.queued = 0
+            return False
+        self.finished = self.sent # At rest with an empty queue, every command sent has finished
+        self.retire()
+        self.queued = 0
+        return True
@@ -0,0 +1,126 @@
+# Motion time model for the xArm
+#
+# The controller runs every leg with a trapezoidal velocity profile: accelerate at mvacc
+# up to speed, cruise, decelerate at mvacc. Legs too short to reach speed become a
+# triangle profile.
+#
+# estimate_plan() applies the model to a whole compiled recipe without touching the arm:
+# the move from home, then per seal point the set_position approach and the move_circle
+# (arc length from the same three-point circle the controller draws), and the reset
+# set_servo_angle. estimate_variants() prices many speed/acceleration settings at once:
+# the geometry is worked out once and every variant is a broadcast over it, thousands of
+# variants cost a few milliseconds (needs NumPy).
+#
+#   python motion_time.py recipes/cinchseal_16pin.json --speed 1000 --mvacc 400
+
+import sys
+import math
+import argparse
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+LegTime = namedtuple('LegTime', ['name', 'kind', 'distance', 'speed', 'mvacc', 'time']) # distance in mm, or degrees for 'joint'
+
+
+def trapezoid_time(distance, speed, mvacc): # Time for one point-to-point leg, in seconds
+    distance = abs(distance)
+    if distance == 0:
+        return 0.0
+    if mvacc <= 0:
+        return distance / speed
+    if distance >= speed * speed / mvacc: # Long enough to reach cruise speed
+        return distance / speed + speed / mvacc
+    return 2 * math.sqrt(distance / mvacc)
+
+
+def trapezoid_times(distance, speed, mvacc): # trapezoid_time over arrays, broadcast like any NumPy expression
+    distance, speed, mvacc = np.abs(np.asarray(distance, dtype=float)), np.asarray(speed, dtype=float), np.asarray(mvacc, dtype=float)
+    cruise = distance / speed + speed / mvacc
+    triangle = 2 * np.sqrt(distance / mvacc)
+    return np.where(distance >= speed * speed / mvacc, cruise, triangle)
+
+
+def arc_lengths(start, pose1, pose2, percent): # Path length of move_circle from each start through pose1 and pose2, (n,) arrays
+    start, pose1, pose2 = (np.asarray(p, dtype=float)[:, :3] for p in (start, pose1, pose2))
+    a, b = pose1 - start, pose2 - start
+    normal = np.cross(a, b)
+    nn = np.einsum('ij,ij->i', normal, normal)
+    collinear = nn < 1e-12 # The controller would refuse it, same fallback as xarm_sim.circle_path
+    safe = np.where(collinear, 1.0, nn)
+    offset = np.cross(np.einsum('ij,ij->i', a, a)[:, None] * b - np.einsum('ij,ij->i', b, b)[:, None] * a, normal) / (2 * safe[:, None])
+    radius = np.linalg.norm(offset, axis=1)
+    return np.where(collinear, np.linalg.norm(b, axis=1), radius * 2 * np.pi * np.asarray(percent, dtype=float) / 100)
+
+
+def plan_geometry(plan, start=None): # Approach and circle path lengths of every leg, in plan order
+    starts = [start or plan.home] + [leg.approach for leg in plan.legs[:-1]] # A full circle ends back on its approach point
+    approach = np.linalg.norm(np.asarray([leg.approach for leg in plan.legs], dtype=float)[:, :3]
+                              - np.asarray(starts, dtype=float)[:, :3], axis=1)
+    circle = arc_lengths([leg.approach for leg in plan.legs], [leg.pose1 for leg in plan.legs],
+                         [leg.pose2 for leg in plan.legs], [leg.percent for leg in plan.legs])
+    return approach, circle
+
+
+def estimate_plan(plan, start=None, reset_from=None, speed=None, mvacc=None, circle_speed=None, circle_acc=None):
+    # (total seconds, [LegTime]) for one part. Speeds left as None come from each leg, i.e. the recipe.
+    # reset_from is the joint angles the reset move starts from, None leaves the reset move out.
+    legs = []
+    approach, circle = plan_geometry(plan, start) if np is not None else _plan_geometry(plan, start)
+    for leg, d_approach, d_circle in zip(plan.legs, approach, circle):
+        v, a = speed or leg.speed, mvacc or leg.mvacc
+        legs.append(LegTime(leg.name, 'move', float(d_approach), v, a, trapezoid_time(d_approach, v, a)))
+        v, a = circle_speed or leg.circle_speed, circle_acc or leg.circle_acc
+        legs.append(LegTime(leg.name, 'circle', float(d_circle), v, a, trapezoid_time(d_circle, v, a)))
+    if reset_from is not None and plan.reset_angles:
+        delta = max(abs(r - c) for r, c in zip(plan.reset_angles, reset_from)) # Joints move together, the largest swing sets the time
+        v, a = plan.motion['reset_speed'], plan.motion['reset_acc']
+        legs.append(LegTime('reset', 'joint', delta, v, a, trapezoid_time(delta, v, a)))
+    return sum(leg.time for leg in legs), legs
+
+
+def _plan_geometry(plan, start=None): # Pure Python plan_geometry, one leg at a time
+    from xarm_sim import circle_path # Circle geometry lives with the simulator when NumPy is missing
+    previous, approach, circle = start or plan.home, [], []
+    for leg in plan.legs:
+        approach.append(math.sqrt(sum((leg.approach[i] - previous[i]) ** 2 for i in range(3))))
+        circle.append(circle_path(leg.approach, leg.pose1, leg.pose2, leg.percent)[0])
+        previous = leg.approach
+    return approach, circle
+
+
+def estimate_variants(plan, speed, mvacc, circle_speed, circle_acc, start=None): # Motion time of one part for every variant
+    # Each argument is a scalar or a (k,) array of variants, the result is (k,) seconds. The
+    # recipe's per-point overrides are ignored, every leg runs at the variant's settings.
+    approach, circle = plan_geometry(plan, start)
+    column = lambda v: np.asarray(v, dtype=float).reshape(-1, 1)
+    return (trapezoid_times(approach, column(speed), column(mvacc)).sum(axis=1)
+            + trapezoid_times(circle, column(circle_speed), column(circle_acc)).sum(axis=1))
+
+
+def main(argv=None):
+    from recipe import load_plan
+    parser = argparse.ArgumentParser(description='Predict the motion time of a recipe from the trapezoid model')
+    parser.add_argument('recipe', help='recipe file')
+    parser.add_argument('--speed', type=float, help='approach speed in mm/s (default: the recipe)')
+    parser.add_argument('--mvacc', type=float, help='approach acceleration in mm/s^2 (default: the recipe)')
+    parser.add_argument('--circle-speed', type=float, help='circle speed in mm/s (default: the recipe)')
+    parser.add_argument('--circle-acc', type=float, help='circle acceleration in mm/s^2 (default: the recipe)')
+    parser.add_argument('--reset-from', type=float, nargs='+', metavar='DEG', help='joint angles the reset move starts from')
+    args = parser.parse_args(argv)
+
+    plan = load_plan(args.recipe)
+    total, legs = estimate_plan(plan, reset_from=args.reset_from, speed=args.speed, mvacc=args.mvacc,
+                                circle_speed=args.circle_speed, circle_acc=args.circle_acc)
+    print('{:<12} {:<7} {:>10} {:>8} {:>8} {:>8}'.format('leg', 'kind', 'distance', 'speed', 'mvacc', 'time s'))
+    for leg in legs:
+        print('{:<12} {:<7} {:>10.1f} {:>8g} {:>8g} {:>8.2f}'.format(leg.name, leg.kind, leg.distance, leg.speed, leg.mvacc, leg.time))
+    print('{:<12} {:<7} {:>10} {:>8} {:>8} {:>8.2f}'.format('total', '', '', '', '', total))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,210 +1,212 @@
 import os
-import time
+import sys
 
 from xarm.wrapper import XArmAPI
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Shared modules live one level up
+from cgpio import GpioEventBus
+from checkpoint import Checkpoint, ask_resume
+from runlog import log
+from pose_table import build_pose_table, APPROACH, POSE1, POSE2
+from ik_cache import IkCache
+from indicator import Indicator, OFF, STEADY, SLOW_BLINK, RESET_BLINK
+from input_monitor import InputMonitor
+from motion import MotionPipeline
+from tour import plan_tour
+from rpc_stats import instrument
+
 ip = "192.168.1.213" # Please change to the IP of your robot
 
 speed = 100 # Please change speed of the robot, in mm/s
 tcp_acc = 2000 # Please change the TCP acceleration of the robot, in mm/s^2
 diameter = 100 # Please change the diameter of the circle, in mm
 
+HOME = [136.0, 215.3, 620.8, 180, 0, 0] # Where every part starts, see custom_zero()
+
+PIN_POINTS = [ # (approach, circle start) of pin1 to pin16, sealed in the order plan_tour() picks
+    ([364.2, 195.3, 442.3, 180, 0, 0], [367.7, 245.3, 442.3, 180, 0, 0]),
+    ([336.4, 17.1, 442.3, 180, 0, 0], [339.9, 57.1, 442.3, 180, 0, 0]),
+    ([232.5, -133.9, 442.3, 180, 0, 0], [236.0, -83.9, 442.3, 180, 0, 0]),
+    ([81.2, -232.6, 442.3, 180, 0, 0], [85.6, -182.6, 442.3, 180, 0, 0]),
+    ([-97.8, -265.1, 442.3, 180, 0, 0], [-94.3, -215.1, 442.3, 180, 0, 0]),
+    ([-284.2, -201.9, 442.3, 180, 0, 0], [-280.7, -151.9, 442.3, 180, 0, 0]),
+    ([-434.7, -97.9, 442.3, 180, 0, 0], [-431.2, -47.9, 442.3, 180, 0, 0]),
+    ([-530.0, 55.5, 442.3, 180, 0, 0], [-526.5, 105.5, 442.3, 180, 0, 0]),
+    ([-560.0, 231.0, 442.3, 180, 0, 0], [-556.5, 281.0, 442.3, 180, 0, 0]),
+    ([-521.9, 408.6, 442.3, 180, 0, 0], [-518.4, 458.6, 442.3, 180, 0, 0]),
+    ([-416.4, 556.5, 442.3, 180, 0, 0], [-412.9, 606.5, 442.3, 180, 0, 0]),
+    ([-263.2, 655.3, 442.3, 180, 0, 0], [-259.7, 705.3, 442.3, 180, 0, 0]),
+    ([-83.4, 687.9, 442.3, 180, 0, 0], [-79.9, 737.9, 442.3, 180, 0, 0]),
+    ([87.5, 628.0, 442.3, 180, 0, 0], [91.0, 678.0, 442.3, 180, 0, 0]),
+    ([237.4, 523.8, 442.3, 180, 0, 0], [240.9, 573.8, 442.3, 180, 0, 0]),
+    ([336.3, 368.8, 442.3, 180, 0, 0], [339.8, 418.8, 442.3, 180, 0, 0]),
+]
+
 class CinchSeal:
-    def __init__(self, ip):
-        self.arm = XArmAPI(ip)
+    PINS = ['pin{}'.format(i) for i in range(1, 17)] # Sealing order, reordered by the tour planner in __init__
+
+    def __init__(self, ip, journal_path=None, joint_approach=False):
+        self.arm = instrument(XArmAPI(ip)) # Set XARM_RPC_STATS=1 to time every SDK call
         self.arm.motion_enable(enable=True)
         self.arm.set_mode(0)
         self.arm.set_state(0)
         self.speed = 100 # Example speed, in mm/s
         self.tcp_acc = 2000 # Example acceleration, in mm/s^2
+        self.motion = MotionPipeline(self.arm, speed=speed, mvacc=tcp_acc, circle_speed=100, circle_acc=100) # Approaches and circles are queued, not waited on
+        self.gpio = GpioEventBus(self.arm).start() # Every input check below reads its debounced state, no round trip per check
+        self.led = Indicator(self.arm, 8).start() # The LED blinks on its own thread, waits below block on input edges
+        self.journal = Checkpoint(journal_path) if journal_path else None # Pins sealed on the current part, survives a restart
+        self.sealed = [] # Pins sealed on the current part
+        self.motion.on_done = self.pin_done # A pin is sealed (and journalled) once the controller has finished its circle
+        self.monitor = InputMonitor(self.arm, {2: 1, 1: 0}, gpio=self.gpio).start() # Stops the arm at once on a reset press or the potting sensor going off
+        order = plan_tour([approach for approach, _ in PIN_POINTS], HOME, speed, tcp_acc) # Shortest travel time from home and back, joint 1 kept unwound
+        self.PINS = [CinchSeal.PINS[i] for i in order]
+        table = build_pose_table([start for _, start in PIN_POINTS], [diameter] * len(PIN_POINTS), [approach for approach, _ in PIN_POINTS])
+        self.pin_poses = [(row[APPROACH], row[POSE1], row[POSE2]) for row in table.tolist()] # Every circle worked out once, nothing printed per move
+        self.pin_angles = [None] * len(PIN_POINTS) # Joint angles of every approach when they run as joint moves
+        if joint_approach: # Solved by the controller once, then read from the cache next to this script
+            ik = IkCache.for_poses(self.arm, [approach for approach, _ in PIN_POINTS], os.path.join(os.path.dirname(os.path.abspath(__file__)), '.plan_cache'), ip=ip)
+            self.pin_angles = ik.solve_all([approach for approach, _ in PIN_POINTS])
 
     def custom_zero(self):
-        self.arm.set_position(x=136.0, y=215.3, z=620.8, roll=180, pitch=0, yaw=0, speed=speed, mvacc=tcp_acc, is_radian=False, wait=False)
+        self.arm.set_position(*HOME, speed=speed, mvacc=tcp_acc, is_radian=False, wait=False)
     
     def check_potting(self): # When sensor gets 0 value, it will flash the light      
-        while self.arm.get_cgpio_digital(1)[1] == 0:
-            self.arm.set_cgpio_digital(8, 1, delay_sec=0)
-            time.sleep(0.5)
-            self.arm.set_cgpio_digital(8, 0, delay_sec=0)
-            time.sleep(0.5)
-        else:
-            self.arm.set_cgpio_digital(8, 1, delay_sec=0)
+        if self.gpio.value(1) == 0:
+            if not self.motion.flush(): # Only stop the queued pins when the sensor says so
+                return # Stopped instead of drained, seal_pins() sees why
+            self.led.show(SLOW_BLINK)
+            self.gpio.wait_for(1, 1) # Wakes on the sensor coming back, not at the end of a blink
+        self.led.show(STEADY)
     
-    def calculate_poses_for_circle(self, diameter, starting_position): # This function is used to calculate the poses for the circle
-        radius = diameter / 2
-        print("radius: ", radius)
-
-        center_x, center_y = starting_position[0], starting_position[1] - radius  
-        print("center_x: ", center_x)
-        print("center_y: ", center_y)
-
-        pose1 = [center_x + radius, center_y, starting_position[2], starting_position[3], starting_position[4], starting_position[5]] 
-        print("pose1: ", pose1)
-
-        pose2 = [center_x - radius, center_y, starting_position[2], starting_position[3], starting_position[4], starting_position[5]] 
-        print("pose2: ", pose2)
-
-        return pose1, pose2
-
-    def move_circle_with_diameter(self, diameter, starting_position): # This function is used to move the robot in a circle
-        # Calculate poses based on diameter
-        pose1, pose2 = self.calculate_poses_for_circle(diameter, starting_position)
-
-        print("Moving circle with diameter: ", diameter)
-        self.arm.move_circle(pose1=pose1, pose2=pose2, percent=100, speed=100, mvacc=100, wait=True)
-        print("Circle moved")
+    def seal_pin(self, index): # Queue the approach and the circle of one pin from the precomputed poses
+        approach, pose1, pose2 = self.pin_poses[index]
+        if self.pin_angles[index] is not None:
+            self.motion.approach_joints(self.pin_angles[index])
+        else:
+            self.motion.approach(approach)
+        self.motion.circle(pose1, pose2, percent=100)
+        log('circle_queued', pin=index + 1, diameter=diameter)
 
 # Start of the functions for the pins
 
     def pin1(self):
-        self.arm.set_position(x=364.2, y=195.3, z=442.3, roll=180, pitch=0, yaw=0, speed=speed, mvacc=tcp_acc, is_radian=False, wait=False)
-        time.sleep(1)
-        self.move_circle_with_diameter(100, [367.7, 245.3, 442.3, 180, 0, 0])
+        self.seal_pin(0)
 
     def pin2(self):
-        self.arm.set_position(x=336.4, y=17.1, z=442.3, roll=180, pitch=0, yaw=0, speed=speed, mvacc=tcp_acc, is_radian=False, wait=False)
-        time.sleep(1)
-        self.move_circle_with_diameter(100, [339.9, 57.1, 442.3, 180, 0, 0])        
-    
+        self.seal_pin(1)
+
     def pin3(self):
-        self.arm.set_position(x=232.5, y=-133.9, z=442.3, roll=180, pitch=0, yaw=0, speed=speed, mvacc=tcp_acc, is_radian=False, wait=False)
-        time.sleep(1)
-        self.move_circle_with_diameter(100, [236.0, -83.9, 442.3, 180, 0, 0])
+        self.seal_pin(2)
 
     def pin4(self):
-        self.arm.set_position(x=81.2, y=-232.6, z=442.3, roll=180, pitch=0, yaw=0, speed=speed, mvacc=tcp_acc, is_radian=False, wait=False)
-        time.sleep(1)
-        self.move_circle_with_diameter(100, [85.6, -182.6, 442.3, 180, 0, 0])
+        self.seal_pin(3)
 
     def pin5(self):
-        self.arm.set_position(x=-97.8, y=-265.1, z=442.3, roll=180, pitch=0, yaw=0, speed=speed, mvacc=tcp_acc, is_radian=False, wait=False)
-        time.sleep(1)
-        self.move_circle_with_diameter(100, [-94.3, -215.1, 442.3, 180, 0, 0])
+        self.seal_pin(4)
 
     def pin6(self):
-        self.arm.set_position(x=-284.2, y=-201.9, z=442.3, roll=180, pitch=0, yaw=0, speed=speed, mvacc=tcp_acc, is_radian=False, wait=False)
-        time.sleep(1)
-        self.move_circle_with_diameter(100, [-280.7, -151.9, 442.3, 180, 0, 0])
+        self.seal_pin(5)
 
     def pin7(self):
-        self.arm.set_position(x=-434.7, y=-97.9, z=442.3, roll=180, pitch=0, yaw=0, speed=speed, mvacc=tcp_acc, is_radian=False, wait=False)
-        time.sleep(1)
-        self.move_circle_with_diameter(100, [-431.2, -47.9, 442.3, 180, 0, 0])
+        self.seal_pin(6)
 
     def pin8(self):
-        self.arm.set_position(x=-530.0, y=55.5, z=442.3, roll=180, pitch=0, yaw=0, speed=speed, mvacc=tcp_acc, is_radian=False, wait=False)
-        time.sleep(1)
-        self.move_circle_with_diameter(100, [-526.5, 105.5, 442.3, 180, 0, 0])
+        self.seal_pin(7)
 
     def pin9(self):
-        self.arm.set_position(x=-560.0, y=231.0, z=442.3, roll=180, pitch=0, yaw=0, speed=speed, mvacc=tcp_acc, is_radian=False, wait=False)
-        time.sleep(1)
-        self.move_circle_with_diameter(100, [-556.5, 281.0, 442.3, 180, 0, 0])
+        self.seal_pin(8)
 
     def pin10(self):
-        self.arm.set_position(x=-521.9, y=408.6, z=442.3, roll=180, pitch=0, yaw=0, speed=speed, mvacc=tcp_acc, is_radian=False, wait=False)
-        time.sleep(1)
-        self.move_circle_with_diameter(100, [-518.4, 458.6, 442.3, 180, 0, 0])
+        self.seal_pin(9)
 
     def pin11(self):
-        self.arm.set_position(x=-416.4, y=556.5, z=442.3, roll=180, pitch=0, yaw=0, speed=speed, mvacc=tcp_acc, is_radian=False, wait=False)
-        time.sleep(1)
-        self.move_circle_with_diameter(100, [-412.9, 606.5, 442.3, 180, 0, 0])
+        self.seal_pin(10)
 
     def pin12(self):
-        self.arm.set_position(x=-263.2, y=655.3, z=442.3, roll=180, pitch=0, yaw=0, speed=speed, mvacc=tcp_acc, is_radian=False, wait=False)
-        time.sleep(1)
-        self.move_circle_with_diameter(100, [-259.7, 705.3, 442.3, 180, 0, 0])
+        self.seal_pin(11)
 
     def pin13(self):
-        self.arm.set_position(x=-83.4, y=687.9, z=442.3, roll=180, pitch=0, yaw=0, speed=speed, mvacc=tcp_acc, is_radian=False, wait=False)
-        time.sleep(1)
-        self.move_circle_with_diameter(100, [-79.9, 737.9, 442.3, 180, 0, 0])
+        self.seal_pin(12)
 
     def pin14(self):
-        self.arm.set_position(x=87.5, y=628.0, z=442.3, roll=180, pitch=0, yaw=0, speed=speed, mvacc=tcp_acc, is_radian=False, wait=False)
-        time.sleep(1)
-        self.move_circle_with_diameter(100, [91.0, 678.0, 442.3, 180, 0, 0])
+        self.seal_pin(13)
 
     def pin15(self):
-        self.arm.set_position(x=237.4, y=523.8, z=442.3, roll=180, pitch=0, yaw=0, speed=speed, mvacc=tcp_acc, is_radian=False, wait=False)
-        time.sleep(1)
-        self.move_circle_with_diameter(100, [240.9, 573.8, 442.3, 180, 0, 0])
+        self.seal_pin(14)
 
     def pin16(self):
-        self.arm.set_position(x=336.3, y=368.8, z=442.3, roll=180, pitch=0, yaw=0, speed=speed, mvacc=tcp_acc, is_radian=False, wait=False)
-        time.sleep(1)
-        self.move_circle_with_diameter(100, [339.8, 418.8, 442.3, 180, 0, 0])
-
-    def back_to_zero(self):
-        while not self.arm.get_cgpio_digital(2)[1]:
-            t1 = time.monotonic()
-
-            self.arm.set_cgpio_digital(8, 1, delay_sec=0)
-            time.sleep(0.5)
-
-            self.arm.set_cgpio_digital(8, 0, delay_sec=0)
-            time.sleep(0.1)
-
-            self.arm.set_cgpio_digital(8, 1, delay_sec=0)
-            time.sleep(0.5)
-
-            self.arm.set_cgpio_digital(8, 0, delay_sec=0)
-            time.sleep(0.1)
-
-            interval = time.monotonic() - t1
-            if interval < 0.01:
-                time.sleep(0.01 - interval)
+        self.seal_pin(15)
+
+    def pin_done(self, pin):
+        self.sealed.append(pin)
+        if self.journal is not None:
+            self.journal.done(pin)
+
+    def seal_pins(self): # Queue every pin not sealed yet, returns the io that stopped the arm part way, or None
+        self.monitor.watch()
+        for pin in self.PINS:
+            if pin in self.sealed: # Sealed before the part was interrupted
+                continue
+            self.check_potting() #Check potting is constantly happening. While the sensor is 0, run the code (the pins)
+            if self.monitor.tripped is not None:
+                break
+            getattr(self, pin)()
+            self.motion.mark(pin)
+        drained = self.motion.flush() # Watched until the last circle is done
+        self.monitor.release()
+        trip = self.monitor.tripped
+        if trip is None:
+            if not drained:
+                raise RuntimeError('controller dropped the queued pins: state={}, error={}'.format(self.arm.state, self.arm.error_code))
+            return None
+        self.motion.cancel() # The controller dropped the queued pins
+        self.monitor.tripped = None
+        self.arm.set_state(0) # Out of the stop state
+        return trip.io
+
+    def back_to_zero(self, pressed=False): # pressed: reset already pressed mid-sequence, no need to wait for it
+        self.motion.flush()
+        if not pressed:
+            self.led.show(RESET_BLINK)
+            self.gpio.wait_for(2, 1)
+        self.led.show(OFF)
 
         _, current_angle = self.arm.get_servo_angle()
-        new_angle = current_angle.copy()
+        new_angle = list(current_angle)
 
-        for i in range(-100, 100, 1): #Move joint 1 to the same position every time, even if it does not do 16 at once.
-            new_angle[0] = i
-            self.arm.set_servo_angle(new_angle, speed=speed, mvacc=tcp_acc, wait=True)
+        new_angle[0] = 99 #Move joint 1 to the same position every time, even if it does not do 16 at once. One move, not one per degree
+        self.arm.set_servo_angle(angle=new_angle, speed=speed, mvacc=tcp_acc, wait=True)
     
+    def resume_point(self): # Pins to skip when the operator resumes an unfinished part
+        sealed = self.journal.pending('CinchSeal') if self.journal is not None else None
+        if not sealed:
+            return []
+        first = next((pin for pin in self.PINS if pin not in sealed), 'the reset')
+        return sealed if ask_resume(sealed, len(self.PINS), first) else []
+
     def run(self):
-        self.arm.set_cgpio_digital(8, 0, delay_sec=0)
+        self.led.show(OFF)
+        sealed = self.resume_point()
 
         self.custom_zero()
 
-        while self.arm.get_cgpio_digital(0)[1]: #Button, when pressed, changes the value. But when let go will switch back to 0
-            self.arm.set_cgpio_digital(8, 1, delay_sec=0)
+        while self.gpio.value(0): #Button, when pressed, changes the value. But when let go will switch back to 0
+            self.led.show(STEADY)
+            if self.journal is not None:
+                self.journal.begin('CinchSeal', sealed)
+            self.sealed = list(sealed)
 
-            self.check_potting() #Check potting is constantly happening. While the sensor is 0, run the code (the pins)
-            self.pin1()
-            self.check_potting()
-            self.pin2()
-            self.check_potting()
-            self.pin3()
-            self.check_potting()
-            self.pin4()
-            self.check_potting()
-            self.pin5()
-            self.check_potting()
-            self.pin6()
-            self.check_potting()
-            self.pin7()
-            self.check_potting()
-            self.pin8()
-            self.check_potting()
-            self.pin9()
-            self.check_potting()
-            self.pin10()
-            self.check_potting()
-            self.pin11()
-            self.check_potting()
-            self.pin12()
-            self.check_potting()
-            self.pin13()
-            self.check_potting()
-            self.pin14()
-            self.check_potting()
-            self.pin15()
-            self.check_potting()
-            self.pin16()
-
-            self.back_to_zero() #This is a reset button which is separate.
+            stopped = self.seal_pins()
+            while stopped == 1: # The potting sensor went off mid-pin: wait for it, then seal the pins that are left
+                self.check_potting()
+                stopped = self.seal_pins()
+
+            self.back_to_zero(pressed=stopped == 2) #This is a reset button which is separate.
+            if self.journal is not None and len(self.sealed) == len(self.PINS):
+                self.journal.end()
             break
         
-        self.arm.set_cgpio_digital(8, 0, delay_sec=0)
+        self.monitor.stop()
+        self.gpio.stop()
+        self.led.stop(0) # Stop blinking and leave the LED off
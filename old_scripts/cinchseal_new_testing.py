@@ -16,23 +16,39 @@
 #   2. cd xArm-Python-SDK
 #   3. python setup.py install
 """
+import os
 import sys
 import math
 import time
 import queue
+import operator
 import datetime
 import random
 import traceback
 import threading
 from xarm.wrapper import XArmAPI
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Shared modules live one level up
+from cgpio import decode_inputs
+from runlog import log
+
 
 class RobotMain(object):
     """Robot Main Class"""
+    _TRIGGER_OPS = {
+        '==': operator.eq,
+        '!=': operator.ne,
+        '>': operator.gt,
+        '>=': operator.ge,
+        '<': operator.lt,
+        '<=': operator.le,
+    }
+
     def __init__(self, robot, **kwargs):
         self._last_completed_step = 0
         self.is_paused = False
         self.alive = True
+        self._state5_since = None # When the arm went into state 5, None while it is in any other state
         self._arm = robot
         self._tcp_speed = 60
         self._tcp_acc = 2000
@@ -40,7 +56,7 @@ class RobotMain(object):
         self._angle_acc = 500
         self._variables = {}
         self._robot_init()
-        self._cgpio_digital_callbacks = []
+        self._cgpio_digital_callbacks = {}
         self._cgpio_state = None
         self._callback_in_thread = kwargs.get('callback_in_thread', True)
         self._callback_que = queue.Queue()
@@ -59,18 +75,25 @@ class RobotMain(object):
             except Exception as e:
                 self.pprint(e)
 
+    def _register_cgpio_digital_callback(self, io, op, trigger, callback):
+        self._cgpio_digital_callbacks.setdefault(io, []).append((self._TRIGGER_OPS[op], trigger, callback))
+
     def _listen_gpio_thread(self):
         _, values = self._arm.get_cgpio_state()
-        cgpio_digitals = [values[3] >> i & 0x0001 if values[10][i] in [0, 255] else 1 for i in range(len(values[10]))] if _ == 0 else [0] * 16
+        cgpio_mask = decode_inputs(values) if _ == 0 else 0
         while self.alive:
             _, values = self._arm.get_cgpio_state()
             if _ == 0 and self._cgpio_state is not None and self._cgpio_state != values:
-                digitals = [values[3] >> i & 0x0001 if values[10][i] in [0, 255] else 1 for i in range(len(values[10]))]
-                for item in self._cgpio_digital_callbacks:
-                    for io in range(len(digitals)):
-                        if item['io'] == io and eval('{} {} {}'.format(digitals[io], item['op'], item['trigger'])) and not eval('{} {} {}'.format(cgpio_digitals[io], item['op'], item['trigger'])):
-                            self._callback_que.put(item['callback'])
-                cgpio_digitals = digitals
+                mask = decode_inputs(values)
+                changed = mask ^ cgpio_mask
+                while changed:
+                    io = (changed & -changed).bit_length() - 1
+                    changed &= changed - 1
+                    new_value, old_value = mask >> io & 1, cgpio_mask >> io & 1
+                    for compare, trigger, callback in self._cgpio_digital_callbacks.get(io, ()):
+                        if compare(new_value, trigger) and not compare(old_value, trigger):
+                            self._callback_que.put(callback)
+                cgpio_mask = mask
             self._cgpio_state = values if _ == 0 else self._cgpio_state
             time.sleep(0.01)
 
@@ -86,6 +109,13 @@ class RobotMain(object):
         self._arm.register_state_changed_callback(self._state_changed_callback)
         if hasattr(self._arm, 'register_count_changed_callback'):
             self._arm.register_count_changed_callback(self._count_changed_callback)
+        if hasattr(self._arm, 'register_connect_changed_callback'):
+            self._arm.register_connect_changed_callback(self._connect_changed_callback)
+        # Seed the cached liveness once, the callbacks keep it up to date from here on
+        if not self._arm.connected or self._arm.error_code != 0 or self._arm.state == 4:
+            self.alive = False
+        elif self._arm.state == 5:
+            self._state5_since = time.monotonic()
 
     # Register error/warn changed callback
     def _error_warn_changed_callback(self, data):
@@ -96,11 +126,22 @@ class RobotMain(object):
 
     # Register state changed callback
     def _state_changed_callback(self, data):
+        if data and data['state'] == 5:
+            self._state5_since = self._state5_since or time.monotonic()
+        elif data:
+            self._state5_since = None
         if data and data['state'] == 4:
             self.alive = False
             self.pprint('state=4, quit')
             self._arm.release_state_changed_callback(self._state_changed_callback)
 
+    # Register connect changed callback
+    def _connect_changed_callback(self, data):
+        if data and not data['connected']:
+            self.alive = False
+            self.pprint('disconnect, quit')
+            self._arm.release_connect_changed_callback(self._connect_changed_callback)
+
     # Register count changed callback
     def _count_changed_callback(self, data):
         if self.is_alive:
@@ -116,23 +157,18 @@ class RobotMain(object):
 
     @staticmethod
     def pprint(*args, **kwargs):
-        try:
-            stack_tuple = traceback.extract_stack(limit=2)[0]
-            print('[{}][{}] {}'.format(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time())), stack_tuple[1], ' '.join(map(str, args))))
-        except:
-            print(*args, **kwargs)
+        # Queued on the run log, the time is stamped and the line formatted by its writer thread
+        log('robot', line=sys._getframe(1).f_lineno, message=' '.join(map(str, args)))
 
     @property
     def is_alive(self):
-        if self.alive and self._arm.connected and self._arm.error_code == 0:
-            if self._arm.state == 5:
-                cnt = 0
-                while self._arm.state == 5 and cnt < 5:
-                    cnt += 1
-                    time.sleep(0.1)
-            return self._arm.state < 4
-        else:
-            return False
+        # Cached: the error/warn, state and connect callbacks clear self.alive, so this never reads the SDK or sleeps.
+        # A short state 5 is let through, the old polling loop waited up to 0.5s for it to clear. Once it has
+        # lasted longer the arm counts as dead for good.
+        since = self._state5_since
+        if since is not None and time.monotonic() - since > 0.5:
+            self.alive = False
+        return self.alive
 
     # Define Contoller GPIO-1 DIGITAL is HIGH callback
     def controller_gpio_1_digital_is_changed_callback_1(self):
@@ -168,14 +204,15 @@ class RobotMain(object):
 
     # Robot Main Run
     def run(self):
-        self._cgpio_digital_callbacks.append({'io': 1, 'trigger': 1, 'op': '==', 'callback': self.controller_gpio_1_digital_is_changed_callback_1})
-        self._cgpio_digital_callbacks.append({'io': 1, 'trigger': 0, 'op': '==', 'callback': self.controller_gpio_1_digital_is_changed_callback_2})
+        self._register_cgpio_digital_callback(1, '==', 1, self.controller_gpio_1_digital_is_changed_callback_1)
+        self._register_cgpio_digital_callback(1, '==', 0, self.controller_gpio_1_digital_is_changed_callback_2)
         while True:
             if not self.is_paused:
                 self.execute_movements()
             time.sleep(1)
 
 if __name__ == '__main__':
-    arm = XArmAPI('192.168.1.240', baud_checkset=False)
+    from rpc_stats import instrument
+    arm = instrument(XArmAPI('192.168.1.240', baud_checkset=False)) # Set XARM_RPC_STATS=1 to time every SDK call
     robot_main = RobotMain(arm)
     robot_main.run()
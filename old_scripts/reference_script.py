@@ -16,6 +16,7 @@
 #   2. cd xArm-Python-SDK
 #   3. python setup.py install
 """
+import os
 import sys
 import math
 import time
@@ -27,6 +28,10 @@ import threading
 from xarm import version
 from xarm.wrapper import XArmAPI
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Shared modules live one level up
+from indicator import Indicator, OFF, STEADY, SLOW_BLINK, RESET_BLINK
+from runlog import log
+
 
 class RobotMain(object):
     """Robot Main Class"""
@@ -37,7 +42,11 @@ class RobotMain(object):
         self._tcp_acc = 2000
         self._angle_speed = 20
         self._angle_acc = 500
+        self._return_speed = 60 # Joint speed of the way back, in deg/s, keeps the TCP under the 1000 mm/s run() uses
+        self._return_acc = 500 # In deg/s^2
         self._vars = {}
+        self._state5_since = None # When the arm entered state 5, it only counts as stopped once it stays there
+        self._led = Indicator(robot, 8, on_error=lambda code: self._check_code(code, 'set_suction_cup')) # Blinks on its own thread, a failed write stops the run
         self._funcs = {
             "Custom zero point": self.function_5,
             "Pin7": self.function_12,
@@ -75,6 +84,13 @@ class RobotMain(object):
         self._arm.register_state_changed_callback(self._state_changed_callback)
         if hasattr(self._arm, 'register_count_changed_callback'):
             self._arm.register_count_changed_callback(self._count_changed_callback)
+        if hasattr(self._arm, 'register_connect_changed_callback'):
+            self._arm.register_connect_changed_callback(self._connect_changed_callback)
+        # Seed the cached liveness once, the callbacks keep it up to date from here on
+        if not self._arm.connected or self._arm.error_code != 0 or self._arm.state == 4:
+            self.alive = False
+        elif self._arm.state == 5:
+            self._state5_since = time.monotonic()
 
     # Register error/warn changed callback
     def _error_warn_changed_callback(self, data):
@@ -85,11 +101,22 @@ class RobotMain(object):
 
     # Register state changed callback
     def _state_changed_callback(self, data):
+        if data and data['state'] == 5:
+            self._state5_since = self._state5_since or time.monotonic()
+        elif data:
+            self._state5_since = None
         if data and data['state'] == 4:
             self.alive = False
             self.pprint('state=4, quit')
             self._arm.release_state_changed_callback(self._state_changed_callback)
 
+    # Register connect changed callback
+    def _connect_changed_callback(self, data):
+        if data and not data['connected']:
+            self.alive = False
+            self.pprint('disconnect, quit')
+            self._arm.release_connect_changed_callback(self._connect_changed_callback)
+
     # Register count changed callback
     def _count_changed_callback(self, data):
         if self.is_alive:
@@ -105,11 +132,8 @@ class RobotMain(object):
 
     @staticmethod
     def pprint(*args, **kwargs):
-        try:
-            stack_tuple = traceback.extract_stack(limit=2)[0]
-            print('[{}][{}] {}'.format(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time())), stack_tuple[1], ' '.join(map(str, args))))
-        except:
-            print(*args, **kwargs)
+        # Queued on the run log, the time is stamped and the line formatted by its writer thread
+        log('robot', line=sys._getframe(1).f_lineno, message=' '.join(map(str, args)))
 
     @property
     def arm(self):
@@ -125,101 +149,36 @@ class RobotMain(object):
 
     @property
     def is_alive(self):
-        if self.alive and self._arm.connected and self._arm.error_code == 0:
-            if self._arm.state == 5:
-                cnt = 0
-                while self._arm.state == 5 and cnt < 5:
-                    cnt += 1
-                    time.sleep(0.1)
-            return self._arm.state < 4
-        else:
-            return False
+        # Cached: the error/warn, state and connect callbacks clear self.alive, so this never reads the SDK or sleeps.
+        # A short state 5 is let through, the old polling loop waited up to 0.5s for it to clear. Once it has
+        # lasted longer the arm counts as dead for good.
+        since = self._state5_since
+        if since is not None and time.monotonic() - since > 0.5:
+            self.alive = False
+        return self.alive
 
     def function_1(self):
         """
         Describe this function...
         """
+        self._led.show(RESET_BLINK)
         while self.is_alive and not (self._arm.get_cgpio_digital(2)[1]):
-            t1 = time.monotonic()
-            if self._arm.get_cgpio_digital(2)[1]:
-                code = self._arm.set_cgpio_digital(8, 1, delay_sec=0)
-                if not self._check_code(code, 'set_suction_cup'):
-                    return
-                break
-            code = self._arm.set_cgpio_digital(8, 1, delay_sec=0)
-            if not self._check_code(code, 'set_suction_cup'):
-                return
-            time.sleep(0.5)
-            code = self._arm.set_cgpio_digital(8, 0, delay_sec=0)
-            if not self._check_code(code, 'set_suction_cup'):
-                return
-            time.sleep(0.1)
-            code = self._arm.set_cgpio_digital(8, 1, delay_sec=0)
-            if not self._check_code(code, 'set_suction_cup'):
-                return
-            time.sleep(0.5)
-            code = self._arm.set_cgpio_digital(8, 0, delay_sec=0)
-            if not self._check_code(code, 'set_suction_cup'):
-                return
             time.sleep(0.1)
-            interval = time.monotonic() - t1
-            if interval < 0.01:
-                time.sleep(0.01 - interval)
+        self._led.show(OFF)
         self.function_2()
         if not self.is_alive:
             return
 
     def function_2(self):
         """
-        Describe this function...
+        Going back movement: one joint move to the Pin1 approach instead of retracing all 16 points,
+        the IK solution is limited to +-180 so joint 1 unwinds on the way
         """
-        code = self._arm.set_position(*[336.3, 368.8, 442.3, 180.0, 0.0, 0.0], speed=self._tcp_speed, mvacc=self._tcp_acc, radius=0.0, wait=False)
-        if not self._check_code(code, 'set_position'):
-            return
-        code = self._arm.set_position(*[237.4, 523.8, 442.3, 180.0, 0.0, 0.0], speed=self._tcp_speed, mvacc=self._tcp_acc, radius=0.0, wait=False)
-        if not self._check_code(code, 'set_position'):
-            return
-        code = self._arm.set_position(*[87.5, 628.0, 442.3, 180.0, 0.0, 0.0], speed=self._tcp_speed, mvacc=self._tcp_acc, radius=0.0, wait=False)
-        if not self._check_code(code, 'set_position'):
-            return
-        code = self._arm.set_position(*[-83.4, 687.9, 442.3, 180.0, 0.0, 0.0], speed=self._tcp_speed, mvacc=self._tcp_acc, radius=0.0, wait=False)
-        if not self._check_code(code, 'set_position'):
-            return
-        code = self._arm.set_position(*[-263.2, 655.3, 442.3, 180.0, 0.0, 0.0], speed=self._tcp_speed, mvacc=self._tcp_acc, radius=0.0, wait=False)
-        if not self._check_code(code, 'set_position'):
-            return
-        code = self._arm.set_position(*[-416.4, 556.5, 442.3, 180.0, 0.0, 0.0], speed=self._tcp_speed, mvacc=self._tcp_acc, radius=0.0, wait=False)
-        if not self._check_code(code, 'set_position'):
-            return
-        code = self._arm.set_position(*[-521.9, 408.6, 442.3, 180.0, 0.0, 0.0], speed=self._tcp_speed, mvacc=self._tcp_acc, radius=0.0, wait=False)
-        if not self._check_code(code, 'set_position'):
-            return
-        code = self._arm.set_position(*[-560.0, 231.0, 442.3, 180.0, 0.0, 0.0], speed=self._tcp_speed, mvacc=self._tcp_acc, radius=0.0, wait=False)
-        if not self._check_code(code, 'set_position'):
-            return
-        code = self._arm.set_position(*[-530.0, 55.5, 442.3, 180.0, 0.0, 0.0], speed=self._tcp_speed, mvacc=self._tcp_acc, radius=0.0, wait=False)
-        if not self._check_code(code, 'set_position'):
-            return
-        code = self._arm.set_position(*[-434.7, -97.9, 442.3, 180.0, 0.0, 0.0], speed=self._tcp_speed, mvacc=self._tcp_acc, radius=0.0, wait=False)
-        if not self._check_code(code, 'set_position'):
-            return
-        code = self._arm.set_position(*[-284.2, -201.9, 442.3, 180.0, 0.0, 0.0], speed=self._tcp_speed, mvacc=self._tcp_acc, radius=0.0, wait=False)
-        if not self._check_code(code, 'set_position'):
-            return
-        code = self._arm.set_position(*[-97.8, -265.1, 442.3, 180.0, 0.0, 0.0], speed=self._tcp_speed, mvacc=self._tcp_acc, radius=0.0, wait=False)
-        if not self._check_code(code, 'set_position'):
+        code, angles = self._arm.get_inverse_kinematics([364.2, 195.3, 442.3, 180.0, 0.0, 0.0], input_is_radian=False, return_is_radian=False)
+        if not self._check_code(code, 'get_inverse_kinematics'):
             return
-        code = self._arm.set_position(*[82.1, -232.6, 442.3, 180.0, 0.0, 0.0], speed=self._tcp_speed, mvacc=self._tcp_acc, radius=0.0, wait=False)
-        if not self._check_code(code, 'set_position'):
-            return
-        code = self._arm.set_position(*[232.5, -133.9, 442.3, 180.0, 0.0, 0.0], speed=self._tcp_speed, mvacc=self._tcp_acc, radius=0.0, wait=False)
-        if not self._check_code(code, 'set_position'):
-            return
-        code = self._arm.set_position(*[336.4, 17.1, 442.3, 180.0, 0.0, 0.0], speed=self._tcp_speed, mvacc=self._tcp_acc, radius=0.0, wait=False)
-        if not self._check_code(code, 'set_position'):
-            return
-        code = self._arm.set_position(*[364.2, 195.3, 442.3, 180.0, 0.0, 0.0], speed=self._tcp_speed, mvacc=self._tcp_acc, radius=0.0, wait=False)
-        if not self._check_code(code, 'set_position'):
+        code = self._arm.set_servo_angle(angle=angles, speed=self._return_speed, mvacc=self._return_acc, wait=False, radius=0.0)
+        if not self._check_code(code, 'set_servo_angle'):
             return
 
     def function_3(self):
@@ -237,24 +196,10 @@ class RobotMain(object):
         """
         Describe this function...
         """
+        self._led.show(SLOW_BLINK)
         while self.is_alive and not (self._arm.get_cgpio_digital(1)[1]):
-            t1 = time.monotonic()
-            if self._arm.get_cgpio_digital(1)[1]:
-                code = self._arm.set_cgpio_digital(8, 1, delay_sec=0)
-                if not self._check_code(code, 'set_suction_cup'):
-                    return
-                break
-            code = self._arm.set_cgpio_digital(8, 1, delay_sec=0)
-            if not self._check_code(code, 'set_suction_cup'):
-                return
-            time.sleep(0.5)
-            code = self._arm.set_cgpio_digital(8, 0, delay_sec=0)
-            if not self._check_code(code, 'set_suction_cup'):
-                return
-            time.sleep(0.5)
-            interval = time.monotonic() - t1
-            if interval < 0.01:
-                time.sleep(0.01 - interval)
+            time.sleep(0.1)
+        self._led.show(STEADY)
 
     def function_5(self):
         """
@@ -461,9 +406,8 @@ class RobotMain(object):
         try:
             self._tcp_speed = 1000
             self._tcp_acc = 400
-            code = self._arm.set_cgpio_digital(8, 0, delay_sec=0)
-            if not self._check_code(code, 'set_suction_cup'):
-                return
+            self._led.start()
+            self._led.show(OFF)
             self.function_5()
             if not self.is_alive:
                 return
@@ -471,9 +415,7 @@ class RobotMain(object):
                 t1 = time.monotonic()
                 while self.is_alive and self._arm.get_cgpio_digital(0)[1]:
                     t1 = time.monotonic()
-                    code = self._arm.set_cgpio_digital(8, 1, delay_sec=0)
-                    if not self._check_code(code, 'set_suction_cup'):
-                        return
+                    self._led.show(STEADY)
                     self.function_3()
                     if not self.is_alive:
                         return
@@ -577,23 +519,25 @@ class RobotMain(object):
                     interval = time.monotonic() - t1
                     if interval < 0.01:
                         time.sleep(0.01 - interval)
-                code = self._arm.set_cgpio_digital(8, 0, delay_sec=0)
-                if not self._check_code(code, 'set_suction_cup'):
-                    return
+                self._led.show(OFF) # Written once, not on every 10 ms pass while waiting for start
                 interval = time.monotonic() - t1
                 if interval < 0.01:
                     time.sleep(0.01 - interval)
         except Exception as e:
             self.pprint('MainException: {}'.format(e))
         self.alive = False
+        self._led.stop()
         self._arm.release_error_warn_changed_callback(self._error_warn_changed_callback)
         self._arm.release_state_changed_callback(self._state_changed_callback)
         if hasattr(self._arm, 'release_count_changed_callback'):
             self._arm.release_count_changed_callback(self._count_changed_callback)
+        if hasattr(self._arm, 'release_connect_changed_callback'):
+            self._arm.release_connect_changed_callback(self._connect_changed_callback)
 
 
 if __name__ == '__main__':
+    from rpc_stats import instrument
     RobotMain.pprint('xArm-Python-SDK Version:{}'.format(version.__version__))
-    arm = XArmAPI('192.168.1.213', baud_checkset=False)
+    arm = instrument(XArmAPI('192.168.1.213', baud_checkset=False)) # Set XARM_RPC_STATS=1 to time every SDK call
     robot_main = RobotMain(arm)
     robot_main.run()
\ No newline at end of file
@@ -0,0 +1,56 @@
+# Vectorized pose table for the seal points
+#
+# Every pose a seal point needs (approach, circle start, pose1, pose2, circle center,
+# diameter and arc percentage) is worked out for all points at once in one NumPy pass,
+# the same geometry as recipe.circle_poses. The result is a single contiguous float64
+# array, one row per seal point. recipe.load_plan() saves it as .npy next to the compiled
+# plan and memory-maps it on the next start: loading a table of thousands of points
+# costs a file open, not a parse or an unpickle.
+#
+#   plan = load_plan('recipes/cinchseal_16pin.json')   # plan.poses, rows in plan visit order
+#   plan.poses[i, POSE1], plan.poses[i, POSE2], plan.poses[:, CENTER]
+
+import os
+import threading
+
+import numpy as np
+
+APPROACH = slice(0, 6)
+POSITION = slice(6, 12) # Circle start
+POSE1 = slice(12, 18)
+POSE2 = slice(18, 24)
+CENTER = slice(24, 27)
+DIAMETER = 27
+PERCENT = 28
+WIDTH = 29
+
+TABLE_VERSION = 1 # Bump when the column layout changes so old cache files are ignored
+
+
+def build_pose_table(positions, diameters, approaches=None, percents=None): # (n, WIDTH) table, one row per seal point
+    positions = np.asarray(positions, dtype=float).reshape(-1, 6)
+    radius = np.asarray(diameters, dtype=float).reshape(-1) / 2
+    table = np.empty((len(positions), WIDTH))
+    table[:, POSITION] = positions
+    table[:, APPROACH] = positions if approaches is None else np.asarray(approaches, dtype=float).reshape(-1, 6)
+    center = table[:, CENTER]
+    center[:] = positions[:, :3]
+    center[:, 1] -= radius
+    for column, sign in ((POSE1, 1), (POSE2, -1)): # Both ends of the diameter through the center, same z and orientation as the start
+        pose = table[:, column]
+        pose[:] = positions
+        pose[:, 0] = center[:, 0] + sign * radius
+        pose[:, 1] = center[:, 1]
+    table[:, DIAMETER] = 2 * radius
+    table[:, PERCENT] = 100 if percents is None else percents
+    return table
+
+
+def save_pose_table(path, table): # Written whole or not at all
+    tmp_path = '{}.{}.{}.tmp.npy'.format(path[:-4], os.getpid(), threading.get_ident())
+    np.save(tmp_path, np.ascontiguousarray(table))
+    os.replace(tmp_path, path) # Readers never map a half-written table
+
+
+def map_pose_table(path): # Read-only memory map of a saved table, OSError or ValueError if it is missing or damaged
+    return np.load(path, mmap_mode='r')
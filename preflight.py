@@ -0,0 +1,137 @@
+# Pre-flight check of a whole recipe before the first motion
+#
+# A bad pose (a typo in one of the seal points) used to show up mid-cycle as a controller
+# error that ends the run with the part half sealed. Every pose the arm will pass through
+# is checked up front instead: each approach and the quarter points of each arc, all at
+# once in NumPy.
+#   reach      distance from the shoulder between min_reach and max_reach, above min_z
+#   joints     an IK solution exists and stays joint_margin inside every joint limit
+#   wrist      the wrist joint stays min_wrist degrees away from 0 and 180, where
+#              joints 4 and 6 line up and the controller loses a degree of freedom
+# The joint checks need the arm for get_inverse_kinematics, answers come from the IK
+# cache so a recipe is only solved once. Limits are the LIMIT_DEFAULTS below, overridden
+# by the recipe's "limits" section.
+#
+#   python preflight.py recipes/cinchseal_16pin.json              # reach only
+#   python preflight.py recipes/cinchseal_16pin.json --ip 192.168.1.213
+
+import sys
+import argparse
+from collections import namedtuple
+
+import numpy as np
+
+from ik_cache import IkCache
+from pose_table import APPROACH, POSE1, POSE2, PERCENT
+
+LIMIT_DEFAULTS = {
+    'max_reach': 850, # TCP distance from the shoulder, in mm
+    'min_reach': 120, # Closer than this runs into the base column, in mm
+    'shoulder_z': 267, # Height of the shoulder (joint 2) axis above the base, in mm
+    'min_z': 0, # Lowest TCP height, in mm
+    'joint_limits': [[-360, 360], [-118, 120], [-225, 11], [-360, 360], [-97, 180], [-360, 360]], # In degrees, joint 1 first
+    'joint_margin': 2, # Degrees kept clear of every joint limit
+    'min_wrist': 5, # Degrees kept clear of the wrist singularity
+}
+
+WRIST_JOINT = {6: 4, 7: 5} # Axis count -> index of the joint whose 0 lines up the wrist, 5-axis arms have none
+
+ARC_SAMPLES = (0.25, 0.5, 0.75, 1.0) # Fractions of every arc that are checked
+
+Violation = namedtuple('Violation', ['leg', 'where', 'check', 'message'])
+
+
+def sample_poses(plan): # (poses (n, 6), labels [(leg name, where)]) for every approach and arc quarter point
+    table = np.asarray(plan.poses) # Straight from the plan's pose table, rows already in leg order
+    approach, pose1, pose2, percent = table[:, APPROACH], table[:, POSE1], table[:, POSE2], table[:, PERCENT]
+    center = (pose1[:, :3] + pose2[:, :3]) / 2
+    radius = np.linalg.norm(pose1[:, :3] - center, axis=1, keepdims=True)
+    u = approach[:, :3] - center # The circle starts on the approach point and runs towards pose1
+    u /= np.maximum(np.linalg.norm(u, axis=1, keepdims=True), 1e-9)
+    v = pose1[:, :3] - center
+    v -= np.einsum('ij,ij->i', v, u)[:, None] * u
+    v /= np.maximum(np.linalg.norm(v, axis=1, keepdims=True), 1e-9)
+    theta = 2 * np.pi * percent[:, None] / 100 * np.asarray(ARC_SAMPLES) # (legs, samples)
+    arc = center[:, None] + radius[:, None] * (np.cos(theta)[..., None] * u[:, None] + np.sin(theta)[..., None] * v[:, None])
+    poses = np.empty((len(plan.legs), 1 + len(ARC_SAMPLES), 6))
+    poses[:, 0] = approach
+    poses[:, 1:, :3] = arc
+    poses[:, 1:, 3:] = approach[:, None, 3:] # The circle keeps the orientation it starts with
+    labels = [(leg.name, where) for leg in plan.legs
+              for where in ['approach'] + ['arc {:g}%'.format(f * 100) for f in ARC_SAMPLES]]
+    return poses.reshape(-1, 6), labels
+
+
+def check_reach(poses, limits): # [(index, message)] for poses outside the envelope
+    reach = np.linalg.norm(poses[:, :3] - [0, 0, limits['shoulder_z']], axis=1)
+    problems = []
+    for i in np.flatnonzero(reach > limits['max_reach']):
+        problems.append((i, '{:.1f} mm from the shoulder, max {}'.format(reach[i], limits['max_reach'])))
+    for i in np.flatnonzero(reach < limits['min_reach']):
+        problems.append((i, '{:.1f} mm from the shoulder, min {}'.format(reach[i], limits['min_reach'])))
+    for i in np.flatnonzero(poses[:, 2] < limits['min_z']):
+        problems.append((i, 'z {:.1f} mm, min {}'.format(poses[i, 2], limits['min_z'])))
+    return problems
+
+
+def check_joints(angles, limits, axis=6): # [(index, check, message)] for solved angles (n, >= axis), NaN rows had no solution
+    limit = np.asarray(limits['joint_limits'], dtype=float)[:axis]
+    margin = limits['joint_margin']
+    angles = np.asarray(angles, dtype=float)[:, :len(limit)]
+    problems = [(i, 'joints', 'no IK solution') for i in np.flatnonzero(np.isnan(angles).any(axis=1))]
+    with np.errstate(invalid='ignore'): # NaN rows compare False and are reported above
+        low, high = angles < limit[:, 0] + margin, angles > limit[:, 1] - margin
+    for i, j in zip(*np.nonzero(low | high)):
+        problems.append((i, 'joints', 'joint {} at {:.1f} deg, limits {:g} to {:g} less {:g}'.format(
+            j + 1, angles[i, j], limit[j, 0], limit[j, 1], margin)))
+    wrist = WRIST_JOINT.get(axis)
+    if wrist is not None:
+        folded = np.abs(angles[:, wrist]) % 180
+        clearance = np.minimum(folded, 180 - folded)
+        with np.errstate(invalid='ignore'):
+            near = clearance < limits['min_wrist']
+        for i in np.flatnonzero(near):
+            problems.append((i, 'wrist', 'joint {} at {:.1f} deg, within {:g} deg of the wrist singularity'.format(
+                wrist + 1, angles[i, wrist], limits['min_wrist'])))
+    return problems
+
+
+def check_plan(plan, ik=None, limits=None, axis=6): # Every violation of the plan, empty when it is safe to run
+    limits = dict(LIMIT_DEFAULTS, **(limits if limits is not None else plan.limits))
+    poses, labels = sample_poses(plan)
+    problems = [(i, 'reach', message) for i, message in check_reach(poses, limits)]
+    if ik is not None: # Without an arm only the envelope can be checked
+        solved = ik.solve_all(poses.tolist())
+        width = max((len(a) for a in solved if a is not None), default=axis)
+        angles = np.array([a if a is not None else [np.nan] * width for a in solved], dtype=float)
+        problems += check_joints(angles, limits, axis)
+    return [Violation(labels[i][0], labels[i][1], check, message) for i, check, message in sorted(problems, key=lambda p: p[0])]
+
+
+def format_violations(violations):
+    return '\n'.join('  {} {}: {}: {}'.format(v.leg, v.where, v.check, v.message) for v in violations)
+
+
+def main(argv=None):
+    from recipe import load_plan
+    parser = argparse.ArgumentParser(description='Check every pose of a recipe against the reach envelope, joint limits and wrist singularity')
+    parser.add_argument('recipe', help='recipe file')
+    parser.add_argument('--ip', help='arm to solve the joint angles on, the reach check alone without it')
+    args = parser.parse_args(argv)
+
+    plan = load_plan(args.recipe)
+    ik, axis = None, 6
+    if args.ip:
+        from xarm.wrapper import XArmAPI
+        arm = XArmAPI(args.ip)
+        ik, axis = IkCache.for_plan(arm, plan, args.recipe, ip=args.ip), getattr(arm, 'axis', None) or 6
+    violations = check_plan(plan, ik, axis=axis)
+    if violations:
+        print('{}: {} violations\n{}'.format(args.recipe, len(violations), format_violations(violations)))
+        return 1
+    print('{}: {} seal points ok'.format(args.recipe, len(plan.legs)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,206 @@
+# Product recipes for the sealing cell
+#
+# A recipe file (JSON, or TOML where tomllib is available) describes the fixture, the
+# seal points with their diameters, the speeds and the IO gates of one product. It is
+# validated and compiled once into a Plan with every circle pose and the visit order
+# worked out, and the Plan is cached on disk under the SHA-256 of the file contents.
+# Changing over to another product is a load_plan() call, and loading an unchanged
+# recipe skips compilation.
+
+import os
+import json
+import pickle
+import hashlib
+import threading
+from collections import namedtuple
+
+from tour import plan_tour
+
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
+
+try:
+    from pose_table import TABLE_VERSION, build_pose_table, map_pose_table, save_pose_table
+except ImportError: # No NumPy, circle poses are worked out one point at a time
+    build_pose_table = None
+
+PLAN_VERSION = 7 # Bump when the Plan layout changes so old cache files are ignored
+
+MOTION_DEFAULTS = {
+    'speed': 200, # Approach speed, in mm/s
+    'mvacc': 2000, # Approach acceleration, in mm/s^2
+    'circle_speed': 50, # Circle speed, in mm/s
+    'circle_acc': 100, # Circle acceleration, in mm/s^2
+    'reset_speed': 50, # Joint speed of the reset move, in deg/s
+    'reset_acc': 100, # Joint acceleration of the reset move, in deg/s^2
+    'blend_radius': 0, # Corner blend between queued moves, in mm
+    'optimize_order': True, # Let the tour planner pick the visit order
+    'servo_rate': 0, # Stream every leg in servo mode at this many Hz (100-250, needs NumPy), 0 leaves the timing to the controller
+    'joint_approach': False, # Run approaches as joint moves to cached IK solutions instead of straight lines
+    'joint_speed': 60, # Joint speed of those approaches, in deg/s
+    'joint_acc': 500, # Joint acceleration of those approaches, in deg/s^2
+}
+
+GATE_DEFAULTS = {'start': 0, 'sensor': 1, 'reset': 2, 'led': 8}
+
+Plan = namedtuple('Plan', ['name', 'digest', 'home', 'reset_angles', 'motion', 'gates', 'legs', 'poses', 'limits'])
+# poses: pose_table rows in leg order, memory-mapped from the cache, None without NumPy. limits: the recipe's "limits" section as written, defaults are up to the reader
+Leg = namedtuple('Leg', ['name', 'approach', 'pose1', 'pose2', 'percent', 'diameter',
+                         'speed', 'mvacc', 'circle_speed', 'circle_acc'])
+
+
+def circle_poses(diameter, starting_position): # Circle start on top, pose1 and pose2 across the diameter below it
+    radius = diameter / 2
+    center_x, center_y = starting_position[0], starting_position[1] - radius
+    pose1 = [center_x + radius, center_y] + list(starting_position[2:6])
+    pose2 = [center_x - radius, center_y] + list(starting_position[2:6])
+    return pose1, pose2
+
+
+def parse_recipe(data, path=''):
+    if path.endswith('.toml'):
+        if tomllib is None:
+            raise ValueError('recipe {}: TOML recipes need Python 3.11 or newer'.format(path))
+        return tomllib.loads(data.decode('utf-8'))
+    return json.loads(data.decode('utf-8'))
+
+
+def _check_pose(value, where, size=6):
+    if not isinstance(value, (list, tuple)) or len(value) != size or not all(isinstance(v, (int, float)) for v in value):
+        raise ValueError('{}: expected {} numbers, got {!r}'.format(where, size, value))
+
+
+def _is_number(value): # JSON true/false load as bool, which Python counts as an int
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _check_positive(section, key, where):
+    value = section.get(key)
+    if not _is_number(value) or value <= 0:
+        raise ValueError('{}.{}: expected a positive number, got {!r}'.format(where, key, value))
+
+
+def _check_section(recipe, key, path): # The section as a dict, {} when it is left out
+    section = recipe.get(key, {})
+    if not isinstance(section, dict):
+        raise ValueError('{}: {}: expected a table, got {!r}'.format(path, key, section))
+    return section
+
+
+def _check_limits(limits, path): # Numbers, joint_limits a [low, high] pair per joint
+    for key, value in limits.items():
+        if key == 'joint_limits':
+            if not isinstance(value, list) or not all(isinstance(pair, list) and len(pair) == 2 and all(_is_number(v) for v in pair) for pair in value):
+                raise ValueError('{}: limits.joint_limits: expected a [low, high] pair per joint, got {!r}'.format(path, value))
+        elif not _is_number(value):
+            raise ValueError('{}: limits.{}: expected a number, got {!r}'.format(path, key, value))
+
+
+def validate_recipe(recipe, path='recipe'): # Raises ValueError naming the first bad field
+    if not isinstance(recipe, dict):
+        raise ValueError('{}: expected an object at the top level'.format(path))
+    fixture = _check_section(recipe, 'fixture', path)
+    _check_pose(fixture.get('home'), '{}: fixture.home'.format(path))
+    _check_pose(fixture.get('reset_angles'), '{}: fixture.reset_angles'.format(path)) # Every cycle ends with the reset move
+    unknown = sorted(set(_check_section(recipe, 'motion', path)) - set(MOTION_DEFAULTS))
+    if unknown: # A misspelt key would silently run at the default
+        raise ValueError('{}: motion.{}: unknown setting, expected one of {}'.format(path, unknown[0], ', '.join(MOTION_DEFAULTS)))
+    motion = dict(MOTION_DEFAULTS, **recipe.get('motion', {}))
+    for key in ('speed', 'mvacc', 'circle_speed', 'circle_acc', 'reset_speed', 'reset_acc', 'joint_speed', 'joint_acc'):
+        _check_positive(motion, key, '{}: motion'.format(path))
+    rate = motion['servo_rate']
+    if not _is_number(rate) or not (rate == 0 or 100 <= rate <= 250):
+        raise ValueError('{}: motion.servo_rate: expected 0 or 100-250 Hz, got {!r}'.format(path, rate))
+    radius = motion['blend_radius']
+    if radius is not None and (not _is_number(radius) or radius < 0):
+        raise ValueError('{}: motion.blend_radius: expected a number of mm, 0 or more, got {!r}'.format(path, radius))
+    for key in ('optimize_order', 'joint_approach'):
+        if not isinstance(motion[key], bool):
+            raise ValueError('{}: motion.{}: expected true or false, got {!r}'.format(path, key, motion[key]))
+    gates = dict(GATE_DEFAULTS, **_check_section(recipe, 'gates', path))
+    for key, io in gates.items():
+        if not isinstance(io, int) or isinstance(io, bool) or not 0 <= io <= 15:
+            raise ValueError('{}: gates.{}: expected an IO number 0-15, got {!r}'.format(path, key, io))
+    _check_limits(_check_section(recipe, 'limits', path), path)
+    points = recipe.get('seal_points')
+    if not isinstance(points, list) or not points:
+        raise ValueError('{}: seal_points: expected a non-empty list'.format(path))
+    names = set()
+    for i, point in enumerate(points):
+        where = '{}: seal_points[{}]'.format(path, i)
+        if not isinstance(point, dict):
+            raise ValueError('{}: expected an object with position and diameter, got {!r}'.format(where, point))
+        _check_pose(point.get('position'), where + '.position')
+        if 'approach' in point:
+            _check_pose(point['approach'], where + '.approach')
+        _check_positive(point, 'diameter', where)
+        for key in ('speed', 'mvacc', 'circle_speed', 'circle_acc'):
+            if key in point:
+                _check_positive(point, key, where)
+        percent = point.get('percent', 100)
+        if not isinstance(percent, (int, float)) or not 0 < percent <= 100:
+            raise ValueError('{}.percent: expected 0 < percent <= 100, got {!r}'.format(where, percent))
+        name = point.get('name', 'Pin{}'.format(i + 1))
+        if name in names:
+            raise ValueError('{}.name: duplicate seal point {!r}'.format(where, name))
+        names.add(name)
+    return recipe
+
+
+def compile_recipe(recipe, digest=''):
+    fixture = recipe['fixture']
+    motion = dict(MOTION_DEFAULTS, **recipe.get('motion', {}))
+    gates = dict(GATE_DEFAULTS, **recipe.get('gates', {}))
+    points = recipe['seal_points']
+    poses = None
+    if build_pose_table is not None: # Every circle of the recipe in one pass
+        poses = build_pose_table([point['position'] for point in points], [point['diameter'] for point in points],
+                                 [point.get('approach', point['position']) for point in points],
+                                 [point.get('percent', 100) for point in points])
+        rows = poses.tolist()
+        geometry = [(row[0:6], row[12:18], row[18:24]) for row in rows] # approach, pose1, pose2, see pose_table's columns
+    else:
+        geometry = [(list(point.get('approach', point['position'])),) + circle_poses(point['diameter'], list(point['position'])) for point in points]
+    legs = []
+    for i, (point, (approach, pose1, pose2)) in enumerate(zip(points, geometry)):
+        legs.append(Leg(point.get('name', 'Pin{}'.format(i + 1)), approach, pose1, pose2,
+                        point.get('percent', 100), point['diameter'],
+                        point.get('speed', motion['speed']), point.get('mvacc', motion['mvacc']),
+                        point.get('circle_speed', motion['circle_speed']), point.get('circle_acc', motion['circle_acc'])))
+    if motion['optimize_order']:
+        order = plan_tour([leg.approach for leg in legs], fixture['home'], motion['speed'], motion['mvacc'])
+        legs = [legs[i] for i in order]
+        poses = None if poses is None else poses[order]
+    return Plan(recipe.get('name', ''), digest, list(fixture['home']), fixture['reset_angles'], motion, gates, legs, poses,
+                dict(recipe.get('limits', {})))
+
+
+def default_cache_dir(path):
+    return os.path.join(os.path.dirname(os.path.abspath(path)), '.plan_cache')
+
+
+def load_plan(path, cache_dir=None): # Compiled plan for a recipe file, from the cache when the contents are unchanged
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    cache_dir = cache_dir or default_cache_dir(path)
+    cache_path = os.path.join(cache_dir, '{}.v{}.plan'.format(digest, PLAN_VERSION))
+    table_path = None if build_pose_table is None else os.path.join(cache_dir, '{}.v{}.poses.npy'.format(digest, TABLE_VERSION))
+    try:
+        with open(cache_path, 'rb') as f:
+            plan = pickle.load(f)
+        return plan if table_path is None else plan._replace(poses=map_pose_table(table_path)) # The table is mapped, not unpickled
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        pass
+    recipe = validate_recipe(parse_recipe(data, path), path)
+    plan = compile_recipe(recipe, digest)
+    os.makedirs(cache_dir, exist_ok=True)
+    if table_path is not None:
+        save_pose_table(table_path, plan.poses) # Before the plan, a cached plan always has its table
+    tmp_path = '{}.{}.{}.tmp'.format(cache_path, os.getpid(), threading.get_ident()) # Stations in one process may compile the same recipe at once
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(plan._replace(poses=None), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path) # Readers never see a half-written plan
+    return plan if table_path is None else plan._replace(poses=map_pose_table(table_path))
@@ -0,0 +1,151 @@
+# Per-method round trip statistics for an XArmAPI object
+#
+# instrument(arm) returns the arm unchanged unless XARM_RPC_STATS is set in the
+# environment, in which case it returns an RpcStats proxy that times every SDK method
+# call: call count, latency histogram and return codes per method. Attribute reads that
+# are not calls (state, connected, cmd_num, cgpio_states, ...) pass straight through.
+#
+# Everything a method needs is allocated the first time it is called: one list of
+# histogram buckets, one list of return code slots and the wrapper itself, which is then
+# cached on the proxy so later calls skip __getattr__. A call only bumps list slots.
+# The summary is printed at exit and whenever the process gets SIGUSR1, so a running
+# cell can be asked for numbers without stopping it:  kill -USR1 <pid>
+
+import os
+import sys
+import time
+import atexit
+import signal
+import bisect
+import threading
+
+ENV_VAR = 'XARM_RPC_STATS'
+
+BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0) # Upper bucket edges, in seconds, plus one overflow bucket
+MIN_CODE, MAX_CODE = -16, 127 # Return codes with their own slot, anything else counts as other
+
+
+class MethodStats:
+    __slots__ = ('name', 'lock', 'calls', 'total', 'max', 'buckets', 'codes', 'other_codes')
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.codes = [0] * (MAX_CODE - MIN_CODE + 1)
+        self.other_codes = 0
+
+    def record(self, elapsed, code):
+        with self.lock:
+            self.calls += 1
+            self.total += elapsed
+            if elapsed > self.max:
+                self.max = elapsed
+            self.buckets[bisect.bisect_left(BUCKETS, elapsed)] += 1
+            if code is not None:
+                if MIN_CODE <= code <= MAX_CODE:
+                    self.codes[code - MIN_CODE] += 1
+                else:
+                    self.other_codes += 1
+
+    def percentile(self, fraction): # Upper edge of the bucket holding that fraction of the calls
+        target = fraction * self.calls
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= target:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return 0.0
+
+    def code_counts(self):
+        counts = {MIN_CODE + i: n for i, n in enumerate(self.codes) if n}
+        if self.other_codes:
+            counts['other'] = self.other_codes
+        return counts
+
+
+def _return_code(result): # SDK methods return code or (code, value); anything else has no code
+    if type(result) is int:
+        return result
+    if type(result) is tuple and result and type(result[0]) is int:
+        return result[0]
+    return None
+
+
+class RpcStats:
+    def __init__(self, arm, label=''):
+        self.__dict__['_arm'] = arm # Set directly, __setattr__ forwards to the arm
+        self.__dict__['_label'] = label # Which arm, when one process drives several
+        self.__dict__['_stats'] = {}
+        self.__dict__['_started'] = time.monotonic()
+
+    def __getattr__(self, name):
+        value = getattr(self._arm, name)
+        if name.startswith('_') or not callable(value):
+            return value
+        stats = self._stats.setdefault(name, MethodStats(name))
+        perf_counter, record = time.perf_counter, stats.record
+        def timed(*args, **kwargs):
+            t1 = perf_counter()
+            result = value(*args, **kwargs)
+            record(perf_counter() - t1, _return_code(result))
+            return result
+        timed.__name__ = name
+        self.__dict__[name] = timed
+        return timed
+
+    def __setattr__(self, name, value):
+        setattr(self._arm, name, value)
+
+    @property
+    def wrapped(self): # The XArmAPI itself, XArmAPI already has an arm property of its own
+        return self._arm
+
+    def summary(self):
+        uptime = time.monotonic() - self._started
+        rows = sorted(self._stats.values(), key=lambda s: s.total, reverse=True)
+        total_calls = sum(s.calls for s in rows)
+        lines = ['xArm RPC stats{}: {} calls in {:.1f}s ({:.1f}/s)'.format(' ' + self._label if self._label else '', total_calls, uptime, total_calls / uptime if uptime else 0),
+                 '{:<32} {:>8} {:>8} {:>9} {:>9} {:>9} {:>9}  {}'.format('method', 'calls', 'per s', 'mean ms', 'p50 ms', 'p99 ms', 'max ms', 'codes')]
+        for s in rows:
+            if not s.calls:
+                continue
+            lines.append('{:<32} {:>8} {:>8.1f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f}  {}'.format(
+                s.name, s.calls, s.calls / uptime if uptime else 0, 1000 * s.total / s.calls,
+                1000 * s.percentile(0.5), 1000 * s.percentile(0.99), 1000 * s.max,
+                ' '.join('{}:{}'.format(code, n) for code, n in s.code_counts().items())))
+        return '\n'.join(lines)
+
+    def dump(self, file=None):
+        print(self.summary(), file=file or sys.stderr)
+
+
+_installed = [] # Every proxy install() made, one exit/signal handler dumps them all
+
+
+def dump_all(file=None):
+    for proxy in list(_installed):
+        proxy.dump(file)
+
+
+def install(arm, label='', at_exit=True, signum=getattr(signal, 'SIGUSR1', None)): # Wrap arm and dump the summary at exit and on signum
+    proxy = RpcStats(arm, label)
+    if not _installed:
+        if at_exit:
+            atexit.register(dump_all)
+        if signum is not None:
+            try:
+                signal.signal(signum, lambda signum, frame: dump_all())
+            except ValueError: # Not the main thread, only the exit dump then
+                pass
+    _installed.append(proxy)
+    return proxy
+
+
+def instrument(arm, label=''): # Opt-in: wrapped only when XARM_RPC_STATS is set to something other than 0
+    if os.environ.get(ENV_VAR, '0') in ('', '0'):
+        return arm
+    return install(arm, label)
@@ -0,0 +1,135 @@
+# Structured run log with a background writer
+#
+# log(event, **fields) only stamps the time and appends a tuple to an in-memory ring
+# buffer (a bounded deque, whose append is atomic and takes no lock), so a call from the
+# motion path costs about a microsecond and never waits on a slow console. A writer
+# thread drains the buffer every flush_interval and emits one JSON line per record to
+# the console and, when XARM_RUNLOG names a file, appends the same lines there.
+#
+# When the writer falls behind by more than capacity records the oldest ones are
+# dropped rather than blocking the caller; the next write reports how many.
+#
+#   from runlog import log
+#   log('circle_queued', pin=3, diameter=100)
+#   {"time": "2026-10-18 09:30:12.418", "event": "circle_queued", "pin": 3, "diameter": 100}
+
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+from collections import deque
+
+
+class RunLog:
+    def __init__(self, stream=None, path=None, capacity=4096, flush_interval=0.2):
+        self.stream = stream # Text stream for the console copy, or a function returning it, None for none
+        self.path = path # JSON lines file, appended to, None for none
+        self.capacity = capacity
+        self.flush_interval = flush_interval # Longest a record waits in the buffer, in seconds
+        self._buffer = deque(maxlen=capacity)
+        self._drain_lock = threading.Lock() # Writer thread and flush() only, log() never takes it
+        self._wake = threading.Event()
+        self._file = None
+        self._thread = None
+        self.dropped = 0 # Records pushed out of the full buffer before they were written
+        self.alive = False
+
+    def log(self, event, **fields): # Hot path: no formatting, no IO, no lock
+        if len(self._buffer) == self.capacity:
+            self.dropped += 1
+        self._buffer.append((time.time(), event, fields))
+
+    def start(self):
+        if self.path:
+            self._file = open(self.path, 'a')
+        self.alive = True
+        self._thread = threading.Thread(target=self._writer_thread, name='runlog', daemon=True)
+        self._thread.start()
+        return self
+
+    def flush(self): # Write out everything logged so far, from the calling thread
+        with self._drain_lock:
+            lines = []
+            dropped, self.dropped = self.dropped, 0
+            if dropped:
+                lines.append(self._format((time.time(), 'runlog_dropped', {'count': dropped})))
+            while True:
+                try:
+                    lines.append(self._format(self._buffer.popleft()))
+                except IndexError:
+                    break
+            if not lines:
+                return
+            text = ''.join(lines)
+            stream = self.stream() if callable(self.stream) else self.stream
+            if stream is not None:
+                stream.write(text)
+                stream.flush()
+            if self._file is not None:
+                self._file.write(text)
+                self._file.flush()
+
+    def close(self):
+        self.alive = False
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @staticmethod
+    def _format(record):
+        timestamp, event, fields = record
+        line = {'time': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp)) + '.{:03d}'.format(int(timestamp % 1 * 1000)),
+                'event': event}
+        line.update(fields)
+        return json.dumps(line, default=repr) + '\n' # Anything JSON cannot hold is written as its repr()
+
+    def _writer_thread(self):
+        while self.alive:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e: # A broken console must not take the writer down with it
+                self._buffer.append((time.time(), 'runlog_error', {'error': repr(e)}))
+                time.sleep(self.flush_interval)
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def _close_default():
+    if _default is not None:
+        _default.close()
+
+
+def configure(stream=lambda: sys.stdout, path=None, **kwargs): # Replace the process-wide log, e.g. configure(stream=None) for file only
+    global _default
+    with _default_lock:
+        previous, _default = _default, RunLog(stream, path or os.environ.get('XARM_RUNLOG') or None, **kwargs).start()
+        if previous is None:
+            atexit.register(_close_default)
+    if previous is not None:
+        previous.close()
+    return _default
+
+
+def get_log(): # The process-wide log, started on first use: whatever sys.stdout is at write time, plus XARM_RUNLOG when set
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = RunLog(lambda: sys.stdout, os.environ.get('XARM_RUNLOG') or None).start()
+                atexit.register(_close_default)
+    return _default
+
+
+def log(event, **fields):
+    (_default or get_log()).log(event, **fields)
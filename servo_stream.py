@@ -0,0 +1,155 @@
+# Servo-mode contour streaming for the seal beads
+#
+# Instead of handing the controller one move_circle() and letting it own the timing,
+# the whole leg (approach line, then the circle) is sampled into a NumPy waypoint buffer
+# up front and streamed with set_servo_cartesian() in servo mode (set_mode(1)) at a fixed
+# rate. The buffer is time-parametrized so the tool runs at the circle speed all along
+# the bead and at the approach speed on the way there, accelerating at mvacc and
+# circle_acc in between. Where the approach meets the circle at an angle, the speed
+# through the corner is capped by how sharp it is; the setpoints stay on the path, so
+# nothing overshoots the corner.
+#
+# The streaming loop is drift-free: setpoint k is due at t0 + k / rate whatever the
+# previous sends cost, a late send is not pushed onto the ones after it. Sends that miss
+# their slot by more than a whole period are counted.
+#
+#   streamer = ServoStreamer(arm, rate=200).enter()   # arm at rest, mode 0 moves finished
+#   buffers = streamer.prepare(plan.legs, start)      # one (n, 6) array per leg
+#   result = streamer.stream(buffers[0])              # StreamResult(code, sent, missed, max_late)
+#   streamer.leave()                                  # back to position mode before any mode 0 move
+#
+# A stream cut short (the input monitor stopped the arm) left the arm on setpoint
+# result.sent - 1. bead_length() tells how far along the circle that was.
+
+import time
+from collections import namedtuple
+
+import numpy as np
+
+StreamResult = namedtuple('StreamResult', ['code', 'sent', 'missed', 'max_late'])
+
+MIN_RATE, MAX_RATE = 100, 250 # Setpoint rates the controller's servo mode is happy with, in Hz
+
+
+def line_points(a, b, step): # (n, 3) points from a to b, at most step mm apart, both ends included
+    a, b = np.asarray(a[:3], dtype=float), np.asarray(b[:3], dtype=float)
+    n = max(int(np.ceil(np.linalg.norm(b - a) / step)), 1)
+    return a + np.linspace(0.0, 1.0, n + 1)[:, None] * (b - a)
+
+
+def arc_points(start, pose1, pose2, percent, step): # (n, 3) points of a move_circle from start through pose1 and pose2
+    start, p1, p2 = (np.asarray(p[:3], dtype=float) for p in (start, pose1, pose2))
+    a, b = p1 - start, p2 - start
+    normal = np.cross(a, b)
+    nn = normal.dot(normal)
+    if nn < 1e-12: # Collinear, the controller would refuse it, same fallback as xarm_sim.circle_path
+        return line_points(start, p2, step)
+    center = start + np.cross(a.dot(a) * b - b.dot(b) * a, normal) / (2 * nn)
+    v = start - center
+    radius = np.linalg.norm(v)
+    w = np.cross(normal / np.sqrt(nn), v)
+    angle = 2 * np.pi * percent / 100
+    n = max(int(np.ceil(radius * angle / step)), 1)
+    theta = np.linspace(0.0, angle, n + 1)[:, None]
+    return center + v * np.cos(theta) + w * np.sin(theta)
+
+
+def time_parametrize(points, vmax, acc, rate): # Resample a path at rate Hz under per-point speed and acceleration limits
+    ds = np.linalg.norm(np.diff(points, axis=0), axis=1)
+    s = np.concatenate(([0.0], np.cumsum(ds)))
+    if s[-1] <= 0:
+        return points[:1].copy()
+    # Fastest speed at every point: v[i]^2 <= v[i-1]^2 + 2 a ds, from rest at both ends.
+    # With W the running sum of 2 a ds this is a running minimum, no Python loop needed.
+    w = np.concatenate(([0.0], 2 * acc[1:] * ds))
+    forward = np.cumsum(w)
+    v2 = np.minimum.accumulate(np.concatenate(([0.0], vmax[1:] ** 2)) - forward) + forward
+    backward = np.cumsum(np.concatenate(([0.0], 2 * acc[-2::-1] * ds[::-1])))
+    v2b = (np.minimum.accumulate(np.concatenate(([0.0], vmax[-2::-1] ** 2)) - backward) + backward)[::-1]
+    v = np.sqrt(np.maximum(np.minimum(v2, v2b), 0.0))
+    # Constant acceleration across a segment, but never slower than speeding up and braking within it: a
+    # stub of a line into a sharp corner (a resumed arc starting where the arm stopped) is capped near 0 at both ends
+    dt = np.minimum(ds / np.maximum((v[1:] + v[:-1]) / 2, 1e-9), 2 * np.sqrt(ds / acc[1:]))
+    t = np.concatenate(([0.0], np.cumsum(dt)))
+    ticks = np.arange(0.0, t[-1], 1.0 / rate)
+    s_ticks = np.append(np.interp(ticks, t, s), s[-1]) # Always end exactly on the last point
+    return np.column_stack([np.interp(s_ticks, s, points[:, i]) for i in range(3)])
+
+
+def corner_speed(a, b, c, speed): # Speed through b on the way a -> b -> c, full speed when the path goes straight on
+    u, v = b - a, c - b
+    norms = np.linalg.norm(u) * np.linalg.norm(v)
+    if norms == 0:
+        return speed
+    return speed * max(0.0, (1 + u.dot(v) / norms) / 2)
+
+
+def leg_waypoints(start, leg, rate, step=0.5): # (n, 6) setpoints for one leg: approach line, then the circle
+    line = line_points(start, leg.approach, step)
+    arc = arc_points(leg.approach, leg.pose1, leg.pose2, leg.percent, step)
+    points = np.concatenate((line, arc[1:]))
+    vmax = np.concatenate((np.full(len(line), float(leg.speed)), np.full(len(arc) - 1, float(leg.circle_speed))))
+    acc = np.concatenate((np.full(len(line), float(leg.mvacc)), np.full(len(arc) - 1, float(leg.circle_acc))))
+    if len(line) > 1 and len(arc) > 1:
+        vmax[len(line) - 1] = corner_speed(line[-2], line[-1], arc[1], min(leg.speed, leg.circle_speed))
+    xyz = time_parametrize(points, vmax, acc, rate)
+    waypoints = np.empty((len(xyz), 6))
+    waypoints[:, :3] = xyz
+    waypoints[:, 3:] = leg.approach[3:6] # Orientation is held, every seal point is square to the part
+    return waypoints
+
+
+def bead_length(waypoints, sent, approach): # mm of the circle run by the first sent setpoints of a leg buffer, 0 while on the approach
+    if sent < 2:
+        return 0.0
+    rows = np.asarray(waypoints[:sent, :3], dtype=float)
+    travelled = np.linalg.norm(np.diff(rows, axis=0), axis=1).sum() # Setpoints a fraction of a mm apart, chords are as good as the path
+    return max(travelled - np.linalg.norm(np.asarray(approach[:3], dtype=float) - rows[0]), 0.0)
+
+
+class ServoStreamer:
+    def __init__(self, arm, rate=200):
+        if not MIN_RATE <= rate <= MAX_RATE:
+            raise ValueError('servo rate: expected {}-{} Hz, got {!r}'.format(MIN_RATE, MAX_RATE, rate))
+        self.arm = arm
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.missed = 0 # Sends that missed their slot by more than a period, over every stream
+
+    def enter(self): # Servo mode, only once every queued mode 0 move has finished
+        self.arm.set_mode(1)
+        self.arm.set_state(0)
+        return self
+
+    def leave(self):
+        self.arm.set_mode(0)
+        self.arm.set_state(0)
+
+    def prepare(self, legs, start): # One buffer per leg, each starting where the previous one ends
+        buffers = []
+        for leg in legs:
+            buffer = leg_waypoints(start, leg, self.rate)
+            buffers.append(buffer)
+            start = buffer[-1]
+        return buffers
+
+    def stream(self, waypoints):
+        rows = waypoints.tolist() # One conversion up front, nothing but the send inside the loop
+        sent, missed, max_late = 0, 0, 0.0
+        t0 = time.perf_counter()
+        for k, pose in enumerate(rows):
+            deadline = t0 + k * self.period
+            late = time.perf_counter() - deadline
+            if late < 0:
+                time.sleep(-late)
+            else:
+                max_late = max(max_late, late)
+                if late > self.period:
+                    missed += 1
+            code = self.arm.set_servo_cartesian(pose, is_radian=False)
+            if code != 0:
+                self.missed += missed
+                return StreamResult(code, sent, missed, max_late)
+            sent += 1
+        self.missed += missed
+        return StreamResult(0, sent, missed, max_late)
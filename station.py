@@ -0,0 +1,369 @@
+# One sealing cell: an arm, its recipe, its GPIO event stream and its state machine
+#
+# Everything cinchseal_new.py used to keep in module globals lives on a Station, so one
+# process can host several cells (see supervisor.py). A station only ever blocks on its
+# own inputs and its own arm, a slow sensor on one cell never holds up another.
+#
+#   WAITING_START -> SEALING -> WAITING_RESET -> RESETTING -> WAITING_START ...
+#
+# A reset press while sealing stops the arm at once (input_monitor.py) and skips straight
+# to RESETTING. A potting sensor fault while sealing stops it the same way, and sealing
+# carries on from where it stopped once the sensor is back. Any exception leaves the
+# station in FAULT until it is run again.
+#
+# With a checkpoint journal, every seal point is recorded once the controller has
+# finished its circle. A part left unfinished by a reset, a fault or a restart is offered
+# to on_resume at the next start press, and resuming skips the points already sealed.
+# A circle the arm stopped part way round is journalled with how far it got (from the
+# TCP position, or from the setpoints a servo stream had sent) and resumes with only the
+# rest of its arc. One the arm had finished, or all but finished, counts as sealed even
+# if no report said so before the stop.
+#
+# A recipe is checked pose by pose (preflight.py) the first time it is loaded, before it
+# moves the arm. Recipes with joint_approach run every approach as a joint move, to
+# angles solved once per recipe, arm and TCP offset and kept in the IK cache (ik_cache.py).
+
+import time
+
+from arc_resume import MIN_ARC, MIN_LINE, arc_end, arc_length, arc_progress, line_progress, remaining_arc
+from cgpio import GpioEventBus
+from checkpoint import Checkpoint
+from ik_cache import IkCache
+from indicator import Indicator, OFF, STEADY, SLOW_BLINK
+from input_monitor import InputMonitor
+from motion import MotionPipeline
+from motion_time import trapezoid_time
+from recipe import load_plan
+from runlog import log
+from rpc_stats import instrument
+
+try:
+    from preflight import check_plan, format_violations
+except ImportError: # No NumPy, recipes run unchecked
+    check_plan = None
+
+CONNECTING = 'connecting'
+WAITING_START = 'waiting_start'
+SEALING = 'sealing'
+WAITING_RESET = 'waiting_reset'
+RESETTING = 'resetting'
+STOPPED = 'stopped'
+FAULT = 'fault'
+
+
+def _xarm_api(ip):
+    from xarm.wrapper import XArmAPI
+    return XArmAPI(ip)
+
+
+class Station:
+    def __init__(self, name, ip, recipe_path, arm_factory=_xarm_api, on_state=None, journal_path=None, on_resume=None):
+        self.name = name
+        self.ip = ip
+        self.recipe_path = recipe_path
+        self._arm_factory = arm_factory # ip -> XArmAPI, swapped for xarm_sim in tests
+        self._on_state = on_state # Called as on_state(station, state) on every transition
+        self.journal = Checkpoint(journal_path) if journal_path else None # Seal points done on the current part, survives a restart
+        self._on_resume = on_resume # Called as on_resume(station, sealed) for an unfinished part, True skips the sealed points
+        self.arm = None
+        self.gpio = None
+        self.motion = None
+        self.plan = None
+        self.approach_angles = {} # leg name -> joint angles of its approach, filled for joint_approach recipes
+        self._ik = None # IK cache of the loaded recipe on this arm
+        self._checked_digest = None # Recipe content that passed the pre-flight check
+        self.led = None
+        self.monitor = None
+        self.sealed = [] # Seal points done on the part in progress
+        self.arcs = {} # Seal points of the part in progress stopped part way round their circle -> percent done
+        self.state = STOPPED
+        self.alive = False
+        self.cycles = 0
+        self.last_cycle_time = None # Start press to back at rest, in seconds
+        self.error = None
+
+    def _set_state(self, state):
+        self.state = state
+        if self._on_state is not None:
+            self._on_state(self, state)
+
+    def connect(self):
+        self._set_state(CONNECTING)
+        self.arm = instrument(self._arm_factory(self.ip), self.name)
+        self.arm.motion_enable(enable=True)
+        self.arm.set_mode(0)
+        self.arm.set_state(state=0)
+        self.gpio = GpioEventBus(self.arm).start() # Publishes debounced edges for all controller inputs, shared by every wait below
+        self.plan = load_plan(self.recipe_path) # Seal points, speeds and IO gates, compiled once and cached by content hash
+        self.motion = MotionPipeline(self.arm) # Keeps the next approach and circle queued in the controller
+        self.motion.on_done = self._leg_done # A leg is sealed (and journalled) once the controller has finished its circle
+        self.led = Indicator(self.arm, self.plan.gates['led']).start() # Blinks on its own thread, only writes the output when it changes
+        self.monitor = InputMonitor(self.arm, self._trips(), gpio=self.gpio).start() # Stops the arm on the first sample of a reset press or a sensor fault
+        self.alive = True
+        return self
+
+    def close(self):
+        self.stop()
+        if self.monitor is not None:
+            self.monitor.stop()
+        if self.led is not None:
+            self.led.stop()
+        if self.journal is not None:
+            self.journal.close()
+        if self.arm is not None and hasattr(self.arm, 'disconnect'):
+            self.arm.disconnect()
+
+    def stop(self): # Ends run() at the next wait, moves already queued still finish
+        self.alive = False
+        if self.gpio is not None:
+            self.gpio.stop()
+        if self.state != FAULT:
+            self._set_state(STOPPED)
+
+    def load_recipe(self): # Reload the recipe so a changeover only needs a new file, cached plans load without recompiling
+        self.plan = load_plan(self.recipe_path)
+        self.motion.configure(self.plan.motion)
+        self.monitor.trips = self._trips()
+        if check_plan is not None and self._checked_digest != self.plan.digest:
+            self._preflight()
+        self.approach_angles = self._solve_approaches() if self.plan.motion['joint_approach'] else {}
+
+    def _ik_cache(self): # One IK cache per recipe content, shared by the pre-flight check and the approaches
+        if self._ik is None or self._ik.arm is not self.arm or self._ik.digest != self.plan.digest: # New recipe, or reconnected
+            self._ik = IkCache.for_plan(self.arm, self.plan, self.recipe_path, ip=self.ip)
+        return self._ik
+
+    def _preflight(self): # Every pose of a new recipe checked before it moves the arm, all problems in one error
+        violations = check_plan(self.plan, self._ik_cache(), axis=getattr(self.arm, 'axis', None) or 6)
+        if violations:
+            raise ValueError('{}: {}: {} pre-flight violations\n{}'.format(self.name, self.recipe_path, len(violations), format_violations(violations)))
+        self._checked_digest = self.plan.digest
+
+    def _solve_approaches(self): # Joint angles of every approach, from the IK cache, so sealing makes no IK round trips
+        ik = self._ik_cache()
+        solved = ik.solved
+        angles = ik.solve_all([self.plan.home] + [leg.approach for leg in self.plan.legs])[1:] # Unwrapped from home onwards
+        if ik.solved > solved:
+            log('ik_solved', station=self.name, poses=ik.solved - solved, cache=ik.path)
+        return {leg.name: a for leg, a in zip(self.plan.legs, angles) if a is not None} # No solution: that leg keeps its linear approach
+
+    def initialize(self): # Turn off the LED and move to the starting position
+        self.load_recipe()
+        self.led.show(OFF)
+        self.arm.set_position(*self.plan.home, speed=self.plan.motion['speed'], is_radian=False, wait=True)
+
+    def _trips(self): # Inputs that stop the arm mid-motion: reset pressed, potting sensor off
+        return {self.plan.gates['reset']: 1, self.plan.gates['sensor']: 0}
+
+    def _clear_stop(self): # Out of the stop state the input monitor left the controller in
+        if self.monitor.tripped is not None:
+            self.arm.set_state(state=0)
+            self.monitor.tripped = None
+
+    def reset_position(self): # Bring the arm back after the reset button is pressed
+        self._set_state(RESETTING)
+        self._clear_stop()
+        self.arm.set_servo_angle(angle=self.plan.reset_angles, speed=self.plan.motion['reset_speed'], mvacc=self.plan.motion['reset_acc'], wait=True)
+
+    def wait_for_start(self): # Block until the start button is pressed, False if the station was stopped
+        self._set_state(WAITING_START)
+        return self.gpio.wait_for(self.plan.gates['start'], 1)
+
+    def wait_for_sensor(self, sensor): # Blink the LED while the sequence is held on the potting sensor
+        self.led.show(SLOW_BLINK)
+        ok = self.gpio.wait_for(sensor, 1)
+        self.led.show(STEADY)
+        return ok
+
+    def resume_point(self): # (seal points to skip, {seal point: percent of its circle done}), empty unless an unfinished part is resumed
+        if self.journal is None:
+            return [], {}
+        sealed = self.journal.pending(self.plan.digest)
+        arcs = self.journal.arcs(self.plan.digest)
+        if (sealed or arcs) and self._on_resume is not None and self._on_resume(self, sealed):
+            return sealed, arcs
+        return [], {}
+
+    def _rest_of(self, leg, done): # The leg with its circle cut down to the arc not sealed yet
+        start, pose1, pose2, percent = remaining_arc(leg.approach, leg.pose1, leg.pose2, leg.percent, done)
+        return leg._replace(approach=start, pose1=pose1, pose2=pose2, percent=percent)
+
+    def _leg_done(self, name):
+        self.sealed.append(name)
+        self.arcs.pop(name, None)
+        if self.journal is not None:
+            self.journal.done(name)
+
+    def _note_partial(self, leg, done): # Journal how far round its circle a stopped leg got
+        self.arcs[leg.name] = done
+        if self.journal is not None:
+            self.journal.partial(leg.name, done)
+        log('arc_partial', station=self.name, leg=leg.name, done=round(done, 1))
+
+    def _record_partial(self, approached): # The arm stopped short: note how far round its circle the first unsealed leg got
+        # approached: leg name -> command number of its approach, for the legs queued this pass
+        unsealed = [leg for leg in self.plan.legs if leg.name not in self.sealed]
+        if not unsealed or unsealed[0].percent > 100: # More than one turn cannot be told apart from the position
+            return
+        leg = unsealed[0]
+        code, position = self.arm.get_position(is_radian=False)
+        if code != 0:
+            return
+        # Its approach reported finished before the stop: the circle had begun, at the latest when that report came in
+        started = leg.name in approached and self.motion.finished >= approached[leg.name]
+        done = arc_progress(position, leg.approach, leg.pose1, leg.pose2) # Against the recipe's circle, also for a resumed leg
+        if done is None: # Off the circle: still on the approach, or already on the way to the next leg
+            left = None
+            if len(unsealed) > 1 and unsealed[1].name not in self.approach_angles: # A joint approach has no line to be on
+                left = line_progress(position, arc_end(leg.approach, leg.pose1, leg.pose2, leg.percent), unsealed[1].approach)
+            finished = started or (left is not None and left >= MIN_LINE)
+        elif leg.percent >= 100 - MIN_ARC and (done < MIN_ARC or done >= leg.percent - MIN_ARC): # At the start of a full circle, or its end
+            rest = arc_length(leg.approach, leg.pose1, leg.pose2, leg.percent - self.arcs.get(leg.name, 0))
+            finished = started and time.monotonic() - self.motion.finished_at > trapezoid_time(rest, leg.circle_speed, leg.circle_acc) / 2
+        else:
+            finished = done >= leg.percent - MIN_ARC # All but the last sliver counts as sealed
+        if finished:
+            self._leg_done(leg.name)
+            log('arc_finished', station=self.name, leg=leg.name)
+        elif done is not None and done >= MIN_ARC:
+            self._note_partial(leg, done)
+
+    def _dropped_queue(self): # The controller stopped with legs still queued, and not on one of our inputs
+        raise RuntimeError('{}: the controller dropped the queued legs (state {}, error {})'.format(self.name, self.arm.state, self.arm.error_code))
+
+    def _servo_streamer(self, legs): # (streamer, one setpoint buffer per leg) when the recipe streams in servo mode, else (None, legs)
+        rate = self.plan.motion['servo_rate']
+        if not rate:
+            return None, legs
+        from servo_stream import ServoStreamer # NumPy is only needed by recipes that stream
+        streamer = ServoStreamer(self.arm, rate)
+        code, start = self.arm.get_position(is_radian=False)
+        if code != 0:
+            raise RuntimeError('{}: get_position failed with code {}'.format(self.name, code))
+        buffers = streamer.prepare(legs, start) # Every leg sampled before the first setpoint goes out
+        return streamer.enter(), buffers
+
+    def _record_streamed(self, leg, buffer, sent): # The stream was cut short: note how far round its circle the leg got
+        from servo_stream import bead_length
+        whole = next(whole for whole in self.plan.legs if whole.name == leg.name) # leg may be a resumed one, cut down to its rest
+        turn = arc_length(leg.approach, leg.pose1, leg.pose2, 100)
+        done = self.arcs.get(leg.name, 0) + float(bead_length(buffer, sent, leg.approach)) / turn * 100
+        if done >= whole.percent - MIN_ARC:
+            self._leg_done(leg.name)
+            log('arc_finished', station=self.name, leg=leg.name)
+        elif done >= MIN_ARC and done > self.arcs.get(leg.name, 0):
+            self._note_partial(leg, done)
+
+    def _stream_leg(self, streamer, leg, buffer): # False if the input monitor stopped the arm part way
+        result = streamer.stream(buffer)
+        if result.code != 0 and self.monitor.tripped is not None:
+            self._record_streamed(leg, buffer, result.sent) # The arm stopped on the last setpoint sent, no position to read
+            return False
+        if result.code != 0:
+            raise RuntimeError('{}: {}: set_servo_cartesian failed with code {} after {} setpoints'.format(self.name, leg.name, result.code, result.sent))
+        if result.missed:
+            log('servo_late', station=self.name, leg=leg.name, missed=result.missed, sent=result.sent, worst_ms=round(result.max_late * 1000, 1))
+        self._leg_done(leg.name)
+        return True
+
+    def move_arm_sequence(self, skip=(), arcs=None): # Seal every point in plan order, returns False if the station was stopped
+        sensor, reset = self.plan.gates['sensor'], self.plan.gates['reset']
+        self.sealed, self.arcs = list(skip), dict(arcs or {}) # Skipped ones were sealed before the part was interrupted
+        self._set_state(SEALING)
+        if self.journal is not None:
+            self.journal.begin(self.plan.digest, skip, arcs)
+        while True:
+            ended = self._seal_pass()
+            if ended != sensor:
+                break
+            if not self.wait_for_sensor(sensor): # Stopped on a sensor fault: wait for it, then seal what is left
+                return False
+            self._clear_stop()
+        if ended is None:
+            return False
+        if self.journal is not None and len(self.sealed) == len(self.plan.legs): # Not if the arm stopped short
+            self.journal.end()
+        if ended == reset: # Reset pressed mid-sequence
+            self.led.show(OFF) # Turn off the LED
+            return True
+        self._set_state(WAITING_RESET)
+        return self.gpio.wait_for(reset, 1) # Once the sequence is complete, wait for the reset button to be pressed
+
+    def _seal_pass(self): # Queue every leg not sealed yet. 'done', the io that stopped the arm, or None if the station was stopped
+        # The plan holds every seal point in visit order, with the circle poses already worked out
+        sensor = self.plan.gates['sensor']
+        legs = [self._rest_of(leg, self.arcs[leg.name]) if leg.name in self.arcs else leg # Circles cut short only seal the rest
+                for leg in self.plan.legs if leg.name not in self.sealed]
+        streamer, buffers = self._servo_streamer(legs)
+        approached = {}
+        self.monitor.watch()
+        try:
+            for leg, buffer in zip(legs, buffers):
+                # Check sensor state before each move, the input monitor stops the arm in between
+                if not self.motion.gate(lambda: self.gpio.value(sensor) == 1, lambda: self.wait_for_sensor(sensor)): # Only stop when the sensor is off
+                    if self.monitor.tripped is not None: # Stopped while draining, handled below like any other trip
+                        break
+                    if self.alive:
+                        self._dropped_queue()
+                    return None
+                if self.monitor.tripped is not None:
+                    break
+                self.led.show(STEADY) # Turn on the LED, no write once it is on
+                if streamer is not None:
+                    if not self._stream_leg(streamer, leg, buffer):
+                        break
+                    continue
+                angles = self.approach_angles.get(leg.name) if leg.name not in self.arcs else None # A resumed arc starts off the cached pose
+                if angles is not None:
+                    self.motion.approach_joints(angles) # The path to the seal point does not matter, only where it ends
+                else:
+                    self.motion.approach(leg.approach, speed=leg.speed, mvacc=leg.mvacc) # Queue the move to the seal point
+                approached[leg.name] = self.motion.sent
+                self.motion.circle(leg.pose1, leg.pose2, percent=leg.percent, speed=leg.circle_speed, mvacc=leg.circle_acc) # Queue the circle right behind it
+                self.motion.mark(leg.name)
+            if not self.motion.flush() and self.monitor.tripped is None: # Let the last circle finish
+                self._dropped_queue()
+        finally:
+            self.monitor.release()
+            if streamer is not None:
+                streamer.leave() # The reset move and the next part's home move run in position mode
+        trip = self.monitor.tripped
+        if trip is not None:
+            log('input_stop', station=self.name, io=trip.io, stop_ms=round((trip.stopped - trip.seen) * 1000, 1))
+            self.motion.retire() # Legs reported finished before the stop
+            if streamer is None: # A streamed leg was already measured against its setpoints
+                self._record_partial(approached) # Before cancel(), which forgets which approaches had run
+            self.motion.cancel() # The controller dropped the queued legs, they are sealed on the next pass or part
+        return 'done' if trip is None else trip.io
+
+    def run_cycle(self): # One part: start press, seal, reset. False once the station is stopped
+        digest, (skip, arcs) = self.plan.digest, self.resume_point() # Asked before the start press, so the operator knows which part to load
+        if not self.wait_for_start():
+            return False
+        t1 = time.monotonic()
+        self.load_recipe() # Pick up a changed recipe file between parts
+        if self.plan.digest != digest:
+            skip, arcs = [], {} # The recipe changed under the unfinished part
+        if not self.move_arm_sequence(skip, arcs):
+            return False
+        self.reset_position()
+        self.cycles += 1
+        self.last_cycle_time = time.monotonic() - t1
+        return True
+
+    def run(self, cycles=None): # Cycle until stopped, or for a number of parts
+        try:
+            if self.arm is None:
+                self.connect()
+            self.initialize()
+            done = 0
+            while self.alive and (cycles is None or done < cycles):
+                if not self.run_cycle():
+                    break
+                done += 1
+            if not self.alive: # Unwound by stop(), the last transition on the way out was not a real state
+                self._set_state(STOPPED)
+        except Exception as e:
+            self.error = e
+            self._set_state(FAULT)
+            raise
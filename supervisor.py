@@ -0,0 +1,132 @@
+# Runs several sealing cells from one process
+#
+# Each cell is a station.Station with its own connection, recipe, GPIO event stream and
+# state machine, driven by its own thread. Stations share nothing but this process: a
+# station waiting on its sensor, or faulted and waiting to reconnect, never delays the
+# others. Each station costs one thread here plus the SDK's own report threads, eight
+# arms on one line PC is a few dozen mostly idle threads.
+#
+#   stations.json
+#   {"stations": [
+#       {"name": "cell1", "ip": "192.168.1.213", "recipe": "recipes/cinchseal_16pin.json"},
+#       {"name": "cell2", "ip": "192.168.1.214", "recipe": "recipes/cinchseal_16pin.json"}
+#   ]}
+#
+#   python supervisor.py stations.json
+#   python supervisor.py stations.json --sim    # every cell on xarm_sim, with a scripted operator
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+
+from station import Station, FAULT
+
+
+class Supervisor:
+    def __init__(self, stations, restart_delay=5.0):
+        self.stations = list(stations)
+        self.restart_delay = restart_delay # Wait before reconnecting a faulted station, in seconds
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    @classmethod
+    def from_config(cls, path, arm_factory=None, **kwargs):
+        with open(path) as f:
+            config = json.load(f)
+        base = os.path.dirname(os.path.abspath(path))
+        stations = []
+        names = set()
+        for i, entry in enumerate(config.get('stations', [])):
+            name = entry.get('name', 'station{}'.format(i + 1))
+            if name in names:
+                raise ValueError('{}: stations[{}].name: duplicate station {!r}'.format(path, i, name))
+            if 'ip' not in entry or 'recipe' not in entry:
+                raise ValueError('{}: stations[{}]: expected ip and recipe'.format(path, i))
+            names.add(name)
+            station_kwargs = {'on_state': cls._log_state}
+            if arm_factory is not None:
+                station_kwargs['arm_factory'] = arm_factory
+            stations.append(Station(name, entry['ip'], os.path.join(base, entry['recipe']), **station_kwargs))
+        return cls(stations, **kwargs)
+
+    @staticmethod
+    def _log_state(station, state):
+        print('[{}] {}: {}'.format(time.strftime('%H:%M:%S'), station.name, state))
+
+    def start(self):
+        self._stop_event.clear()
+        for station in self.stations:
+            thread = threading.Thread(target=self._station_thread, args=(station,), name=station.name, daemon=True)
+            self._threads.append(thread)
+            thread.start()
+        return self
+
+    def stop(self, timeout=None): # Stop every station at its next wait and wait for the threads to end
+        self._stop_event.set()
+        for station in self.stations:
+            station.stop()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _station_thread(self, station):
+        while not self._stop_event.is_set():
+            try:
+                station.run()
+                if not station.alive: # Stopped from outside, not a fault
+                    break
+            except Exception as e:
+                print('{}: fault, reconnecting in {}s: {}'.format(station.name, self.restart_delay, e))
+            station.close()
+            station.arm = None # run() connects again
+            if self._stop_event.wait(self.restart_delay):
+                break
+
+    def status(self): # One row per station, safe to call from any thread
+        return [{'name': s.name, 'ip': s.ip, 'state': s.state, 'cycles': s.cycles, 'last_cycle_time': s.last_cycle_time,
+                 'error': repr(s.error) if s.state == FAULT else None} for s in self.stations]
+
+    def print_status(self):
+        for row in self.status():
+            print('{:<16} {:<16} {:<14} cycles={:<5} last={}{}'.format(
+                row['name'], row['ip'], row['state'], row['cycles'],
+                '-' if row['last_cycle_time'] is None else '{:.1f}s'.format(row['last_cycle_time']),
+                '  ' + row['error'] if row['error'] else ''))
+
+
+def sim_arm(ip, start=0, sensor=1, reset=2, circles=16): # SimArm with an operator who starts a part and resets once every circle is done
+    import xarm_sim
+    arm = xarm_sim.SimArm(ip, position=xarm_sim.CELL_HOME, angles=xarm_sim.CELL_HOME_ANGLES, inputs=1 << sensor) # Same start as benchmark.py
+    def part(number): # Start a second after the arm is back at rest: home move, then approach + circle per point and the reset move
+        arm.schedule(lambda: arm.press(start, hold=0.5, after=1.0), moves=1 + (2 * circles + 1) * (number - 1))
+        def done():
+            arm.press(reset, hold=0.5, after=0)
+            part(number + 1)
+        arm.schedule(done, circles=circles * number)
+    part(1)
+    return arm
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run several sealing stations from one process')
+    parser.add_argument('config', help='stations JSON file')
+    parser.add_argument('--sim', action='store_true', help='use xarm_sim instead of the real arms')
+    parser.add_argument('--status-interval', type=float, default=30, help='print a status table this often, in seconds')
+    parser.add_argument('--restart-delay', type=float, default=5.0, help='wait before reconnecting a faulted station, in seconds')
+    args = parser.parse_args(argv)
+
+    supervisor = Supervisor.from_config(args.config, arm_factory=sim_arm if args.sim else None, restart_delay=args.restart_delay).start()
+    try:
+        while True:
+            time.sleep(args.status_interval)
+            supervisor.print_status()
+    except KeyboardInterrupt:
+        supervisor.stop(timeout=5)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
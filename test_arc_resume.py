@@ -0,0 +1,99 @@
+# Tests for the partial-arc geometry in arc_resume.py
+#
+#   python -m pytest -q test_arc_resume.py
+
+import math
+
+import pytest
+
+from arc_resume import MIN_ARC, arc_end, arc_progress, circle_frame, line_progress, remaining_arc
+
+# A 20 mm circle in the z = 100 plane round (300, 0), started from +x and run counter-clockwise seen from above
+START = [320.0, 0.0, 100.0, 180.0, 0.0, 0.0]
+POSE1 = [300.0, 20.0, 100.0, 180.0, 0.0, 0.0]
+POSE2 = [280.0, 0.0, 100.0, 180.0, 0.0, 0.0]
+
+
+def on_circle(percent, height=0.0, radius=20.0):
+    angle = 2 * math.pi * percent / 100
+    return [300 + radius * math.cos(angle), radius * math.sin(angle), 100 + height, 180.0, 0.0, 0.0]
+
+
+def close(a, b, tolerance=1e-6):
+    return all(abs(x - y) < tolerance for x, y in zip(a, b))
+
+
+def test_frame():
+    center, radius, u, w, axis = circle_frame(START, POSE1, POSE2)
+    assert close(center, [300, 0, 100])
+    assert radius == pytest.approx(20)
+    assert close(u, [1, 0, 0]) and close(w, [0, 1, 0]) and close(axis, [0, 0, 1])
+
+
+def test_frame_on_one_line():
+    with pytest.raises(ValueError):
+        circle_frame(START, [310.0, 0.0, 100.0], [300.0, 0.0, 100.0])
+
+
+@pytest.mark.parametrize('percent', [0, 10, 25, 50, 62.5, 99])
+def test_progress(percent):
+    assert arc_progress(on_circle(percent), START, POSE1, POSE2) == pytest.approx(percent, abs=1e-6)
+
+
+def test_progress_runs_towards_pose1():
+    # Same points, pose1 and pose2 swapped: the circle runs the other way round
+    assert arc_progress(on_circle(25), START, POSE2, POSE1) == pytest.approx(75)
+
+
+def test_progress_within_tolerance():
+    assert arc_progress(on_circle(30, height=1.5), START, POSE1, POSE2) == pytest.approx(30)
+    assert arc_progress(on_circle(30, radius=21.5), START, POSE1, POSE2) == pytest.approx(30)
+
+
+def test_progress_off_the_circle():
+    assert arc_progress(on_circle(30, height=5), START, POSE1, POSE2) is None
+    assert arc_progress(on_circle(30, radius=15), START, POSE1, POSE2) is None
+    assert arc_progress([300.0, 0.0, 150.0], START, POSE1, POSE2) is None # Above the center, on the approach
+    assert arc_progress(on_circle(30, height=3), START, POSE1, POSE2, tolerance=5) == pytest.approx(30)
+
+
+def test_remaining_arc():
+    start, pose1, pose2, percent = remaining_arc(START, POSE1, POSE2, 100, 25)
+    assert percent == 75
+    assert close(start, on_circle(25)) # Picks up where the arm stopped
+    assert close(pose1, on_circle(50)) and close(pose2, on_circle(75)) # Turned forward by the part done
+    assert close(arc_end(start, pose1, pose2, percent), arc_end(START, POSE1, POSE2, 100)) # Ends where the whole circle would
+
+
+def test_remaining_arc_same_circle_and_direction():
+    start, pose1, pose2, percent = remaining_arc(START, POSE1, POSE2, 80, 30)
+    assert percent == pytest.approx(50)
+    for done in (0, 20, 49):
+        point = arc_end(start, pose1, pose2, done)
+        assert arc_progress(point, START, POSE1, POSE2) == pytest.approx(30 + done)
+
+
+def test_remaining_arc_keeps_orientation():
+    pose1 = POSE1[:3] + [170.0, 5.0, 10.0]
+    start, pose1, _, _ = remaining_arc(START, pose1, POSE2, 100, 40)
+    assert start[3:] == START[3:] and pose1[3:] == [170.0, 5.0, 10.0]
+
+
+def test_remaining_arc_of_nothing_done():
+    start, pose1, pose2, percent = remaining_arc(START, POSE1, POSE2, 100, 0)
+    assert percent == 100 and close(start, START) and close(pose1, POSE1) and close(pose2, POSE2)
+
+
+def test_arc_end():
+    assert close(arc_end(START, POSE1, POSE2, 50), on_circle(50))
+    assert close(arc_end(START, POSE1, POSE2, 100), START)
+    assert arc_progress(arc_end(START, POSE1, POSE2, 100 - MIN_ARC), START, POSE1, POSE2) == pytest.approx(100 - MIN_ARC)
+
+
+def test_line_progress():
+    end = [320.0, 0.0, 150.0]
+    assert line_progress([320.0, 0.0, 110.0], START, end) == pytest.approx(10)
+    assert line_progress([321.0, 1.0, 110.0], START, end) == pytest.approx(10) # Within tolerance of the line
+    assert line_progress([325.0, 0.0, 110.0], START, end) is None
+    assert line_progress([320.0, 0.0, 160.0], START, end) is None # Past its end
+    assert line_progress(START, START, START) is None
@@ -0,0 +1,132 @@
+# Tests for the Blockly compiler's folding and dead-code removal, and the executor's wait step
+#
+#   python -m pytest -q test_blockly.py
+
+import json
+
+import pytest
+
+from blockly_compiler import BlocklyCompiler, parse_json
+from blockly_runtime import StepExecutor
+
+
+def number(value):
+    return {'block': {'type': 'math_number', 'fields': {'NUM': value}}}
+
+
+def arith(op, a, b):
+    return {'block': {'type': 'math_arithmetic', 'fields': {'OP': op}, 'inputs': {'A': a, 'B': b}}}
+
+
+def variable(name):
+    return {'block': {'type': 'variables_get', 'fields': {'VAR': name}}}
+
+
+def boolean(value):
+    return {'block': {'type': 'logic_boolean', 'fields': {'BOOL': 'TRUE' if value else 'FALSE'}}}
+
+
+def wait(value):
+    return {'type': 'wait', 'inputs': {'VALUE': value}}
+
+
+def chain(*blocks): # Link statement blocks through their next slots
+    for block, after in zip(blocks, blocks[1:]):
+        block['next'] = {'block': after}
+    return blocks[0]
+
+
+def compile_blocks(*top):
+    compiler = BlocklyCompiler()
+    main, procedures = compiler.compile(parse_json(json.dumps({'blocks': {'blocks': list(top)}})))
+    return compiler, main, procedures
+
+
+def test_constant_expression_folded():
+    _, main, _ = compile_blocks(wait(arith('MULTIPLY', arith('DIVIDE', number(360), number(360)), number(100))))
+    assert main == (('wait', ('const', 100.0)),)
+
+
+def test_expression_with_a_variable_kept():
+    _, main, _ = compile_blocks(wait(arith('ADD', variable('t'), arith('ADD', number(1), number(2)))))
+    assert main == (('wait', ('arith', '+', ('var', 't'), ('const', 3))),)
+
+
+def test_division_by_zero_left_to_run_time():
+    _, main, _ = compile_blocks(wait(arith('DIVIDE', number(1), number(0))))
+    assert main == (('wait', ('arith', '/', ('const', 1), ('const', 0))),)
+
+
+def test_blocks_after_break_dropped():
+    body = chain({'type': 'loop_break'}, wait(number(1)), wait(number(2)))
+    compiler, main, _ = compile_blocks({'type': 'loop_run_forever', 'inputs': {'DO': {'block': body}}})
+    assert compiler.dropped == 2
+    assert [step[0] for step in main] == ['jump', 'loop']
+    assert main[0][1] == len(main) # The break jumps past the back edge
+
+
+def test_blocks_after_endless_loop_dropped():
+    forever = {'type': 'loop_run_forever', 'inputs': {'DO': {'block': wait(number(1))}}}
+    compiler, main, _ = compile_blocks(chain(forever, wait(number(2))))
+    assert compiler.dropped == 1
+    assert main == (('wait', ('const', 1)), ('loop', 0, compiler.loop_interval, 1))
+
+
+def test_constant_branches():
+    block = {'type': 'controls_if', 'extraState': {'elseIfCount': 1},
+             'inputs': {'IF0': boolean(False), 'DO0': {'block': wait(number(1))},
+                        'IF1': boolean(True), 'DO1': {'block': wait(number(2))}}}
+    compiler, main, _ = compile_blocks(block)
+    assert main == (('wait', ('const', 2)),)
+    assert compiler.dropped == 1
+
+
+def test_while_false_dropped():
+    block = {'type': 'controls_whileUntil', 'fields': {'MODE': 'UNTIL'},
+             'inputs': {'BOOL': boolean(True), 'DO': {'block': wait(number(1))}}}
+    compiler, main, _ = compile_blocks(block)
+    assert main == () and compiler.dropped == 1
+
+
+def test_uncalled_procedure_dropped():
+    def procedure(name, body):
+        return {'type': 'procedures_defnoreturn', 'fields': {'NAME': name}, 'inputs': {'STACK': {'block': body}}}
+    call = {'type': 'procedures_callnoreturn', 'extraState': {'name': 'used'}}
+    compiler, main, procedures = compile_blocks(procedure('used', wait(number(1))), procedure('unused', wait(number(2))), call)
+    assert main == (('call', 'used'),)
+    assert procedures == {'used': (('wait', ('const', 1)),)}
+    assert compiler.dropped == 1
+
+
+class Arm:
+    connected, error_code, state = True, 0, 0
+
+
+class StopEvent: # Records the waits instead of sleeping
+    def __init__(self, stop_after=None):
+        self.waits = []
+        self.stop_after = stop_after
+
+    def wait(self, seconds):
+        self.waits.append(seconds)
+        return self.stop_after is not None and len(self.waits) >= self.stop_after
+
+
+def run_wait(seconds, stop_after=None):
+    executor = StepExecutor(Arm(), (), {})
+    executor._stop_event = StopEvent(stop_after)
+    return executor._op_wait(0, ('const', seconds)), executor._stop_event.waits
+
+
+@pytest.mark.parametrize('seconds, slices, rest', [(0.25, 2, 0.05), (0.05, 0, 0.05), (0.2, 2, 0), (0, 0, 0), (-1, 0, 0)])
+def test_wait_remainder(seconds, slices, rest):
+    pc, waits = run_wait(seconds)
+    assert pc == 1
+    assert waits[:slices] == [0.1] * slices
+    assert sum(waits) == pytest.approx(max(seconds, 0))
+    assert len(waits) == slices + (rest > 1e-9)
+
+
+def test_wait_stopped():
+    assert run_wait(0.25, stop_after=1) == (None, [0.1])
+    assert run_wait(0.25, stop_after=3) == (None, [0.1, 0.1, pytest.approx(0.05)])
@@ -0,0 +1,84 @@
+# Tests for the progress journal in checkpoint.py
+#
+#   python -m pytest -q test_checkpoint.py
+
+import pytest
+
+from checkpoint import Checkpoint
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = Checkpoint(str(tmp_path / 'cinchseal.journal'))
+    yield journal
+    journal.close()
+
+
+def test_nothing_journalled(journal):
+    assert journal.pending() is None and journal.arcs() == {}
+
+
+def test_begin(journal):
+    journal.begin('a')
+    assert journal.pending() == [] and journal.pending('a') == []
+    assert journal.pending('b') is None # Another recipe's part is not offered
+
+
+def test_done(journal):
+    journal.begin('a')
+    journal.done('Pin1')
+    journal.done('Pin2')
+    assert journal.pending('a') == ['Pin1', 'Pin2']
+
+
+def test_partial(journal):
+    journal.begin('a')
+    journal.done('Pin1')
+    journal.partial('Pin2', 40.12345)
+    assert journal.pending('a') == ['Pin1'] # A circle cut short is not sealed yet
+    assert journal.arcs('a') == {'Pin2': 40.123}
+    journal.partial('Pin2', 75)
+    assert journal.arcs('a') == {'Pin2': 75}
+    journal.done('Pin2')
+    assert journal.pending('a') == ['Pin1', 'Pin2'] and journal.arcs('a') == {}
+
+
+def test_end(journal):
+    journal.begin('a')
+    journal.done('Pin1')
+    journal.partial('Pin2', 50)
+    journal.end()
+    assert journal.pending() is None and journal.arcs() == {}
+
+
+def test_resumed_part(journal):
+    journal.begin('a')
+    journal.done('Pin1')
+    journal.partial('Pin2', 50)
+    journal.close()
+    resumed = Checkpoint(journal.path)
+    resumed.begin('a', resumed.pending('a'), resumed.arcs('a'))
+    resumed.done('Pin3')
+    assert resumed.pending('a') == ['Pin1', 'Pin3'] and resumed.arcs('a') == {'Pin2': 50}
+    resumed.close()
+
+
+def test_torn_last_line(journal):
+    journal.begin('a')
+    journal.done('Pin1')
+    journal.close()
+    with open(journal.path, 'a') as f:
+        f.write('{"event": "do')
+    assert journal.pending('a') == ['Pin1']
+
+
+def test_end_empties_a_full_journal(tmp_path):
+    journal = Checkpoint(str(tmp_path / 'cinchseal.journal'), max_bytes=100)
+    journal.begin('a')
+    for i in range(5):
+        journal.done('Pin{}'.format(i + 1))
+    journal.end()
+    assert (tmp_path / 'cinchseal.journal').stat().st_size == 0
+    journal.begin('b')
+    assert journal.pending('b') == []
+    journal.close()
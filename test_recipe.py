@@ -0,0 +1,79 @@
+# Tests for the recipe checks in recipe.validate_recipe
+#
+#   python -m pytest -q test_recipe.py
+
+import copy
+import json
+import os
+
+import pytest
+
+from recipe import validate_recipe
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recipes', 'cinchseal_16pin.json')) as f:
+    RECIPE = json.load(f)
+
+
+def changed(path, value): # A copy of the shipped recipe with one setting replaced, None deletes it
+    recipe = copy.deepcopy(RECIPE)
+    *parents, key = path
+    section = recipe
+    for parent in parents:
+        section = section.setdefault(parent, {}) if isinstance(section, dict) else section[parent]
+    if value is None:
+        del section[key]
+    else:
+        section[key] = value
+    return recipe
+
+
+def test_shipped_recipe_valid():
+    assert validate_recipe(copy.deepcopy(RECIPE)) is not None
+
+
+@pytest.mark.parametrize('path, value', [
+    (['motion', 'blend_radius'], 2.5),
+    (['motion', 'servo_rate'], 200),
+    (['motion', 'optimize_order'], False),
+    (['gates', 'led'], 15),
+    (['limits'], {'max_speed': 500, 'joint_limits': [[-360, 360]] * 6}),
+    (['motion'], None),
+    (['gates'], None),
+])
+def test_accepted(path, value):
+    validate_recipe(changed(path, value))
+
+
+def test_blend_radius_none_accepted():
+    recipe = copy.deepcopy(RECIPE)
+    recipe['motion']['blend_radius'] = None
+    validate_recipe(recipe)
+
+
+@pytest.mark.parametrize('path, value, field', [
+    (['motion'], [1], 'motion'),
+    (['fixture'], 5, 'fixture'),
+    (['gates'], 'led', 'gates'),
+    (['limits'], [500], 'limits'),
+    (['motion', 'spede'], 200, 'motion.spede'),
+    (['motion', 'speed'], 0, 'motion.speed'),
+    (['motion', 'speed'], True, 'motion.speed'),
+    (['motion', 'servo_rate'], 50, 'motion.servo_rate'),
+    (['motion', 'blend_radius'], 'abc', 'motion.blend_radius'),
+    (['motion', 'blend_radius'], -1, 'motion.blend_radius'),
+    (['motion', 'optimize_order'], 1, 'motion.optimize_order'),
+    (['motion', 'joint_approach'], 'yes', 'motion.joint_approach'),
+    (['gates', 'sensor'], True, 'gates.sensor'),
+    (['gates', 'led'], 16, 'gates.led'),
+    (['limits', 'max_speed'], 'fast', 'limits.max_speed'),
+    (['limits', 'joint_limits'], [[-360, 360], [0]], 'limits.joint_limits'),
+    (['fixture', 'home'], [0, 0, 0], 'fixture.home'),
+    (['fixture', 'reset_angles'], None, 'fixture.reset_angles'),
+    (['seal_points'], [], 'seal_points'),
+    (['seal_points', 0, 'diameter'], -5, 'seal_points[0].diameter'),
+    (['seal_points', 1, 'percent'], 150, 'seal_points[1].percent'),
+    (['seal_points', 1, 'name'], 'Pin1', 'seal_points[1].name'),
+])
+def test_rejected(path, value, field):
+    with pytest.raises(ValueError, match=r'\b' + field.replace('[', r'\[').replace(']', r'\]')):
+        validate_recipe(changed(path, value))
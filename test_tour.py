@@ -0,0 +1,45 @@
+# Tests for the visit-order planner in tour.py
+#
+#   python -m pytest -q test_tour.py
+
+import math
+import random
+
+from tour import base_angles, plan_tour, time_matrix, tour_time, winding_ok
+
+HOME = [300.0, 0.0, 400.0]
+
+
+def ring(count, radius=350.0, start=0.0): # count points evenly round the base
+    return [[radius * math.cos(math.radians(start + 360 * i / count)), radius * math.sin(math.radians(start + 360 * i / count)), 400.0]
+            for i in range(count)]
+
+
+def timed(order, points): # Tour time of a visit order, home to home
+    matrix = time_matrix([HOME] + points, 200, 2000)
+    return tour_time([0] + [i + 1 for i in order] + [0], matrix)
+
+
+def test_visits_every_point_once():
+    points = ring(12)
+    order = plan_tour(points, HOME, 200, 2000)
+    assert sorted(order) == list(range(12))
+
+
+def test_shuffled_line_put_in_order():
+    points = [[300.0, y, 400.0] for y in (40, 200, 120, 80, 160)]
+    assert plan_tour(points, HOME, 200, 2000) == [0, 3, 2, 4, 1]
+
+
+def test_no_slower_than_the_given_order():
+    rng = random.Random(1)
+    points = [[rng.uniform(-400, 400), rng.uniform(-400, 400), 400.0] for _ in range(20)]
+    order = plan_tour(points, HOME, 200, 2000)
+    assert timed(order, points) <= timed(range(20), points) + 1e-9
+
+
+def test_joint_1_kept_unwound():
+    points = ring(16, start=10)
+    order = plan_tour(points, HOME, 200, 2000, base_limit=350)
+    angles = base_angles([HOME] + points)
+    assert winding_ok([0] + [i + 1 for i in order] + [0], angles, 350)
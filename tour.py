@@ -0,0 +1,125 @@
+# Visit-order planner for the seal points
+#
+# Orders the seal points into a minimum travel time tour starting and ending at the
+# home pose: nearest neighbour for the first tour, then 2-opt and Or-opt moves until
+# nothing improves. Legs are weighed by trapezoidal move time, not raw distance, so
+# many short hops are not mistaken for cheap ones.
+#
+# Parts sit on a ring around the base, so joint 1 winds up as the arm goes around. A
+# tour is only accepted if the unwrapped base angle stays within base_limit degrees,
+# otherwise the shortest tour can walk joint 1 into its +-360 limit. For the same reason
+# the way home is a joint move, not a straight line: a linear move keeps joint 1 wound
+# up, a joint move to the IK solution (within +-180) unwinds it on the way.
+
+import math
+
+from motion_time import trapezoid_time
+
+
+def leg_distance(a, b):
+    return math.sqrt((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2 + (a[2] - b[2]) ** 2)
+
+
+def time_matrix(points, speed, mvacc): # Node 0 is home, node i + 1 is points[i]
+    return [[trapezoid_time(leg_distance(a, b), speed, mvacc) for b in points] for a in points]
+
+
+def tour_time(route, matrix): # route starts and ends at node 0
+    return sum(matrix[route[i]][route[i + 1]] for i in range(len(route) - 1))
+
+
+def base_angles(points): # Angle of each point around the base, in degrees
+    return [math.degrees(math.atan2(p[1], p[0])) for p in points]
+
+
+def winding_ok(route, angles, base_limit): # Follow joint 1 along the route, unwrapping each hop the short way round
+    if base_limit is None:
+        return True
+    turn = angles[route[0]]
+    for i in range(1, len(route) - 1): # The return leg to home is a joint move, it unwinds by itself
+        turn += (angles[route[i]] - angles[route[i - 1]] + 180) % 360 - 180
+        if abs(turn) > base_limit:
+            return False
+    return True
+
+
+def nearest_neighbour(matrix):
+    route = [0]
+    left = set(range(1, len(matrix)))
+    while left:
+        here = route[-1]
+        nearest = min(left, key=lambda node: matrix[here][node])
+        route.append(nearest)
+        left.remove(nearest)
+    route.append(0)
+    return route
+
+
+def two_opt(route, matrix, angles, base_limit): # Reverse any segment whose endpoints cross
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(route) - 2):
+            for j in range(i + 1, len(route) - 1):
+                a, b, c, d = route[i - 1], route[i], route[j], route[j + 1]
+                delta = matrix[a][c] + matrix[b][d] - matrix[a][b] - matrix[c][d]
+                if delta < -1e-9:
+                    candidate = route[:i] + route[i:j + 1][::-1] + route[j + 1:]
+                    if winding_ok(candidate, angles, base_limit):
+                        route[:] = candidate
+                        improved = True
+    return route
+
+
+def or_opt(route, matrix, angles, base_limit, max_segment=3): # Move short runs of points to a better spot, in either direction
+    improved = True
+    while improved:
+        improved = False
+        for length in range(1, max_segment + 1):
+            for i in range(1, len(route) - length):
+                segment = route[i:i + length]
+                prev, nxt = route[i - 1], route[i + length]
+                removed = matrix[prev][segment[0]] + matrix[segment[-1]][nxt] - matrix[prev][nxt]
+                rest = route[:i] + route[i + length:]
+                best = None
+                for k in range(len(rest) - 1):
+                    if k == i - 1:
+                        continue
+                    a, b = rest[k], rest[k + 1]
+                    for seg in (segment, segment[::-1]):
+                        added = matrix[a][seg[0]] + matrix[seg[-1]][b] - matrix[a][b]
+                        if added - removed < -1e-9 and (best is None or added < best[0]):
+                            candidate = rest[:k + 1] + list(seg) + rest[k + 1:]
+                            if winding_ok(candidate, angles, base_limit):
+                                best = (added, candidate)
+                if best is not None:
+                    route[:] = best[1]
+                    improved = True
+                    break
+            if improved:
+                break
+    return route
+
+
+def sweep(angles): # One pass around the base, turning back towards joint 1 = 0, never more than a full turn
+    direction = -1 if angles[0] >= 0 else 1
+    route = sorted(range(1, len(angles)), key=lambda node: (direction * (angles[node] - angles[0])) % 360)
+    return [0] + route + [0]
+
+
+def plan_tour(points, home, speed, mvacc, base_limit=350): # Returns the visit order as indices into points
+    nodes = [home] + list(points)
+    matrix = time_matrix(nodes, speed, mvacc)
+    angles = base_angles(nodes)
+    route = nearest_neighbour(matrix)
+    if not winding_ok(route, angles, base_limit):
+        route = sweep(angles)
+        if not winding_ok(route, angles, base_limit):
+            raise ValueError('no visit order keeps joint 1 within {} degrees'.format(base_limit))
+    best = tour_time(route, matrix) + 1
+    while tour_time(route, matrix) < best - 1e-9: # Alternate until neither move finds anything
+        best = tour_time(route, matrix)
+        two_opt(route, matrix, angles, base_limit)
+        or_opt(route, matrix, angles, base_limit)
+    return [node - 1 for node in route[1:-1]]
+
@@ -0,0 +1,135 @@
+# Speed/acceleration tuner for the seal points of a recipe
+#
+# Every seal point gets its own approach speed/mvacc and circle speed/acc, searched on a
+# grid within the limits below and priced with the trapezoid model (motion_time). Legs
+# are independent once the visit order is fixed, so the search is split by leg across a
+# process pool and each worker prices its whole grid in one NumPy broadcast.
+#
+# The model always prefers the fastest setting, so the limits are what make the answer:
+#   max_speed / max_mvacc            safety limits for the approach moves
+#   min_circle_speed / max_circle_speed / max_circle_acc   bead quality limits
+#   min_cruise                       fraction of every bead that must run at constant speed,
+#                                    1 - v^2 / (a * length) >= min_cruise
+# Among the settings within tolerance of the fastest, the gentlest one is kept (lowest
+# acceleration, then lowest speed), so the arm is not driven harder for a 1% gain.
+#
+# The limits come from the recipe's "limits" section, then the command line. The best
+# settings are written back into the recipe as per-point overrides.
+#
+#   python tuner.py recipes/cinchseal_16pin.json --max-circle-speed 60 --dry-run
+
+import os
+import sys
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from motion_time import plan_geometry, trapezoid_times
+from recipe import load_plan
+
+LIMIT_DEFAULTS = {
+    'max_speed': 500, # Approach speed, in mm/s
+    'max_mvacc': 3000, # Approach acceleration, in mm/s^2
+    'min_circle_speed': 20, # Bead speed, in mm/s
+    'max_circle_speed': 60,
+    'max_circle_acc': 500, # Bead acceleration, in mm/s^2
+    'min_cruise': 0.8, # Fraction of every bead run at constant speed
+}
+
+
+def _grid(low, high, steps):
+    return np.unique(np.linspace(low, high, steps).round(1))
+
+
+def best_setting(distances, speeds, accs, tolerance, min_cruise=None): # Per distance: (speed, acc, time) of the gentlest near-fastest setting
+    v, a = np.meshgrid(speeds, accs, indexing='ij')
+    v, a = v.ravel(), a.ravel()
+    times = trapezoid_times(np.asarray(distances, dtype=float)[:, None], v, a) # (legs, candidates)
+    if min_cruise is not None: # Bead quality: the ramps may only take up 1 - min_cruise of the bead
+        ok = 1 - v * v / (a * np.maximum(np.asarray(distances, dtype=float)[:, None], 1e-9)) >= min_cruise
+        times = np.where(ok, times, np.inf)
+    fastest = times.min(axis=1, keepdims=True)
+    near = times <= fastest * (1 + tolerance)
+    order = np.lexsort((v, a)) # Gentlest first: lowest acceleration, then lowest speed
+    first = np.argmax(near[:, order], axis=1)
+    pick = order[first]
+    rows = np.arange(len(pick))
+    return v[pick], a[pick], times[rows, pick]
+
+
+def _tune_chunk(args): # Pool worker: one slice of the legs
+    approach, circle, limits, steps, tolerance = args
+    speeds = _grid(min(50, limits['max_speed']), limits['max_speed'], steps)
+    accs = _grid(min(100, limits['max_mvacc']), limits['max_mvacc'], steps)
+    circle_speeds = _grid(limits['min_circle_speed'], limits['max_circle_speed'], steps)
+    circle_accs = _grid(min(50, limits['max_circle_acc']), limits['max_circle_acc'], steps)
+    return (best_setting(approach, speeds, accs, tolerance),
+            best_setting(circle, circle_speeds, circle_accs, tolerance, limits['min_cruise']))
+
+
+def tune(plan, limits, steps=40, tolerance=0.01, workers=None): # {leg name: settings}, seconds before, seconds after
+    approach, circle = plan_geometry(plan)
+    workers = workers if workers is not None else min(os.cpu_count() or 1, 8)
+    chunks = max(workers, 1)
+    jobs = [(a, c, limits, steps, tolerance) for a, c in zip(np.array_split(approach, chunks), np.array_split(circle, chunks)) if len(a)]
+    if workers:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_tune_chunk, jobs))
+    else:
+        results = [_tune_chunk(job) for job in jobs]
+    (speed, mvacc, t_approach), (circle_speed, circle_acc, t_circle) = (
+        [np.concatenate(parts) for parts in zip(*side)] for side in zip(*results))
+    before = sum(trapezoid_times(d, leg.speed, leg.mvacc) + trapezoid_times(c, leg.circle_speed, leg.circle_acc)
+                 for leg, d, c in zip(plan.legs, approach, circle))
+    if not np.all(np.isfinite(t_circle)):
+        bad = [leg.name for leg, t in zip(plan.legs, t_circle) if not np.isfinite(t)]
+        raise ValueError('no circle setting meets the bead limits for {}'.format(', '.join(bad)))
+    settings = {leg.name: {'speed': float(speed[i]), 'mvacc': float(mvacc[i]),
+                           'circle_speed': float(circle_speed[i]), 'circle_acc': float(circle_acc[i])}
+                for i, leg in enumerate(plan.legs)}
+    return settings, float(before), float(t_approach.sum() + t_circle.sum())
+
+
+def write_settings(path, settings): # Per-point overrides in the recipe file, written atomically
+    if not path.endswith('.json'):
+        raise ValueError('recipe {}: only JSON recipes can be written back'.format(path))
+    with open(path) as f:
+        recipe = json.load(f)
+    for i, point in enumerate(recipe['seal_points']):
+        point.update(settings.get(point.get('name', 'Pin{}'.format(i + 1)), {}))
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(recipe, f, indent=2)
+        f.write('\n')
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tune per-point speeds and accelerations of a recipe for minimum cycle time')
+    parser.add_argument('recipe', help='recipe file')
+    for key, default in LIMIT_DEFAULTS.items():
+        parser.add_argument('--' + key.replace('_', '-'), type=float, help='default: the recipe limits, else {}'.format(default))
+    parser.add_argument('--steps', type=int, default=40, help='grid points per parameter')
+    parser.add_argument('--tolerance', type=float, default=0.01, help='keep the gentlest setting within this fraction of the fastest')
+    parser.add_argument('--workers', type=int, help='worker processes, 0 to run in this process')
+    parser.add_argument('--dry-run', action='store_true', help='print the settings, leave the recipe alone')
+    args = parser.parse_args(argv)
+
+    plan = load_plan(args.recipe)
+    limits = dict(LIMIT_DEFAULTS, **plan.limits)
+    limits.update({key: getattr(args, key) for key in LIMIT_DEFAULTS if getattr(args, key) is not None})
+    settings, before, after = tune(plan, limits, args.steps, args.tolerance, args.workers)
+    print('{:<12} {:>8} {:>8} {:>8} {:>8}'.format('point', 'speed', 'mvacc', 'c_speed', 'c_acc'))
+    for name, s in settings.items():
+        print('{:<12} {:>8g} {:>8g} {:>8g} {:>8g}'.format(name, s['speed'], s['mvacc'], s['circle_speed'], s['circle_acc']))
+    print('motion time {:.2f}s -> {:.2f}s'.format(before, after))
+    if not args.dry_run:
+        write_settings(args.recipe, settings)
+        print('written to {}'.format(args.recipe))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,562 @@
+# Offline stand-in for xarm.wrapper.XArmAPI
+#
+# SimArm takes the same calls the scripts in this repo make and answers them without a
+# robot, with a timing model close enough to measure cycle time on a laptop:
+#   - every controller round trip costs latency + random jitter and round trips are
+#     serialized like they are on the one command socket
+#   - motion commands go into a controller queue and run one after the other with a
+#     trapezoidal profile (motion_time.trapezoid_time) over the path length: straight line
+#     for set_position, arc length for move_circle, the largest joint delta for
+#     set_servo_angle. wait=True polls get_state() the way the SDK's wait_move() does.
+#     Corner blending is not modelled, a blended move costs the same as a stopped one.
+#     A stop or fault leaves the arm part way along the command that was running, in
+#     proportion to the time it had run (a joint move as if it ran in a straight line).
+#     In servo mode set_servo_cartesian() puts the arm on the setpoint at once.
+#   - state, cmd_num, position, angles and cgpio_states are refreshed by a report thread
+#     every report_interval, so they lag the controller like the real report stream does
+#   - digital inputs are scriptable: set them directly, or schedule() any action at a
+#     simulated time or after a number of finished circles or moves
+#
+# All timing goes through a SimClock. With time_scale > 1 simulated time runs that many
+# times faster than the wall clock; pass the clock's sleep/monotonic to the code under
+# test (or swap it in for their time module) and a 60 s cycle finishes in a second or two.
+# Units are degrees and millimetres only, like every script in this repo.
+
+import math
+import time as _time
+import random
+import threading
+from collections import deque, namedtuple
+
+from motion_time import trapezoid_time
+
+NUM_INPUTS = 16
+
+NOT_CONNECTED = -1 # Same values as xarm.x3.code.APIState
+NOT_READY = -2
+EMERGENCY_STOP = -9
+
+CELL_HOME = [136.0, 215.3, 620.8, 180.0, 0.0, 0.0] # The recipe's home pose, where benchmark.py and supervisor.py --sim start the arm
+CELL_HOME_ANGLES = [57.7, -62.4, -41.9, 0.0, 104.2, 57.7, 0.0] # Joint angles there: pointing down, clear of the wrist singularity for the pre-flight check
+
+Command = namedtuple('Command', ['kind', 'duration', 'pose', 'angles', 'path'], defaults=(None,)) # path(fraction) -> pose along the way
+
+
+class SimClock:
+    def __init__(self, time_scale=1.0):
+        self.time_scale = time_scale # Simulated seconds per wall clock second
+        self._start = _time.monotonic()
+        self._epoch = _time.time()
+        self._lock = threading.Lock()
+        self.slept = 0.0 # Simulated seconds spent in sleep() by the code under test
+        self.sleeps = 0
+
+    def monotonic(self):
+        return (_time.monotonic() - self._start) * self.time_scale
+
+    perf_counter = monotonic
+
+    def time(self):
+        return self._epoch + self.monotonic()
+
+    def sleep(self, seconds): # time.sleep() replacement for the code under test, counted
+        if seconds > 0:
+            with self._lock:
+                self.slept += seconds
+                self.sleeps += 1
+            _time.sleep(seconds / self.time_scale)
+
+    def wait(self, seconds): # Simulator-internal wait, not counted
+        if seconds > 0:
+            _time.sleep(seconds / self.time_scale)
+
+    def real(self, seconds): # Simulated seconds to a wall clock timeout, for Condition.wait()
+        return None if seconds is None else max(seconds, 0) / self.time_scale
+
+    def __getattr__(self, name): # strftime, localtime and the rest come from the real time module
+        return getattr(_time, name)
+
+
+def _sub(a, b):
+    return [a[0] - b[0], a[1] - b[1], a[2] - b[2]]
+
+
+def _cross(a, b):
+    return [a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0]]
+
+
+def _dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+def _same_angles(a, b): # Joint 1 a whole turn either way and IK results rounded by a cache still name the same pose
+    return abs((a[0] - b[0] + 180) % 360 - 180) < 0.01 and all(abs(x - y) < 0.01 for x, y in zip(a[1:], b[1:]))
+
+
+def circle_path(start, pose1, pose2, percent): # Arc length and end point of a move_circle from start through pose1 and pose2
+    a, b = _sub(pose1, start), _sub(pose2, start)
+    normal = _cross(a, b)
+    nn = _dot(normal, normal)
+    if nn < 1e-12: # Collinear points, the controller would refuse it, count it as a straight line
+        return math.sqrt(_dot(b, b)), list(pose2[:3])
+    aa, bb = _dot(a, a), _dot(b, b)
+    offset = _cross([aa * b[i] - bb * a[i] for i in range(3)], normal)
+    center = [start[i] + offset[i] / (2 * nn) for i in range(3)]
+    radius = math.sqrt(_dot(_sub(start, center), _sub(start, center)))
+    angle = 2 * math.pi * percent / 100
+    axis = [v / math.sqrt(nn) for v in normal] # Right-handed about start -> pose1 -> pose2
+    v = _sub(start, center)
+    w = _cross(axis, v)
+    end = [center[i] + v[i] * math.cos(angle) + w[i] * math.sin(angle) for i in range(3)]
+    return radius * angle, end
+
+
+class SimArm:
+    simulated = True # Tells caches not to keep what this arm answers, see ik_cache.py
+
+    def __init__(self, port=None, latency=0.002, jitter=0.001, clock=None, report_interval=0.1, settle=0.05,
+                 position=(207.0, 0.0, 112.0, 180.0, 0.0, 0.0), angles=(0.0,) * 7, inputs=0, seed=None, **kwargs):
+        self.port = port
+        self.clock = clock or SimClock()
+        self.latency = latency # Mean round trip, in seconds
+        self.jitter = jitter # Extra random round trip, uniform in [0, jitter], in seconds
+        self.report_interval = report_interval # Report stream period, in seconds
+        self.settle = settle # wait_move() poll period, in seconds
+        self._random = random.Random(seed)
+        self._rpc_lock = threading.Lock()
+        self._cond = threading.Condition(threading.RLock())
+        self.rpc_counts = {} # Round trips by method name
+        self.completed = {'move': 0, 'circle': 0, 'joint': 0, 'pause': 0} # Finished motion commands by kind
+        self.servo_points = 0 # Setpoints taken by set_servo_cartesian() in servo mode
+        self.history = [] # (finish time, kind, pose) of every finished motion command
+        self._queue = deque()
+        self._end = None # Finish time of the running command, None when idle
+        self._remaining = None # Time left on the running command while paused
+        self._pose = list(position) # Controller state, what get_* round trips return
+        self._angles = list(angles)
+        self._target = list(position) # Where the last queued command ends
+        self._target_angles = list(angles)
+        self._ik_poses = {} # Angles handed out by get_inverse_kinematics -> the pose they were solved for
+        self._state = 2
+        self._mode = 0
+        self._error = 0
+        self._warn = 0
+        self._inputs = inputs # Bit i = controller digital input i
+        self._outputs = 0
+        self._last_speed, self._last_acc = 100, 2000
+        self._last_angle_speed, self._last_angle_acc = 20, 500
+        self._timers = [] # (time, action), fired by the controller thread
+        self._counters = [] # (kind, count, action), fired when completed[kind] reaches count
+        self._callbacks = {name: [] for name in ('report', 'state', 'error_warn', 'cmdnum', 'count', 'connect', 'mode')}
+        self._connected = True
+        self._publish()
+        self._threads = [threading.Thread(target=self._controller_thread, daemon=True),
+                         threading.Thread(target=self._report_thread, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    # Report-fed attributes, they only change once per report_interval
+
+    @property
+    def connected(self):
+        return self._connected
+
+    @property
+    def state(self):
+        return self._reported['state']
+
+    @property
+    def mode(self):
+        return self._reported['mode']
+
+    @property
+    def error_code(self):
+        return self._reported['error_code']
+
+    @property
+    def warn_code(self):
+        return self._reported['warn_code']
+
+    @property
+    def cmd_num(self):
+        return self._reported['cmdnum']
+
+    @property
+    def position(self):
+        return list(self._reported['cartesian'])
+
+    @property
+    def angles(self):
+        return list(self._reported['joints'])
+
+    @property
+    def cgpio_states(self):
+        return self._reported['cgpio']
+
+    # Scripting
+
+    def set_input(self, io, value):
+        with self._cond:
+            self._inputs = self._inputs | 1 << io if value else self._inputs & ~(1 << io)
+
+    def input(self, io):
+        return self._inputs >> io & 1
+
+    def output(self, io):
+        return self._outputs >> io & 1
+
+    def schedule(self, action, at=None, after=None, circles=None, moves=None):
+        # Run action() on the controller thread at simulated time `at`, `after` seconds from
+        # now, or once `circles` circles / `moves` motion commands of any kind have finished
+        with self._cond:
+            if circles is not None:
+                self._counters.append(('circle', circles, action))
+            elif moves is not None:
+                self._counters.append(('all', moves, action))
+            else:
+                self._timers.append((self.clock.monotonic() + after if at is None else at, action))
+                self._timers.sort(key=lambda timer: timer[0])
+            self._cond.notify_all()
+
+    def press(self, io, hold=0.2, **when): # Schedule a button press: io goes high, then low again hold seconds later
+        def down():
+            self.set_input(io, 1)
+            self.schedule(lambda: self.set_input(io, 0), after=hold)
+        self.schedule(down, **when)
+
+    def fault(self, error_code): # Raise a controller error, the arm stops like it would on the real thing
+        with self._cond:
+            self._error = error_code
+            self._stop(4)
+
+    def disconnect(self):
+        with self._cond:
+            self._connected = False
+            self._stop(4)
+        self._fire('connect', {'connected': False, 'reported': False})
+
+    # Controller round trips
+
+    def _rpc(self, name):
+        with self._rpc_lock: # One command socket, round trips from different threads queue up
+            self.rpc_counts[name] = self.rpc_counts.get(name, 0) + 1
+            self.clock.wait(self.latency + self._random.uniform(0, self.jitter))
+        return self._connected
+
+    def motion_enable(self, enable=True, servo_id=None):
+        self._rpc('motion_enable')
+        return 0
+
+    def set_mode(self, mode=0):
+        self._rpc('set_mode')
+        self._mode = mode
+        return 0
+
+    def set_state(self, state=0):
+        if not self._rpc('set_state'):
+            return NOT_CONNECTED
+        with self._cond:
+            if state == 0 and self._state in (3, 4):
+                if self._remaining is not None:
+                    self._end = self.clock.monotonic() + self._remaining
+                    self._remaining = None
+                self._state = 1 if self._queue else 2
+            elif state == 3 and self._state == 1:
+                self._remaining = self._end - self.clock.monotonic()
+                self._state = 3
+            elif state == 4:
+                self._stop(4)
+            self._cond.notify_all()
+        return 0
+
+    def clean_error(self):
+        self._rpc('clean_error')
+        self._error = 0
+        return 0
+
+    def clean_warn(self):
+        self._rpc('clean_warn')
+        self._warn = 0
+        return 0
+
+    def emergency_stop(self):
+        self._rpc('emergency_stop')
+        with self._cond:
+            self._stop(4)
+        return 0
+
+    def get_state(self):
+        if not self._rpc('get_state'):
+            return NOT_CONNECTED, 4
+        return 0, self._state
+
+    def get_is_moving(self):
+        self._rpc('get_is_moving')
+        return self._state == 1
+
+    def get_err_warn_code(self, show=False, lang='en'):
+        self._rpc('get_err_warn_code')
+        return 0, [self._error, self._warn]
+
+    def get_position(self, is_radian=None):
+        self._rpc('get_position')
+        return 0, list(self._pose)
+
+    def get_servo_angle(self, servo_id=None, is_radian=None, is_real=False):
+        self._rpc('get_servo_angle')
+        return 0, list(self._angles) if servo_id is None else self._angles[servo_id - 1]
+
+    def get_inverse_kinematics(self, pose, input_is_radian=None, return_is_radian=None, **kwargs):
+        self._rpc('get_inverse_kinematics')
+        angles = list(self._target_angles)
+        angles[0] = math.degrees(math.atan2(pose[1], pose[0])) # Only the base angle is solved, within +-180 like the controller
+        self._ik_poses[tuple(angles)] = list(pose)
+        return 0, angles
+
+    def get_cgpio_digital(self, ionum=None):
+        self._rpc('get_cgpio_digital')
+        digitals = [self._inputs >> i & 1 for i in range(NUM_INPUTS)]
+        return 0, digitals if ionum is None else digitals[ionum]
+
+    def get_cgpio_state(self):
+        self._rpc('get_cgpio_state')
+        return 0, self._cgpio_values()
+
+    def set_cgpio_digital(self, ionum, value, delay_sec=None, sync=True):
+        self._rpc('set_cgpio_digital')
+        with self._cond:
+            self._outputs = self._outputs | 1 << ionum if value else self._outputs & ~(1 << ionum)
+        return 0
+
+    def set_position(self, x=None, y=None, z=None, roll=None, pitch=None, yaw=None, radius=None, speed=None, mvacc=None,
+                     mvtime=None, relative=False, is_radian=None, wait=False, timeout=None, **kwargs):
+        self._last_speed = self._last_speed if speed is None else speed
+        self._last_acc = self._last_acc if mvacc is None else mvacc
+        with self._cond:
+            pose = [t if v is None else (t + v if relative else v) for t, v in zip(self._target, (x, y, z, roll, pitch, yaw))]
+            distance = math.sqrt(sum((pose[i] - self._target[i]) ** 2 for i in range(3)))
+            angles = list(self._target_angles)
+            angles[0] += (math.degrees(math.atan2(pose[1], pose[0]) - math.atan2(self._target[1], self._target[0])) + 180) % 360 - 180 # Joint 1 follows the base angle the short way round
+            start = list(self._target)
+            path = lambda f: [a + (b - a) * f for a, b in zip(start[:3], pose[:3])] + pose[3:]
+            command = Command('move', trapezoid_time(distance, self._last_speed, self._last_acc), pose, angles, path)
+        return self._send('set_position', command, wait, timeout)
+
+    def move_circle(self, pose1, pose2, percent, speed=None, mvacc=None, mvtime=None, is_radian=None, wait=False, timeout=None, **kwargs):
+        self._last_speed = self._last_speed if speed is None else speed
+        self._last_acc = self._last_acc if mvacc is None else mvacc
+        with self._cond:
+            start = list(self._target)
+            length, end = circle_path(start, pose1, pose2, percent)
+            path = lambda f: circle_path(start, pose1, pose2, percent * f)[1] + start[3:]
+            command = Command('circle', trapezoid_time(length, self._last_speed, self._last_acc), end + start[3:], list(self._target_angles), path)
+        return self._send('move_circle', command, wait, timeout)
+
+    def set_servo_angle(self, servo_id=None, angle=None, speed=None, mvacc=None, mvtime=None, relative=False, is_radian=None,
+                        wait=False, timeout=None, radius=None, **kwargs):
+        assert ((servo_id is None or servo_id == 8) and isinstance(angle, (list, tuple))) \
+            or (1 <= servo_id <= 7 and angle is not None and not isinstance(angle, (list, tuple))), \
+            'param servo_id or angle error' # Same check as the SDK, a bare angle list in servo_id fails there too
+        self._last_angle_speed = self._last_angle_speed if speed is None else speed
+        self._last_angle_acc = self._last_angle_acc if mvacc is None else mvacc
+        with self._cond:
+            angles = list(self._target_angles)
+            if servo_id is None or servo_id == 8:
+                for i, value in enumerate(angle):
+                    angles[i] = angles[i] + value if relative else value
+            else:
+                angles[servo_id - 1] = angles[servo_id - 1] + angle if relative else angle
+            delta = max(abs(a - b) for a, b in zip(angles, self._target_angles))
+            pose = list(next((p for solved, p in self._ik_poses.items() if _same_angles(solved, angles)), self._target)) # Only poses we solved for are known
+            start = list(self._target)
+            path = lambda f: [a + (b - a) * f for a, b in zip(start, pose)]
+            command = Command('joint', trapezoid_time(delta, self._last_angle_speed, self._last_angle_acc), pose, angles, path)
+        return self._send('set_servo_angle', command, wait, timeout)
+
+    def set_servo_cartesian(self, mvpose, speed=None, mvacc=None, mvtime=0, is_radian=None, is_tool_coord=False, **kwargs):
+        # Servo mode: no queue, the arm is at the setpoint as soon as the round trip is done
+        if not self._rpc('set_servo_cartesian'):
+            return NOT_CONNECTED
+        with self._cond:
+            if self._mode != 1 or self._state == 4 or self._error:
+                return NOT_READY
+            angles = list(self._angles)
+            angles[0] += (math.degrees(math.atan2(mvpose[1], mvpose[0]) - math.atan2(self._pose[1], self._pose[0])) + 180) % 360 - 180
+            self._pose, self._angles = list(mvpose), angles
+            self._target, self._target_angles = list(mvpose), list(angles)
+            self.servo_points += 1
+        return 0
+
+    def set_pause_time(self, sltime, wait=False):
+        return self._send('set_pause_time', Command('pause', sltime, None, None), wait, None)
+
+    def _send(self, name, command, wait, timeout):
+        if not self._rpc(name):
+            return NOT_CONNECTED
+        with self._cond:
+            if self._state == 4 or self._error:
+                return NOT_READY
+            self._queue.append(command)
+            if command.pose is not None:
+                self._target, self._target_angles = list(command.pose), list(command.angles)
+            if self._state == 2:
+                self._state = 1
+            self._cond.notify_all()
+        return self.wait_move(timeout) if wait else 0
+
+    def wait_move(self, timeout=None): # Same polling as the SDK: get_state() every 50ms until it reads idle a few times
+        expired = None if timeout is None else self.clock.monotonic() + timeout
+        code, state = self.get_state()
+        idle, needed = 0, 2 if code == 0 and state == 1 else 10
+        while expired is None or self.clock.monotonic() < expired:
+            if not self._connected:
+                return NOT_CONNECTED
+            code, state = self.get_state()
+            if code != 0:
+                return code
+            if state >= 4:
+                return EMERGENCY_STOP
+            if state in (0, 1, 3):
+                idle, needed = 0, 2
+            else:
+                idle += 1
+                if idle >= needed:
+                    return 0
+            self.clock.wait(self.settle)
+        return 0
+
+    # Callbacks, all run on the report thread like the SDK's
+
+    def register_report_callback(self, callback=None, report_cartesian=True, report_joints=True, **kwargs):
+        return self._register('report', callback)
+
+    def register_state_changed_callback(self, callback=None):
+        return self._register('state', callback)
+
+    def register_mode_changed_callback(self, callback=None):
+        return self._register('mode', callback)
+
+    def register_error_warn_changed_callback(self, callback=None):
+        return self._register('error_warn', callback)
+
+    def register_cmdnum_changed_callback(self, callback=None):
+        return self._register('cmdnum', callback)
+
+    def register_count_changed_callback(self, callback=None):
+        return self._register('count', callback)
+
+    def register_connect_changed_callback(self, callback=None):
+        return self._register('connect', callback)
+
+    def release_report_callback(self, callback=None):
+        return self._release('report', callback)
+
+    def release_state_changed_callback(self, callback=None):
+        return self._release('state', callback)
+
+    def release_mode_changed_callback(self, callback=None):
+        return self._release('mode', callback)
+
+    def release_error_warn_changed_callback(self, callback=None):
+        return self._release('error_warn', callback)
+
+    def release_cmdnum_changed_callback(self, callback=None):
+        return self._release('cmdnum', callback)
+
+    def release_count_changed_callback(self, callback=None):
+        return self._release('count', callback)
+
+    def release_connect_changed_callback(self, callback=None):
+        return self._release('connect', callback)
+
+    def _register(self, name, callback):
+        if callback is not None and callback not in self._callbacks[name]:
+            self._callbacks[name].append(callback)
+        return True
+
+    def _release(self, name, callback):
+        if callback is None:
+            self._callbacks[name].clear()
+        elif callback in self._callbacks[name]:
+            self._callbacks[name].remove(callback)
+        return True
+
+    def _fire(self, name, data):
+        for callback in list(self._callbacks[name]):
+            try:
+                callback(data)
+            except Exception as e:
+                print('SimArm {} callback failed: {}'.format(name, e))
+
+    # Simulation threads
+
+    def _stop(self, state): # Caller holds the lock
+        if self._end is not None and self._queue and self._queue[0].path is not None: # Stopped part way, along the path in proportion to the time run
+            command = self._queue[0]
+            fraction = 1 - (self._end - self.clock.monotonic()) / command.duration if command.duration else 1
+            self._pose = command.path(min(max(fraction, 0.0), 1.0))
+        self._queue.clear()
+        self._end = self._remaining = None
+        self._target, self._target_angles = list(self._pose), list(self._angles)
+        self._state = state
+        self._cond.notify_all()
+
+    def _cgpio_values(self): # Same layout as get_cgpio_state(): values[3] inputs, values[10] input functions
+        return [0, 0, self._inputs, self._inputs, self._outputs, self._outputs, 0, 0, 0, 0, [0] * NUM_INPUTS, [0] * NUM_INPUTS]
+
+    def _publish(self): # Caller holds the lock, or nobody else runs yet
+        self._reported = {
+            'state': self._state, 'mode': self._mode, 'error_code': self._error, 'warn_code': self._warn,
+            'cmdnum': len(self._queue), 'cartesian': list(self._pose), 'joints': list(self._angles),
+            'cgpio': self._cgpio_values(),
+        }
+
+    def _controller_thread(self):
+        with self._cond:
+            while self._connected:
+                now = self.clock.monotonic()
+                while self._timers and self._timers[0][0] <= now:
+                    self._timers.pop(0)[1]()
+                if self._end is not None and self._state == 1 and now >= self._end:
+                    self._finish(self._queue.popleft(), now)
+                    continue
+                if self._end is None and self._queue and self._state == 1:
+                    self._end = now + self._queue[0].duration
+                    continue
+                deadlines = [t for t in (self._end if self._state == 1 else None, self._timers[0][0] if self._timers else None) if t is not None]
+                self._cond.wait(self.clock.real(min(deadlines) - now) if deadlines else None)
+
+    def _finish(self, command, now): # Caller holds the lock
+        if command.pose is not None:
+            self._pose, self._angles = list(command.pose), list(command.angles)
+        self._end = None
+        self.completed[command.kind] += 1
+        self.history.append((now, command.kind, command.pose))
+        if not self._queue:
+            self._state = 2
+        total = sum(self.completed.values())
+        due = [c for c in self._counters if c[1] <= (total if c[0] == 'all' else self.completed[c[0]])]
+        for counter in due:
+            self._counters.remove(counter)
+            counter[2]()
+        self._cond.notify_all()
+
+    def _report_thread(self):
+        while self._connected:
+            self.clock.wait(self.report_interval)
+            with self._cond:
+                before = self._reported
+                self._publish()
+                after = self._reported
+            if after['state'] != before['state']:
+                self._fire('state', {'state': after['state']})
+            if after['mode'] != before['mode']:
+                self._fire('mode', {'mode': after['mode']})
+            if (after['error_code'], after['warn_code']) != (before['error_code'], before['warn_code']):
+                self._fire('error_warn', {'error_code': after['error_code'], 'warn_code': after['warn_code']})
+            if after['cmdnum'] != before['cmdnum']:
+                self._fire('cmdnum', {'cmdnum': after['cmdnum']})
+            self._fire('report', dict(after))
+
+
+XArmAPI = SimArm # Drop-in name for code that does `from xarm.wrapper import XArmAPI`